@@ -17,6 +17,11 @@ class EnvVars:
     cube_proto = "CUBE_PROTO"
     cube_host = "CUBE_HOST"
     cube_port = "CUBE_PORT"
+    log_level = "LOG_LEVEL"
+    http_workers = "HTTP_WORKERS"
+    http_loop = "HTTP_LOOP"
+    http_impl = "HTTP_IMPL"
+    http_compression_min_size = "HTTP_COMPRESSION_MIN_SIZE"
 
 
 class Defaults:
@@ -38,3 +43,8 @@ class Defaults:
     cube_proto = "http"
     cube_host = "localhost"
     cube_port = "4000"
+    log_level = "info"
+    http_workers = "1"
+    http_loop = "auto"
+    http_impl = "auto"
+    http_compression_min_size = "1024"
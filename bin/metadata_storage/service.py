@@ -1,6 +1,7 @@
-from asyncio import run, sleep
+from asyncio import sleep
 from dotenv import load_dotenv
 from sbilifeco.gateways.synmetrix import Synmetrix
+from sbilifeco.cp.common.http.workers import HttpWorkerSettings, serve_workers
 from sbilifeco.cp.metadata_storage.http_server import MetadataStorageHttpServer
 from envvars import EnvVars, Defaults
 from os import getenv
@@ -54,6 +55,18 @@ class MetadataStorageMicroservice:
 
         microservice = MetadataStorageHttpServer()
         microservice.set_metadata_storage(gateway).set_http_port(microservice_port)
+        microservice.set_log_level(
+            getenv(EnvVars.log_level, Defaults.log_level)
+        ).set_http_impl(
+            getenv(EnvVars.http_impl, Defaults.http_impl)
+        ).set_compression_min_size(
+            int(
+                getenv(
+                    EnvVars.http_compression_min_size,
+                    Defaults.http_compression_min_size,
+                )
+            )
+        )
 
         await microservice.start()
 
@@ -64,4 +77,11 @@ class MetadataStorageMicroservice:
 
 
 if __name__ == "__main__":
-    run(MetadataStorageMicroservice().run_forever())
+    load_dotenv()
+    serve_workers(
+        MetadataStorageMicroservice().run_forever,
+        HttpWorkerSettings(
+            worker_count=int(getenv(EnvVars.http_workers, Defaults.http_workers)),
+            loop=getenv(EnvVars.http_loop, Defaults.http_loop),
+        ),
+    )
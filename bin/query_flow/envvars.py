@@ -21,6 +21,7 @@ class EnvVars:
     general_prompts_file = "GENERAL_PROMPTS_FILE"
     db_prompts_file = "DB_PROMPTS_FILE"
     enable_tool_call = "ENABLE_TOOL_CALL"
+    tool_refresh_interval = "TOOL_REFRESH_INTERVAL"
     metadata_query = "METADATA_QUERY"
     master_table_query = "MASTER_TABLE_QUERY"
     single_table_query = "SINGLE_TABLE_QUERY"
@@ -28,6 +29,25 @@ class EnvVars:
     db_id = "DB_ID"
     kafka_url = "KAFKA_URL"
     log_dir = "LOG_DIR"
+    log_level = "LOG_LEVEL"
+    prompt_log_sample_rate = "PROMPT_LOG_SAMPLE_RATE"
+    prompt_dump_dir = "PROMPT_DUMP_DIR"
+    prompt_token_budget = "PROMPT_TOKEN_BUDGET"
+    history_max_turns = "HISTORY_MAX_TURNS"
+    history_max_tokens = "HISTORY_MAX_TOKENS"
+    batch_concurrency = "BATCH_CONCURRENCY"
+    tool_max_iterations = "TOOL_MAX_ITERATIONS"
+    tool_time_budget = "TOOL_TIME_BUDGET"
+    mcp_pool_size = "MCP_POOL_SIZE"
+    prefix_prompt_mode = "PREFIX_PROMPT_MODE"
+    http_pool_max_connections = "HTTP_POOL_MAX_CONNECTIONS"
+    http_pool_max_keepalive = "HTTP_POOL_MAX_KEEPALIVE"
+    http2_enabled = "HTTP2_ENABLED"
+    http_workers = "HTTP_WORKERS"
+    http_loop = "HTTP_LOOP"
+    http_impl = "HTTP_IMPL"
+    http_compression_min_size = "HTTP_COMPRESSION_MIN_SIZE"
+    http_request_encoding = "HTTP_REQUEST_ENCODING"
 
 
 class Defaults:
@@ -51,5 +71,24 @@ class Defaults:
     session_data_host = "localhost"
     session_data_port = "80"
     enable_tool_call = "false"
+    tool_refresh_interval = "300"
     kafka_url = "localhost:9092"
     log_dir = "/var/log/nl2sql/query-flow"
+    log_level = "INFO"
+    prompt_log_sample_rate = "0"
+    prompt_token_budget = "0"
+    history_max_turns = "10"
+    history_max_tokens = "2000"
+    batch_concurrency = "4"
+    tool_max_iterations = "5"
+    tool_time_budget = "120"
+    mcp_pool_size = "1"
+    prefix_prompt_mode = "false"
+    http_pool_max_connections = "100"
+    http_pool_max_keepalive = "20"
+    http2_enabled = "false"
+    http_workers = "1"
+    http_loop = "auto"
+    http_impl = "auto"
+    http_compression_min_size = "1024"
+    http_request_encoding = ""
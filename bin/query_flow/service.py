@@ -1,9 +1,15 @@
-from asyncio import run, sleep
+from asyncio import sleep
 from os import getenv
 from pathlib import Path
 
 from dotenv import load_dotenv
 from sbilifeco.boundaries.query_flow import QueryFlowAnswer
+from sbilifeco.cp.common.http.client import (
+    HttpClient,
+    HttpCompressionSettings,
+    HttpPoolSettings,
+)
+from sbilifeco.cp.common.http.workers import HttpWorkerSettings, serve_workers
 from sbilifeco.cp.common.mcp.client import MCPClient
 from sbilifeco.cp.llm.http_client import LLMHttpClient
 from sbilifeco.cp.metadata_storage.http_client import MetadataStorageHttpClient
@@ -16,7 +22,9 @@ from sbilifeco.cp.session_data_manager.http_client import SessionDataManagerHttp
 from sbilifeco.cp.vector_repo.http_client import VectorRepoHttpClient
 from sbilifeco.cp.vectoriser.http_client import VectoriserHttpClient
 from sbilifeco.models.base import Response
+from sbilifeco.user_flows.conversation_history import HistorySettings
 from sbilifeco.user_flows.query_flow import QueryFlow
+from sbilifeco.user_flows.tool_call_loop import ToolLoopSettings
 
 from envvars import Defaults, EnvVars
 
@@ -81,15 +89,80 @@ class QueryFlowMicroservice:
             EnvVars.enable_tool_call, Defaults.enable_tool_call
         )
         is_tool_call_enabled = is_tool_call_enabled.lower() in ("true", "1", "yes")
+        tool_refresh_interval = float(
+            getenv(EnvVars.tool_refresh_interval, Defaults.tool_refresh_interval)
+        )
 
         kafka_url = getenv(EnvVars.kafka_url, Defaults.kafka_url)
         log_dir = getenv(EnvVars.log_dir, Defaults.log_dir)
+        log_level = getenv(EnvVars.log_level, Defaults.log_level)
+        prompt_log_sample_rate = float(
+            getenv(EnvVars.prompt_log_sample_rate, Defaults.prompt_log_sample_rate)
+        )
+        prompt_dump_dir = getenv(EnvVars.prompt_dump_dir, "") or None
+        prompt_token_budget = int(
+            getenv(EnvVars.prompt_token_budget, Defaults.prompt_token_budget)
+        )
+        is_prefix_prompt_enabled = getenv(
+            EnvVars.prefix_prompt_mode, Defaults.prefix_prompt_mode
+        ).lower() in ("true", "1", "yes")
+        batch_concurrency = int(
+            getenv(EnvVars.batch_concurrency, Defaults.batch_concurrency)
+        )
+        tool_loop_settings = ToolLoopSettings(
+            max_iterations=int(
+                getenv(EnvVars.tool_max_iterations, Defaults.tool_max_iterations)
+            ),
+            time_budget_seconds=float(
+                getenv(EnvVars.tool_time_budget, Defaults.tool_time_budget)
+            ),
+        )
+        history_settings = HistorySettings(
+            max_turns=int(
+                getenv(EnvVars.history_max_turns, Defaults.history_max_turns)
+            ),
+            max_tokens=int(
+                getenv(EnvVars.history_max_tokens, Defaults.history_max_tokens)
+            ),
+        )
 
         flow_port = int(getenv(EnvVars.http_port, Defaults.http_port))
 
+        # Connection pool shared by the HTTP clients below
+        HttpClient.set_pool_settings(
+            HttpPoolSettings(
+                max_connections=int(
+                    getenv(
+                        EnvVars.http_pool_max_connections,
+                        Defaults.http_pool_max_connections,
+                    )
+                ),
+                max_keepalive_connections=int(
+                    getenv(
+                        EnvVars.http_pool_max_keepalive,
+                        Defaults.http_pool_max_keepalive,
+                    )
+                ),
+                is_http2_enabled=getenv(
+                    EnvVars.http2_enabled, Defaults.http2_enabled
+                ).lower()
+                in ("true", "1", "yes"),
+            )
+        )
+        HttpClient.set_compression_settings(
+            HttpCompressionSettings(
+                request_encoding=getenv(
+                    EnvVars.http_request_encoding, Defaults.http_request_encoding
+                )
+                or None
+            )
+        )
+
         # Set up connection to Tool Repository service, aka MCP
         self.tool_repo = MCPClient()
-        self.tool_repo.set_server_url(mcp_server_url)
+        self.tool_repo.set_server_url(mcp_server_url).set_pool_size(
+            int(getenv(EnvVars.mcp_pool_size, Defaults.mcp_pool_size))
+        )
         await self.tool_repo.async_init()
 
         # Set up connection to LLM service
@@ -170,6 +243,15 @@ class QueryFlowMicroservice:
         (
             self.flow.set_external_tool_repo(self.tool_repo)
             .set_is_tool_call_enabled(is_tool_call_enabled)
+            .set_tool_refresh_interval(tool_refresh_interval)
+            .set_log_level(log_level)
+            .set_prompt_log_sample_rate(prompt_log_sample_rate)
+            .set_prompt_dump_dir(prompt_dump_dir)
+            .set_prompt_token_budget(prompt_token_budget)
+            .set_history_settings(history_settings)
+            .set_batch_concurrency(batch_concurrency)
+            .set_is_prefix_prompt_enabled(is_prefix_prompt_enabled)
+            .set_tool_loop_settings(tool_loop_settings)
             .set_llm(self.llm)
             .set_vectoriser(self.vectoriser)
             .set_vector_repo(self.vector_repo)
@@ -186,13 +268,29 @@ class QueryFlowMicroservice:
         print(f"Listening as HTTP service on port {flow_port}", flush=True)
         self.http_service = QueryFlowHttpService()
         self.http_service.set_query_flow(self.flow).set_http_port(flow_port)
+        self.http_service.set_log_level(log_level).set_http_impl(
+            getenv(EnvVars.http_impl, Defaults.http_impl)
+        ).set_compression_min_size(
+            int(
+                getenv(
+                    EnvVars.http_compression_min_size,
+                    Defaults.http_compression_min_size,
+                )
+            )
+        )
         await self.http_service.listen()
 
     async def run_forever(self) -> None:
-        await self.run()
+        try:
+            await self.run()
 
-        while True:
-            await sleep(10000)
+            while True:
+                await sleep(10000)
+        finally:
+            # Queued listener calls and log records go out before the pools close
+            await self.flow.async_shutdown()
+            await self.tool_repo.async_shutdown()
+            await HttpClient.close_pools()
 
     def set_db_specific_prompts(self) -> None:
         db_prompt_template = getenv(EnvVars.db_prompts_file, "")
@@ -238,4 +336,10 @@ class QueryFlowMicroservice:
 
 if __name__ == "__main__":
     load_dotenv()
-    run(QueryFlowMicroservice().run_forever())
+    serve_workers(
+        QueryFlowMicroservice().run_forever,
+        HttpWorkerSettings(
+            worker_count=int(getenv(EnvVars.http_workers, Defaults.http_workers)),
+            loop=getenv(EnvVars.http_loop, Defaults.http_loop),
+        ),
+    )
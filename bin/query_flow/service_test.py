@@ -5,16 +5,23 @@ sys.path.append("./src")
 
 from os import getenv
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 from pprint import pprint
 from dotenv import load_dotenv
 from envvars import EnvVars, Defaults
 from sbilifeco.models.base import Response
 
 # Import the necessary service(s) here
-from asyncio import gather
+from asyncio import CancelledError, create_task, gather, sleep
+from contextlib import suppress
 from service import QueryFlowMicroservice
-from sbilifeco.boundaries.query_flow import QueryFlowAnswer, QueryFlowRequest
+from sbilifeco.boundaries.query_flow import (
+    IQueryFlowListener,
+    QueryFlowAnswer,
+    QueryFlowRequest,
+)
+from sbilifeco.cp.common.mcp.client import MCPClient
+from sbilifeco.user_flows.query_flow import QueryFlow
 from sbilifeco.cp.query_flow.http_client import QueryFlowHttpClient
 from uuid import uuid4
 from pathlib import Path
@@ -234,3 +241,34 @@ class Test(IsolatedAsyncioTestCase):
 
         async for chunk in stream:
             self.assertTrue(chunk)
+
+
+class ShutdownTest(IsolatedAsyncioTestCase):
+    async def test_flow_is_drained_on_stop(self) -> None:
+        # Arrange
+        async def on_answer(answer: QueryFlowAnswer) -> None:
+            await sleep(0.05)
+
+        listener = AsyncMock(spec=IQueryFlowListener)
+        listener.on_answer.side_effect = on_answer
+        service = QueryFlowMicroservice()
+        service.flow = QueryFlow().add_listener(listener)
+        service.tool_repo = AsyncMock(spec=MCPClient)
+        await service.flow.async_init()
+
+        answer = QueryFlowAnswer(session_id="s", db_id="d", question="q", answer="a")
+        await service.flow._listener_dispatcher.dispatch_answer(answer)
+
+        # Act
+        with patch.object(service, "run", AsyncMock()):
+            task = create_task(service.run_forever())
+            await sleep(0.01)
+            task.cancel()
+            with suppress(CancelledError):
+                await task
+
+        # Assert
+        # The listener call queued before the stop is still delivered
+        listener.on_answer.assert_awaited_once_with(answer)
+        self.assertEqual(service.flow.listener_dispatch_stats["delivered"], 1)
+        service.tool_repo.async_shutdown.assert_awaited_once()
@@ -1,12 +1,84 @@
 from __future__ import annotations
-from asyncio import get_event_loop
+from asyncio import AbstractEventLoop, get_running_loop
+from functools import cache
+from gzip import compress as gzip_compress
 from typing import Any
-from requests import Request, Session
+from httpx import AsyncClient, Limits, Response as HttpResponse, Timeout
+from prometheus_client import Counter
+from pydantic import BaseModel, TypeAdapter
+from requests import Request
 from sbilifeco.models.base import Response
 
+try:
+    import zstandard
+except ImportError:  # Optional, installed with the zstd extra
+    zstandard = None
+
+ORIGINAL_BYTES = Counter(
+    "http_client_compression_original_bytes",
+    "Size of the bodies that were compressed or decompressed, before compression",
+    ["direction", "encoding"],
+)
+SAVED_BYTES = Counter(
+    "http_client_compression_saved_bytes",
+    "Bytes that compression kept off the network",
+    ["direction", "encoding"],
+)
+
+
+class HttpPoolSettings(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20  # Idle connections kept open per pool
+    keepalive_expiry_seconds: float = 30.0
+    connect_timeout_seconds: float = 10.0
+    read_timeout_seconds: float | None = None  # LLM replies can take minutes
+    is_http2_enabled: bool = False  # Needs the h2 package
+
+
+class HttpCompressionSettings(BaseModel):
+    request_encoding: str | None = None  # "gzip" or "zstd", if the server takes it
+    min_size_bytes: int = 1024
+
+
+@cache
+def response_decoder(payload_type: Any = Any) -> TypeAdapter[Response[Any]]:
+    """Decoder of `Response[payload_type]` bodies, built once per payload type.
+
+    It parses the raw bytes straight into the payload model, nested models and all,
+    without an intermediate dict.
+    """
+    return TypeAdapter(Response[payload_type])
+
 
 class HttpClient:
+    """Base of the HTTP clients to other microservices.
+
+    Requests go through one connection pool shared by every subclass, so calls to
+    the same host reuse kept-alive connections. httpx clients are bound to the
+    event loop they were first used in, hence one pool per running loop.
+    """
+
     IMPLICIT_PORT = 80
+    pool_settings = HttpPoolSettings()
+    compression_settings = HttpCompressionSettings()
+    _pools: dict[AbstractEventLoop, AsyncClient] = {}
+
+    @staticmethod
+    def set_pool_settings(settings: HttpPoolSettings) -> None:
+        """Applies to pools created from now on, i.e. set it before the first request."""
+        HttpClient.pool_settings = settings
+
+    @staticmethod
+    def set_compression_settings(settings: HttpCompressionSettings) -> None:
+        """Responses are decompressed regardless; these settings are for request bodies."""
+        HttpClient.compression_settings = settings
+
+    @staticmethod
+    async def close_pools() -> None:
+        pools, HttpClient._pools = HttpClient._pools, {}
+        for loop, pool in pools.items():
+            if not loop.is_closed():
+                await pool.aclose()
 
     def set_proto(self, proto: str) -> HttpClient:
         """Set the protocol for the HTTP client."""
@@ -29,34 +101,112 @@ class HttpClient:
         port_section = f":{self.port}" if self.port != self.IMPLICIT_PORT else ""
         return f"{self.proto}://{self.host}{port_section}"
 
-    async def request_as_model(self, req: Request) -> Response[Any]:
-        with Session() as session:
-            prep_req = session.prepare_request(req)
-            http_response = await get_event_loop().run_in_executor(
-                None, session.send, prep_req
+    @property
+    def http_pool(self) -> AsyncClient:
+        """The connection pool of the running event loop, created on first use."""
+        loop = get_running_loop()
+        pool = HttpClient._pools.get(loop)
+        if pool is None or pool.is_closed:
+            # Pools of loops that have since closed cannot be reused
+            for stale_loop in [
+                other for other in HttpClient._pools if other.is_closed()
+            ]:
+                del HttpClient._pools[stale_loop]
+
+            settings = HttpClient.pool_settings
+            pool = AsyncClient(
+                limits=Limits(
+                    max_connections=settings.max_connections,
+                    max_keepalive_connections=settings.max_keepalive_connections,
+                    keepalive_expiry=settings.keepalive_expiry_seconds,
+                ),
+                timeout=Timeout(
+                    settings.read_timeout_seconds,
+                    connect=settings.connect_timeout_seconds,
+                ),
+                http2=settings.is_http2_enabled,
+                follow_redirects=True,
+            )
+            HttpClient._pools[loop] = pool
+        return pool
+
+    async def send(self, req: Request, stream: bool = False) -> HttpResponse:
+        """Send a `requests` request through the shared pool.
+
+        With `stream`, the body is left unread; the caller must close the response.
+        """
+        prep_req = req.prepare()
+        headers = dict(prep_req.headers)
+        body = prep_req.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        encoding = HttpClient.compression_settings.request_encoding
+        if (
+            encoding
+            and body
+            and len(body) >= HttpClient.compression_settings.min_size_bytes
+            and "Content-Encoding" not in prep_req.headers
+        ):
+            compressed = self._compress(body, encoding)
+            ORIGINAL_BYTES.labels(direction="request", encoding=encoding).inc(len(body))
+            SAVED_BYTES.labels(direction="request", encoding=encoding).inc(
+                len(body) - len(compressed)
+            )
+            body = compressed
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+
+        http_request = self.http_pool.build_request(
+            prep_req.method or "GET",
+            prep_req.url or "",
+            headers=headers,
+            content=body,
+        )
+        http_response = await self.http_pool.send(http_request, stream=stream)
+
+        # Accept-Encoding is negotiated by httpx, which also decompresses the body
+        response_encoding = http_response.headers.get("Content-Encoding")
+        if response_encoding and not stream:
+            ORIGINAL_BYTES.labels(direction="response", encoding=response_encoding).inc(
+                len(http_response.content)
+            )
+            SAVED_BYTES.labels(direction="response", encoding=response_encoding).inc(
+                len(http_response.content) - http_response.num_bytes_downloaded
+            )
+        return http_response
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "zstd":
+            assert zstandard is not None, "zstandard must be installed to send zstd"
+            return zstandard.ZstdCompressor(level=3).compress(body)
+        if encoding == "gzip":
+            return gzip_compress(body, compresslevel=5)
+        raise ValueError(f"Unsupported request encoding: {encoding}")
+
+    async def request_as_model(
+        self, req: Request, payload_type: Any = Any
+    ) -> Response[Any]:
+        """Send a request and decode the `Response` it returns, with its payload as `payload_type`."""
+        http_response = await self.send(req)
+        if http_response.is_error:
+            return Response.fail(
+                message=http_response.content.decode("utf-8"),
+                code=http_response.status_code,
             )
-            if not http_response.ok:
-                return Response.fail(
-                    message=http_response.content.decode("utf-8"),
-                    code=http_response.status_code,
-                )
 
-            try:
-                return Response.model_validate(http_response.json())
-            except Exception as e:
-                return Response.error(e)
+        try:
+            return response_decoder(payload_type).validate_json(http_response.content)
+        except Exception as e:
+            return Response.error(e)
 
     async def request_as_binary(self, req: Request) -> Response[bytes]:
         """Send a request and return the response as binary data."""
-        with Session() as session:
-            prep_req = session.prepare_request(req)
-            http_response = await get_event_loop().run_in_executor(
-                None, session.send, prep_req
+        http_response = await self.send(req)
+        if http_response.is_error:
+            return Response.fail(
+                message=http_response.content.decode("utf-8"),
+                code=http_response.status_code,
             )
-            if not http_response.ok:
-                return Response.fail(
-                    message=http_response.content.decode("utf-8"),
-                    code=http_response.status_code,
-                )
 
-            return Response.ok(http_response.content)
+        return Response.ok(http_response.content)
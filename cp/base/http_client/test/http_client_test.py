@@ -1,8 +1,23 @@
+from gzip import compress, decompress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
 from unittest import IsolatedAsyncioTestCase
-from sbilifeco.cp.common.http.client import HttpClient
+from prometheus_client import REGISTRY
+from pydantic import BaseModel
+from sbilifeco.cp.common.http.client import (
+    HttpClient,
+    HttpCompressionSettings,
+    response_decoder,
+)
+from sbilifeco.models.base import Response
 from requests import Request
 
 
+class Pet(BaseModel):
+    name: str
+    toys: list[str] = []
+
+
 class HttpClientTest(IsolatedAsyncioTestCase):
     async def test_http_client(self):
         client = HttpClient().set_proto("http").set_host("tech101.in").set_port(80)
@@ -17,3 +32,137 @@ class HttpClientTest(IsolatedAsyncioTestCase):
         assert response.payload is not None
         html = response.payload.decode("utf-8")
         self.assertIn("WordPress", html, "Response is not genuine")
+
+    async def test_connections_are_pooled(self):
+        # Arrange
+        client_ports: list[int] = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                client_ports.append(self.client_address[1])
+                body = Response.ok("pong").model_dump_json().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): ...
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+
+        clients = [
+            HttpClient()
+            .set_proto("http")
+            .set_host("127.0.0.1")
+            .set_port(server.server_address[1])
+            for _ in range(2)
+        ]
+
+        # Act
+        responses = [
+            await client.request_as_model(Request(method="GET", url=client.url_base))
+            for client in clients * 2
+        ]
+
+        # Assert
+        # Every client sends over the same kept-alive connection
+        self.assertTrue(all(response.payload == "pong" for response in responses))
+        self.assertIs(clients[0].http_pool, clients[1].http_pool)
+        self.assertEqual(len(set(client_ports)), 1)
+
+        # Act
+        await HttpClient.close_pools()
+
+        # Assert
+        self.assertEqual(HttpClient._pools, {})
+
+    async def test_compression(self):
+        # Arrange
+        received: list[tuple[str | None, bytes]] = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                content = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append((self.headers["Content-Encoding"], content))
+                body = compress(
+                    Response.ok(decompress(content).decode("utf-8"))
+                    .model_dump_json()
+                    .encode("utf-8")
+                )
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): ...
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+
+        HttpClient.set_compression_settings(
+            HttpCompressionSettings(request_encoding="gzip", min_size_bytes=100)
+        )
+        self.addCleanup(HttpClient.set_compression_settings, HttpCompressionSettings())
+        self.addAsyncCleanup(HttpClient.close_pools)
+
+        client = (
+            HttpClient()
+            .set_proto("http")
+            .set_host("127.0.0.1")
+            .set_port(server.server_address[1])
+        )
+        text = "All work and no play makes Jack a dull boy. " * 100
+        saved_before = (
+            REGISTRY.get_sample_value(
+                "http_client_compression_saved_bytes_total",
+                {"direction": "request", "encoding": "gzip"},
+            )
+            or 0.0
+        )
+
+        # Act
+        response = await client.request_as_model(
+            Request(method="POST", url=client.url_base, data=text)
+        )
+
+        # Assert
+        # The request went out compressed and the compressed reply was decoded
+        self.assertEqual(response.payload, text)
+        self.assertEqual(received[0][0], "gzip")
+        self.assertLess(len(received[0][1]), len(text) / 2)
+        saved_after = REGISTRY.get_sample_value(
+            "http_client_compression_saved_bytes_total",
+            {"direction": "request", "encoding": "gzip"},
+        )
+        self.assertGreater(saved_after, saved_before + len(text) / 2)
+        self.assertGreater(
+            REGISTRY.get_sample_value(
+                "http_client_compression_saved_bytes_total",
+                {"direction": "response", "encoding": "gzip"},
+            ),
+            0.0,
+        )
+
+    def test_response_decoder(self):
+        # Arrange
+        body = b'{"payload": [{"name": "Rex", "toys": ["ball"]}, {"name": "Tom"}]}'
+
+        # Act
+        response = response_decoder(list[Pet]).validate_json(body)
+
+        # Assert
+        # Payload models come out of the one parse, and decoders are built once
+        self.assertEqual(
+            response.payload, [Pet(name="Rex", toys=["ball"]), Pet(name="Tom")]
+        )
+        self.assertIs(response_decoder(list[Pet]), response_decoder(list[Pet]))
@@ -0,0 +1,205 @@
+from __future__ import annotations
+from gzip import compress as gzip_compress
+from zlib import MAX_WBITS, decompressobj
+from prometheus_client import Counter
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # Optional, installed with the zstd extra
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+ORIGINAL_BYTES = Counter(
+    "http_server_compression_original_bytes",
+    "Size of the bodies that were compressed or decompressed, before compression",
+    ["direction", "encoding"],
+)
+SAVED_BYTES = Counter(
+    "http_server_compression_saved_bytes",
+    "Bytes that compression kept off the network",
+    ["direction", "encoding"],
+)
+
+
+def supported_encodings() -> list[str]:
+    """In order of preference."""
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip_compress(body, compresslevel=5)
+
+
+class BodyTooLargeError(ValueError): ...
+
+
+def decompress(body: bytes, encoding: str, max_size: int) -> bytes:
+    """Raises `BodyTooLargeError` as soon as the output would exceed `max_size` bytes."""
+    chunks: list[bytes] = []
+    size = 0
+    if encoding == ZSTD and zstandard is not None:
+        with zstandard.ZstdDecompressor().stream_reader(
+            body, read_across_frames=True
+        ) as reader:
+            while chunk := reader.read(min(65536, max_size + 1 - size)):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > max_size:
+                    raise BodyTooLargeError(f"Body is over {max_size} bytes")
+        return b"".join(chunks)
+
+    # A gzip body may hold several members, each decompressed within what is left
+    remaining = body
+    while remaining:
+        decompressor = decompressobj(16 + MAX_WBITS)
+        chunks.append(decompressor.decompress(remaining, max_size + 1 - size))
+        size += len(chunks[-1])
+        if size > max_size or decompressor.unconsumed_tail:
+            raise BodyTooLargeError(f"Body is over {max_size} bytes")
+        if not decompressor.eof:
+            raise ValueError("Gzip body is truncated")
+        remaining = decompressor.unused_data.lstrip(b"\0")  # Trailing padding
+    return b"".join(chunks)
+
+
+class CompressionMiddleware:
+    """Compresses response bodies in the best encoding the client accepts, and decompresses request bodies.
+
+    Only responses sent in one piece and at least `min_size` long are compressed;
+    streamed ones go out as they are, so their chunks are not held back. With no
+    `min_size`, only request bodies are handled.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        min_size: int | None = 1024,
+        max_request_size: int = 10 * 1024 * 1024,
+    ) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.max_request_size = max_request_size  # After decompression
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        content_encoding = request_headers.get("content-encoding", "").strip().lower()
+        if content_encoding in supported_encodings():
+            try:
+                scope, receive = await self._decompress_request(
+                    scope, receive, content_encoding
+                )
+            except BodyTooLargeError as e:
+                response = PlainTextResponse(
+                    f"Decompressed {content_encoding} body is too large: {e}", 413
+                )
+                await response(scope, receive, send)
+                return
+            except Exception as e:
+                response = PlainTextResponse(
+                    f"Could not decompress the {content_encoding} body: {e}", 400
+                )
+                await response(scope, receive, send)
+                return
+
+        encoding = self._negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None or self.min_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start = {**start_message, "headers": list(start_message["headers"])}
+            start_message = None
+            body = message.get("body", b"")
+            response_headers = MutableHeaders(raw=start["headers"])
+            if (
+                message.get("more_body", False)
+                or len(body) < self.min_size
+                or "content-encoding" in response_headers
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            ORIGINAL_BYTES.labels(direction="response", encoding=encoding).inc(
+                len(body)
+            )
+            SAVED_BYTES.labels(direction="response", encoding=encoding).inc(
+                len(body) - len(compressed)
+            )
+            response_headers["content-encoding"] = encoding
+            response_headers["content-length"] = str(len(compressed))
+            response_headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _negotiate(self, accept_encoding: str) -> str | None:
+        accepted = set()
+        for item in accept_encoding.lower().split(","):
+            name, _, params = item.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(name.strip())
+        for encoding in supported_encodings():
+            if encoding in accepted:
+                return encoding
+        return None
+
+    async def _decompress_request(
+        self, scope: Scope, receive: Receive, encoding: str
+    ) -> tuple[Scope, Receive]:
+        chunks: list[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > self.max_request_size:
+                raise BodyTooLargeError(f"Body is over {self.max_request_size} bytes")
+            if not message.get("more_body", False):
+                break
+        compressed = b"".join(chunks)
+        body = decompress(compressed, encoding, self.max_request_size)
+        ORIGINAL_BYTES.labels(direction="request", encoding=encoding).inc(len(body))
+        SAVED_BYTES.labels(direction="request", encoding=encoding).inc(
+            len(body) - len(compressed)
+        )
+
+        # The app sees the plain body, as if it had been sent that way
+        headers = MutableHeaders(scope={**scope, "headers": list(scope["headers"])})
+        del headers["content-encoding"]
+        headers["content-length"] = str(len(body))
+        is_body_sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal is_body_sent
+            if not is_body_sent:
+                is_body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return {**scope, "headers": headers.raw}, receive_decompressed
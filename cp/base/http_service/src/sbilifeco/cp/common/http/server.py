@@ -1,8 +1,38 @@
 from __future__ import annotations
-from fastapi import FastAPI
+from os import environ
+from socket import (
+    AF_INET,
+    AF_INET6,
+    SO_REUSEADDR,
+    SO_REUSEPORT,
+    SOCK_STREAM,
+    SOL_SOCKET,
+    socket,
+)
+from typing import Any
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import CollectorRegistry
 from uvicorn import Config, Server
+from sbilifeco.cp.common.http import workers
+from sbilifeco.cp.common.http.compression import CompressionMiddleware
+
+try:
+    import orjson
+except ImportError:  # Optional, installed with the orjson extra
+    orjson = None
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialised with orjson, several times faster than the standard encoder on large payloads."""
+
+    def render(self, content: Any) -> bytes:
+        assert orjson is not None, "orjson must be installed to use ORJSONResponse"
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
 
 class HttpServer(FastAPI):
@@ -17,6 +47,13 @@ class HttpServer(FastAPI):
         self.allowed_headers: list[str] = ["*"]
         self.allowed_hosts: list[str] = ["*"]
         self.allowed_forwarded_hosts: list[str] = ["*"]
+        self.metrics_path: str | None = "/metrics"
+        self.metrics_registry: CollectorRegistry = REGISTRY
+        self.is_orjson_enabled: bool = False
+        self.http_impl: str = "auto"
+        self.is_port_shared: bool = False
+        self.compression_min_size: int | None = None
+        self.max_decompressed_size: int = 10 * 1024 * 1024
 
     def set_log_level(self, log_level: str) -> HttpServer:
         self.log_level = log_level
@@ -56,6 +93,51 @@ class HttpServer(FastAPI):
         self.allowed_forwarded_hosts = allowed_forwarded_hosts
         return self
 
+    def set_metrics_path(self, metrics_path: str | None) -> HttpServer:
+        self.metrics_path = metrics_path
+        return self
+
+    def set_metrics_registry(self, metrics_registry: CollectorRegistry) -> HttpServer:
+        self.metrics_registry = metrics_registry
+        return self
+
+    def set_http_impl(self, http_impl: str) -> HttpServer:
+        """ "h11", "httptools", or "auto" for httptools when installed."""
+        self.http_impl = http_impl
+        return self
+
+    def set_is_port_shared(self, is_port_shared: bool) -> HttpServer:
+        """Bind with SO_REUSEPORT, so other processes can listen on the same port.
+
+        Always the case inside the workers started by `serve_workers`.
+        """
+        self.is_port_shared = is_port_shared
+        return self
+
+    def set_is_orjson_enabled(self, is_orjson_enabled: bool) -> HttpServer:
+        """Serialise route results with orjson, if it is installed.
+
+        Only worth it on FastAPI releases that still encode through `json.dumps`;
+        later ones dump return-typed results to bytes with Pydantic, which a custom
+        response class turns off.
+        """
+        self.is_orjson_enabled = is_orjson_enabled and orjson is not None
+        return self
+
+    def set_compression_min_size(self, compression_min_size: int | None) -> HttpServer:
+        """Compress responses of at least this many bytes, gzip or zstd as the client accepts.
+
+        Compressed request bodies are accepted either way. None or 0 turns response
+        compression off.
+        """
+        self.compression_min_size = compression_min_size or None
+        return self
+
+    def set_max_decompressed_size(self, max_decompressed_size: int) -> HttpServer:
+        """Compressed request bodies that decompress to more bytes than this get a 413."""
+        self.max_decompressed_size = max_decompressed_size
+        return self
+
     async def listen(self) -> None:
         self.add_middleware(
             CORSMiddleware,
@@ -68,23 +150,62 @@ class HttpServer(FastAPI):
             TrustedHostMiddleware,
             allowed_hosts=self.allowed_hosts,
         )
+        self.add_middleware(
+            CompressionMiddleware,
+            min_size=self.compression_min_size,
+            max_request_size=self.max_decompressed_size,
+        )
 
+        if self.metrics_path:
+            self.add_api_route(
+                self.metrics_path,
+                self.get_metrics,
+                methods=["GET"],
+                include_in_schema=False,
+            )
+
+        # Routes pick up the default response class when they are added
+        if self.is_orjson_enabled:
+            self.router.default_response_class = ORJSONResponse
         self.build_routes()
 
         config = Config(
             app=self,
             host=self.bound_host,
             port=self.http_port,
-            log_level="info",
+            log_level=self.log_level.lower(),
+            http=self.http_impl,
             forwarded_allow_ips=self.allowed_forwarded_hosts,
         )
         config.load()
 
         self.server = Server(config=config)
         self.server.lifespan = config.lifespan_class(config)
-        await self.server.startup()
+        if self.is_port_shared or workers.worker_index is not None:
+            await self.server.startup(sockets=[self._bind_shared_socket()])
+        else:
+            await self.server.startup()
+        workers.listening_servers.add(self)
+
+    async def get_metrics(self) -> Response:
+        registry = self.metrics_registry
+        if registry is REGISTRY and "PROMETHEUS_MULTIPROC_DIR" in environ:
+            # Each worker only counts its own requests, the files hold everyone's
+            registry = CollectorRegistry()
+            MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
 
     async def stop(self) -> None:
+        workers.listening_servers.discard(self)
         await self.server.shutdown()
 
+    def _bind_shared_socket(self) -> socket:
+        shared_socket = socket(
+            AF_INET6 if ":" in self.bound_host else AF_INET, SOCK_STREAM
+        )
+        shared_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        shared_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        shared_socket.bind((self.bound_host, self.http_port))
+        return shared_socket
+
     def build_routes(self) -> None: ...
@@ -0,0 +1,201 @@
+from __future__ import annotations
+from asyncio import (
+    FIRST_COMPLETED,
+    AbstractEventLoop,
+    CancelledError,
+    Event,
+    Runner,
+    create_task,
+    get_running_loop,
+    wait,
+    wait_for,
+)
+from collections.abc import Callable, Coroutine
+from contextlib import suppress
+from glob import glob
+from multiprocessing import Process
+from os import environ, makedirs, remove
+from signal import SIGHUP, SIGINT, SIGTERM, SIG_IGN, signal
+from tempfile import mkdtemp
+from time import sleep
+from typing import Any, Protocol
+from weakref import WeakSet
+from prometheus_client import multiprocess, values
+from pydantic import BaseModel
+
+WorkerMain = Callable[[], Coroutine[Any, Any, object]]
+
+
+class StoppableServer(Protocol):
+    async def stop(self) -> None: ...
+
+
+# Index of this process among the workers, None when the service runs on its own
+worker_index: int | None = None
+
+# Servers listening in this process, stopped first on shutdown
+listening_servers: WeakSet[StoppableServer] = WeakSet()
+
+
+class HttpWorkerSettings(BaseModel):
+    worker_count: int = 1
+    loop: str = "auto"  # "asyncio", "uvloop", or "auto" for uvloop when installed
+    shutdown_timeout_seconds: float = 30.0
+    startup_grace_seconds: float = 5.0  # Before a replaced worker is stopped
+    monitor_interval_seconds: float = 1.0
+
+
+def serve_workers(main: WorkerMain, settings: HttpWorkerSettings) -> None:
+    """Runs a service's main coroutine in `worker_count` processes that share its HTTP port.
+
+    Each worker builds the whole service, so `main` must be picklable where processes
+    are spawned rather than forked, e.g. a bound method of a fresh service object.
+    SIGTERM or SIGINT stops the workers one at a time; SIGHUP restarts them one at a
+    time, each replacement listening before its predecessor stops.
+
+    With more than one worker, Prometheus metrics are kept in PROMETHEUS_MULTIPROC_DIR
+    (a temporary directory unless set), so any worker's /metrics reports all of them.
+    """
+    if settings.worker_count <= 1:
+        _run_worker(main, settings, None)
+        return
+    _enable_multiprocess_metrics()
+    HttpWorkerSupervisor(main, settings).run()
+
+
+def _enable_multiprocess_metrics() -> None:
+    metrics_dir = environ.get("PROMETHEUS_MULTIPROC_DIR") or mkdtemp(
+        prefix="prometheus-"
+    )
+    makedirs(metrics_dir, exist_ok=True)
+    # Counts left over from an earlier run would be added to this one's
+    for path in glob(f"{metrics_dir}/*.db"):
+        remove(path)
+    environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    # Metrics are labelled, so their values are created in the workers, after this
+    values.ValueClass = values.get_value_class()
+
+
+class HttpWorkerSupervisor:
+    def __init__(self, main: WorkerMain, settings: HttpWorkerSettings) -> None:
+        self._main = main
+        self._settings = settings
+        self._workers: list[Process] = []
+        self._is_stopping = False
+        self._is_restart_requested = False
+
+    def run(self) -> None:
+        signal(SIGTERM, self._on_stop)
+        signal(SIGINT, self._on_stop)
+        signal(SIGHUP, self._on_restart)
+
+        self._workers = [
+            self._start(index) for index in range(self._settings.worker_count)
+        ]
+        print(f"Started {len(self._workers)} HTTP workers", flush=True)
+
+        while not self._is_stopping:
+            sleep(self._settings.monitor_interval_seconds)
+            if self._is_restart_requested:
+                self._is_restart_requested = False
+                self._roll(restart=True)
+                continue
+
+            for index, worker in enumerate(self._workers):
+                if not worker.is_alive() and not self._is_stopping:
+                    print(
+                        f"HTTP worker {index} exited with code {worker.exitcode}, restarting",
+                        flush=True,
+                    )
+                    self._forget_metrics(worker)
+                    self._workers[index] = self._start(index)
+
+        self._roll(restart=False)
+        print("All HTTP workers have stopped", flush=True)
+
+    def _on_stop(self, *_: Any) -> None:
+        self._is_stopping = True
+
+    def _on_restart(self, *_: Any) -> None:
+        self._is_restart_requested = True
+
+    def _start(self, index: int) -> Process:
+        worker = Process(
+            target=_run_worker,
+            args=(self._main, self._settings, index),
+            name=f"http-worker-{index}",
+        )
+        worker.start()
+        return worker
+
+    def _roll(self, restart: bool) -> None:
+        # One worker at a time, so the others keep serving in the meantime
+        for index, worker in enumerate(self._workers):
+            if restart:
+                self._workers[index] = self._start(index)
+                sleep(self._settings.startup_grace_seconds)
+            if worker.is_alive():
+                worker.terminate()
+            worker.join(self._settings.shutdown_timeout_seconds + 5.0)
+            if worker.is_alive():
+                print(f"HTTP worker {index} did not stop in time, killing", flush=True)
+                worker.kill()
+                worker.join()
+            self._forget_metrics(worker)
+
+    def _forget_metrics(self, worker: Process) -> None:
+        if worker.pid is not None:
+            multiprocess.mark_process_dead(worker.pid)
+
+
+def _run_worker(
+    main: WorkerMain, settings: HttpWorkerSettings, index: int | None
+) -> None:
+    global worker_index
+    worker_index = index
+    if index is not None:
+        # Ctrl+C reaches the whole process group, but the supervisor decides the order
+        signal(SIGINT, SIG_IGN)
+
+    with Runner(loop_factory=_loop_factory(settings.loop)) as runner:
+        runner.run(_serve_until_stopped(main, settings))
+
+
+async def _serve_until_stopped(main: WorkerMain, settings: HttpWorkerSettings) -> None:
+    stopping = Event()
+    loop = get_running_loop()
+    loop.add_signal_handler(SIGTERM, stopping.set)
+    if worker_index is None:
+        loop.add_signal_handler(SIGINT, stopping.set)
+
+    main_task = create_task(main())
+    stop_task = create_task(stopping.wait())
+    await wait({main_task, stop_task}, return_when=FIRST_COMPLETED)
+    if main_task.done():
+        stop_task.cancel()
+        main_task.result()
+        return
+
+    # Stop taking requests and let the ones in flight finish, then the rest of the service
+    for server in list(listening_servers):
+        try:
+            await wait_for(server.stop(), settings.shutdown_timeout_seconds)
+        except Exception as e:
+            print(f"HTTP server did not stop cleanly: {e}", flush=True)
+
+    main_task.cancel()
+    with suppress(CancelledError):
+        await main_task
+
+
+def _loop_factory(loop: str) -> Callable[[], AbstractEventLoop] | None:
+    if loop == "asyncio":
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        if loop == "uvloop":
+            raise
+        return None
+    return uvloop.new_event_loop
@@ -1,5 +1,6 @@
 import sys
 from asyncio import get_event_loop
+from gzip import compress
 
 sys.path.append("./src")
 
@@ -7,8 +8,13 @@ from unittest import IsolatedAsyncioTestCase
 
 from requests import Request, Session
 
-from sbilifeco.cp.common.http.server import HttpServer
+from sbilifeco.cp.common.http.server import HttpServer, ORJSONResponse
+from sbilifeco.models.base import Response
+from fastapi import Request as HttpRequest
 from fastapi.responses import PlainTextResponse
+from prometheus_client import REGISTRY, Counter
+
+REQUESTS = Counter("http_server_test_requests", "Requests made by the test")
 
 
 class ImplHttpServer(HttpServer):
@@ -17,6 +23,14 @@ class ImplHttpServer(HttpServer):
         async def root() -> PlainTextResponse:
             return PlainTextResponse("Hello, World!")
 
+        @self.get("/answer")
+        async def answer() -> Response[dict[str, list[int]]]:
+            return Response.ok({"numbers": [1, 2, 3]})
+
+        @self.post("/echo")
+        async def echo(request: HttpRequest) -> PlainTextResponse:
+            return PlainTextResponse((await request.body()).decode("utf-8"))
+
 
 class HttpServerTest(IsolatedAsyncioTestCase):
     HTTP_PORT = 8181
@@ -45,3 +59,161 @@ class HttpServerTest(IsolatedAsyncioTestCase):
 
         text = http_response.content.decode()
         self.assertEqual(text, "Hello, World!")
+
+    async def test_metrics(self):
+        REQUESTS.inc()
+        req = Request(
+            url=f"http://localhost:{self.HTTP_PORT}/metrics",
+            method="GET",
+        )
+        prep_req = req.prepare()
+        session = Session()
+        http_response = await get_event_loop().run_in_executor(
+            None,
+            session.send,
+            prep_req,
+        )
+
+        self.assertTrue(http_response.ok, http_response.content.decode())
+        self.assertTrue(http_response.headers["content-type"].startswith("text/plain"))
+
+        text = http_response.content.decode()
+        self.assertIn("http_server_test_requests_total 1.0", text)
+
+    async def test_orjson_responses(self):
+        # Arrange
+        http_server = (
+            ImplHttpServer()
+            .set_http_port(self.HTTP_PORT + 1)
+            .set_is_orjson_enabled(True)
+        )
+        await http_server.listen()
+        self.addAsyncCleanup(http_server.stop)
+        req = Request(
+            url=f"http://localhost:{self.HTTP_PORT + 1}/answer",
+            method="GET",
+        )
+
+        # Act
+        http_response = await get_event_loop().run_in_executor(
+            None, Session().send, req.prepare()
+        )
+
+        # Assert
+        self.assertTrue(http_response.ok, http_response.content.decode())
+        self.assertEqual(
+            Response[dict[str, list[int]]].model_validate_json(http_response.content),
+            Response.ok({"numbers": [1, 2, 3]}),
+        )
+        routes = [route for route in http_server.routes if route.path == "/answer"]
+        self.assertIs(routes[0].response_class, ORJSONResponse)
+
+    async def test_compression(self):
+        # Arrange
+        http_server = (
+            ImplHttpServer()
+            .set_http_port(self.HTTP_PORT + 2)
+            .set_compression_min_size(100)
+        )
+        await http_server.listen()
+        self.addAsyncCleanup(http_server.stop)
+        url = f"http://localhost:{self.HTTP_PORT + 2}/echo"
+        text = "All work and no play makes Jack a dull boy. " * 100
+        saved_before = (
+            REGISTRY.get_sample_value(
+                "http_server_compression_saved_bytes_total",
+                {"direction": "response", "encoding": "gzip"},
+            )
+            or 0.0
+        )
+
+        # Act
+        http_response = await get_event_loop().run_in_executor(
+            None,
+            Session().send,
+            Request(
+                url=url,
+                method="POST",
+                data=compress(text.encode("utf-8")),
+                headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"},
+            ).prepare(),
+        )
+
+        # Assert
+        # The request body reaches the route decompressed, and the reply goes back compressed
+        self.assertTrue(http_response.ok, http_response.content.decode())
+        self.assertEqual(http_response.headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", http_response.headers["vary"])
+        self.assertEqual(http_response.content.decode("utf-8"), text)
+        saved_after = REGISTRY.get_sample_value(
+            "http_server_compression_saved_bytes_total",
+            {"direction": "response", "encoding": "gzip"},
+        )
+        self.assertGreater(saved_after, saved_before + len(text) / 2)
+
+        # Act
+        http_response = await get_event_loop().run_in_executor(
+            None,
+            Session().send,
+            Request(
+                url=url,
+                method="POST",
+                data="Too short",
+                headers={"Accept-Encoding": "gzip"},
+            ).prepare(),
+        )
+
+        # Assert
+        # Small bodies are not worth compressing
+        self.assertNotIn("content-encoding", http_response.headers)
+        self.assertEqual(http_response.text, "Too short")
+
+        # Act
+        http_response = await get_event_loop().run_in_executor(
+            None,
+            Session().send,
+            Request(
+                url=url,
+                method="POST",
+                data=b"not gzip at all",
+                headers={"Content-Encoding": "gzip"},
+            ).prepare(),
+        )
+
+        # Assert
+        self.assertEqual(http_response.status_code, 400)
+
+    async def test_decompression_limit(self):
+        # Arrange
+        http_server = (
+            ImplHttpServer()
+            .set_http_port(self.HTTP_PORT + 3)
+            .set_max_decompressed_size(10_000)
+        )
+        await http_server.listen()
+        self.addAsyncCleanup(http_server.stop)
+        url = f"http://localhost:{self.HTTP_PORT + 3}/echo"
+        bomb = compress(b"0" * 10_000_000)
+        within_limit = compress(b"0" * 10_000)
+
+        # Act
+        responses = [
+            await get_event_loop().run_in_executor(
+                None,
+                Session().send,
+                Request(
+                    url=url,
+                    method="POST",
+                    data=data,
+                    headers={"Content-Encoding": "gzip"},
+                ).prepare(),
+            )
+            for data in [bomb, within_limit]
+        ]
+
+        # Assert
+        # A small body that would expand past the limit is refused before it does
+        self.assertLess(len(bomb), 20_000)
+        self.assertEqual(responses[0].status_code, 413)
+        self.assertEqual(responses[1].status_code, 200)
+        self.assertEqual(responses[1].text, "0" * 10_000)
@@ -0,0 +1,99 @@
+import sys
+
+sys.path.append("./src")
+
+from asyncio import sleep
+from multiprocessing import Process
+from os import getpid
+from time import perf_counter
+from time import sleep as block
+from unittest import TestCase
+
+from prometheus_client import Counter
+from requests import get
+from requests.exceptions import ConnectionError
+
+from sbilifeco.cp.common.http.server import HttpServer
+from sbilifeco.cp.common.http.workers import HttpWorkerSettings, serve_workers
+
+HTTP_PORT = 8191
+
+HITS = Counter("workers_test_hits", "Requests answered by the test server", ["route"])
+
+
+class PidHttpServer(HttpServer):
+    def build_routes(self):
+        @self.get("/pid")
+        async def pid() -> int:
+            HITS.labels(route="pid").inc()
+            return getpid()
+
+
+async def serve() -> None:
+    await PidHttpServer().set_http_port(HTTP_PORT).set_log_level("WARNING").listen()
+    while True:
+        await sleep(10000)
+
+
+class WorkersTest(TestCase):
+    def fetch_pid(self) -> int | None:
+        try:
+            return get(f"http://localhost:{HTTP_PORT}/pid", timeout=2).json()
+        except ConnectionError:
+            return None
+
+    def test_workers_share_the_port(self) -> None:
+        # Arrange
+        supervisor = Process(
+            target=serve_workers,
+            args=(serve, HttpWorkerSettings(worker_count=3, loop="asyncio")),
+        )
+
+        # Act
+        supervisor.start()
+        pids: set[int] = set()
+        deadline = perf_counter() + 20
+        while len(pids) < 2 and perf_counter() < deadline:
+            pid = self.fetch_pid()
+            if pid is None:
+                block(0.1)
+            else:
+                pids.add(pid)
+
+        supervisor.terminate()
+        supervisor.join(30)
+
+        # Assert
+        # Requests were spread over more than one worker, and all of them stopped
+        self.assertGreaterEqual(len(pids), 2)
+        self.assertEqual(supervisor.exitcode, 0)
+        self.assertIsNone(self.fetch_pid())
+
+    def test_metrics_cover_all_workers(self) -> None:
+        # Arrange
+        supervisor = Process(
+            target=serve_workers,
+            args=(serve, HttpWorkerSettings(worker_count=3, loop="asyncio")),
+        )
+
+        # Act
+        supervisor.start()
+        pids: set[int] = set()
+        hits = 0
+        deadline = perf_counter() + 20
+        while (len(pids) < 2 or hits < 20) and perf_counter() < deadline:
+            pid = self.fetch_pid()
+            if pid is None:
+                block(0.1)
+            else:
+                pids.add(pid)
+                hits += 1
+        metrics = get(f"http://localhost:{HTTP_PORT}/metrics", timeout=2).text
+
+        supervisor.terminate()
+        supervisor.join(30)
+
+        # Assert
+        # Whichever worker is scraped reports the requests answered by all of them
+        self.assertGreaterEqual(len(pids), 2)
+        self.assertIn(f'workers_test_hits_total{{route="pid"}} {float(hits)}', metrics)
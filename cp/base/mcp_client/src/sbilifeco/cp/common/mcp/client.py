@@ -1,7 +1,10 @@
 from __future__ import annotations
+from asyncio import Lock
+from collections.abc import Awaitable, Callable
 from datetime import timedelta
 from typing import Any
 from fastmcp import Client
+from fastmcp.exceptions import McpError, ToolError
 from fastmcp.client.client import CallToolResult
 from fastmcp.client.progress import ProgressHandler
 from mcp.types import Tool as Tool, CallToolResult as ToolResult
@@ -15,27 +18,66 @@ from sbilifeco.boundaries.tool_support import (
 
 
 class MCPClient(Client, IExternalToolRepo):
+    """MCP client that keeps a small pool of sessions open between calls.
+
+    Calls are spread round-robin over the pool, and concurrent calls share a
+    session, since MCP multiplexes requests over it. A call that could not reach
+    the server is retried once on a reopened session; any other failure is
+    raised as is, since the server may already have run the tool.
+    """
+
     DEFAULT_URL = "http://localhost/mcp"
+    DEFAULT_POOL_SIZE = 1
 
     def __init__(self):
         super().__init__(self.DEFAULT_URL)
         self.server_url = self.DEFAULT_URL
+        self.pool_size = self.DEFAULT_POOL_SIZE
+        self._sessions: list[Client] = []
+        self._session_locks: list[Lock] = []
+        self._init_lock = Lock()
+        self._next_session = 0
 
     def set_server_url(self, url: str) -> MCPClient:
         self.server_url = url
         return self
 
+    def set_pool_size(self, pool_size: int) -> MCPClient:
+        self.pool_size = max(pool_size, 1)
+        return self
+
     async def async_init(self):
-        self.transport = StreamableHttpTransport(url=self.server_url)
+        # Calls made while the pool is being set up wait for it here
+        async with self._init_lock:
+            if self._sessions:
+                return
+            self.transport = StreamableHttpTransport(url=self.server_url)
 
-    async def async_shutdown(self): ...
+            sessions = [self._new_session() for _ in range(self.pool_size)]
+            for session in sessions:
+                try:
+                    await session.__aenter__()
+                except Exception as e:
+                    # The server may not be up yet, the session is opened on first use instead
+                    print(f"Could not connect to MCP server at {self.server_url}: {e}")
+            self._session_locks = [Lock() for _ in sessions]
+            self._sessions = sessions
 
-    async def get_tools(self) -> Response[list[Tool]]:
-        async with self:
+    async def async_shutdown(self):
+        sessions, self._sessions, self._session_locks = self._sessions, [], []
+        for session in sessions:
             try:
-                return Response.ok(await self.list_tools())
+                await session.close()
             except Exception as e:
-                return Response.error(e)
+                print(f"Error closing MCP session: {e}")
+
+    async def get_tools(self) -> Response[list[Tool]]:
+        try:
+            return Response.ok(
+                await self._with_session(lambda session: session.list_tools())
+            )
+        except Exception as e:
+            return Response.error(e)
 
     async def call_tool(
         self,
@@ -45,10 +87,80 @@ class MCPClient(Client, IExternalToolRepo):
         progress_handler: ProgressHandler | None = None,
         raise_on_error: bool = True,
     ) -> CallToolResult:
-        async with self:
-            return await super().call_tool(
-                name, arguments, timeout, progress_handler, raise_on_error
+        return await self._with_session(
+            lambda session: session.call_tool(
+                name,
+                arguments,
+                timeout=timeout,
+                progress_handler=progress_handler,
+                raise_on_error=raise_on_error,
             )
+        )
+
+    async def _with_session[T](self, call: Callable[[Client], Awaitable[T]]) -> T:
+        if not self._sessions:
+            await self.async_init()
+
+        index = self._next_session % len(self._sessions)
+        self._next_session += 1
+        session = self._sessions[index]
+        if not session.is_connected():
+            session = await self._open_session(index)
+
+        try:
+            return await call(session)
+        except (ToolError, McpError):
+            # Raised by the server, so the session itself is fine
+            raise
+        except Exception as e:
+            # Only a request that never reached the server is safe to send again
+            if not self._is_connect_failure(e):
+                raise
+            print(f"MCP session failed, reconnecting: {e}")
+            return await call(await self._reopen_session(index, session))
+
+    @staticmethod
+    def _is_connect_failure(error: BaseException) -> bool:
+        pending: list[BaseException] = [error]
+        seen: set[int] = set()
+        while pending:
+            current = pending.pop()
+            if id(current) in seen:
+                continue
+            seen.add(id(current))
+            # Matched by name, as the transport may use its own copy of httpx
+            if type(current).__name__ in ("ConnectError", "ConnectTimeout"):
+                return True
+            if isinstance(current, BaseExceptionGroup):
+                pending.extend(current.exceptions)
+            pending.extend(
+                cause
+                for cause in (current.__cause__, current.__context__)
+                if cause is not None
+            )
+        return False
+
+    def _new_session(self) -> Client:
+        return Client(StreamableHttpTransport(url=self.server_url))
+
+    async def _open_session(self, index: int) -> Client:
+        async with self._session_locks[index]:
+            session = self._sessions[index]
+            if not session.is_connected():
+                await session.__aenter__()
+            return session
+
+    async def _reopen_session(self, index: int, failed_session: Client) -> Client:
+        async with self._session_locks[index]:
+            # Another call may have reopened it already
+            if self._sessions[index] is failed_session:
+                try:
+                    await failed_session.close()
+                except Exception:
+                    ...
+                self._sessions[index] = self._new_session()
+                await self._sessions[index].__aenter__()
+            return self._sessions[index]
 
     async def fetch_tools(self) -> list[ExternalTool]:
         try:
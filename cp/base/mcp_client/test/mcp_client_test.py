@@ -2,6 +2,7 @@ import sys
 
 sys.path.append("./src")
 
+from asyncio import gather
 from os import getenv
 from unittest import IsolatedAsyncioTestCase
 from dotenv import load_dotenv
@@ -51,8 +52,8 @@ class Test(IsolatedAsyncioTestCase):
 
     async def asyncTearDown(self) -> None:
         # Shutdown the service(s) here
-        # await self.service.async_shutdown()
-        ...
+        await self.client.async_shutdown()
+        await self.server.stop()
 
     async def test_get_tools(self):
         response = await self.client.get_tools()
@@ -126,3 +127,71 @@ class Test(IsolatedAsyncioTestCase):
         self.assertTrue(result)
         self.assertIn("result", result)
         self.assertEqual(result["result"], f"Hello, {name_argument}!")
+
+    async def test_concurrent_calls_share_the_pool(self) -> None:
+        # Arrange
+        await self.client.async_shutdown()
+        await self.client.set_pool_size(2).async_init()
+        names = [f"Tester {i}" for i in range(6)]
+
+        # Act
+        results = await gather(
+            *[self.client.invoke_tool("say_hello", name_of_greeted=n) for n in names]
+        )
+
+        # Assert
+        self.assertEqual(
+            [result["result"] for result in results],
+            [f"Hello, {name}!" for name in names],
+        )
+
+    async def test_reconnect_after_session_loss(self) -> None:
+        # Arrange
+        await self.client.invoke_tool("say_hello")
+        await self.client._sessions[0].close()
+
+        # Act
+        result = await self.client.invoke_tool("say_hello", name_of_greeted="Again")
+
+        # Assert
+        self.assertEqual(result["result"], "Hello, Again!")
+
+    async def test_failed_call_is_not_sent_twice(self) -> None:
+        # Arrange
+        session = self.client._sessions[0]
+        calls = 0
+
+        async def timed_out_call(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            raise TimeoutError("Read timed out")
+
+        session.call_tool = timed_out_call
+
+        # Act
+        result = await self.client.invoke_tool("say_hello")
+
+        # Assert
+        # The server may have run the tool already, so the call is not retried
+        self.assertEqual(result, {})
+        self.assertEqual(calls, 1)
+        self.assertIs(self.client._sessions[0], session)
+
+    async def test_early_calls_wait_for_the_pool(self) -> None:
+        # Arrange
+        await self.client.async_shutdown()
+        self.client.set_pool_size(2)
+
+        # Act
+        results = await gather(
+            *[self.client.invoke_tool("say_hello") for _ in range(4)]
+        )
+        sessions = list(self.client._sessions)
+        await self.client.async_init()
+
+        # Assert
+        self.assertEqual(
+            [result["result"] for result in results], ["Hello, There!"] * 4
+        )
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual(self.client._sessions, sessions)
@@ -1,4 +1,7 @@
 from __future__ import annotations
+from hashlib import sha1
+from typing import Any
+from fastapi import Request, Response as HttpResponse
 from sbilifeco.cp.common.http.server import HttpServer
 from sbilifeco.boundaries.metadata_storage import IMetadataStorage
 from sbilifeco.cp.metadata_storage.paths import Paths
@@ -23,6 +26,30 @@ class MetadataStorageHttpServer(HttpServer):
     async def stop(self) -> None:
         await HttpServer.stop(self)
 
+    def conditional(
+        self, request: Request, response: Response[Any]
+    ) -> Response[Any] | HttpResponse:
+        """Tag a successful read with a hash of its content, and answer 304 when the client already has it.
+
+        The hash covers exactly what was asked for, so a db and each of its tables
+        have their own versions, whichever way the metadata was changed.
+        """
+        if not response.is_success:
+            return response
+
+        body = response.model_dump_json().encode("utf-8")
+        etag = f'"{sha1(body).hexdigest()}"'
+        # Clients may keep the body, but must revalidate it before each use
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        known_etags = {
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        }
+        if etag in known_etags or "*" in known_etags:
+            return HttpResponse(status_code=304, headers=headers)
+        return HttpResponse(body, media_type="application/json", headers=headers)
+
     def build_routes(self) -> None:
         super().build_routes()
 
@@ -41,14 +68,15 @@ class MetadataStorageHttpServer(HttpServer):
                 return Response.error(e)
 
         @self.get(Paths.DB)
-        async def get_dbs() -> Response[list[DB]]:
+        async def get_dbs(request: Request) -> Response[list[DB]]:
             try:
-                return await self.storage.get_dbs()
+                return self.conditional(request, await self.storage.get_dbs())
             except Exception as e:
                 return Response.error(e)
 
         @self.get(Paths.DB_BY_ID)
         async def get_db(
+            request: Request,
             db_id: str,
             with_tables: bool = False,
             with_fields: bool = False,
@@ -56,8 +84,11 @@ class MetadataStorageHttpServer(HttpServer):
             with_additional_info: bool = False,
         ) -> Response[DB]:
             try:
-                return await self.storage.get_db(
-                    db_id, with_tables, with_fields, with_kpis, with_additional_info
+                return self.conditional(
+                    request,
+                    await self.storage.get_db(
+                        db_id, with_tables, with_fields, with_kpis, with_additional_info
+                    ),
                 )
             except Exception as e:
                 return Response.error(e)
@@ -77,18 +108,20 @@ class MetadataStorageHttpServer(HttpServer):
                 return Response.error(e)
 
         @self.get(Paths.TABLE)
-        async def get_tables(db_id: str) -> Response[list[Table]]:
+        async def get_tables(request: Request, db_id: str) -> Response[list[Table]]:
             try:
-                return await self.storage.get_tables(db_id)
+                return self.conditional(request, await self.storage.get_tables(db_id))
             except Exception as e:
                 return Response.error(e)
 
         @self.get(Paths.TABLE_BY_ID)
         async def get_table(
-            db_id: str, table_id: str, with_fields: bool = False
+            request: Request, db_id: str, table_id: str, with_fields: bool = False
         ) -> Response[Table]:
             try:
-                return await self.storage.get_table(db_id, table_id, with_fields)
+                return self.conditional(
+                    request, await self.storage.get_table(db_id, table_id, with_fields)
+                )
             except Exception as e:
                 return Response.error(e)
 
@@ -107,16 +140,18 @@ class MetadataStorageHttpServer(HttpServer):
                 return Response.error(e)
 
         @self.get(Paths.KPI)
-        async def get_kpis(db_id: str) -> Response[list[KPI]]:
+        async def get_kpis(request: Request, db_id: str) -> Response[list[KPI]]:
             try:
-                return await self.storage.get_kpis(db_id)
+                return self.conditional(request, await self.storage.get_kpis(db_id))
             except Exception as e:
                 return Response.error(e)
 
         @self.get(Paths.KPI_BY_ID)
-        async def get_kpi(db_id: str, kpi_id: str) -> Response[KPI]:
+        async def get_kpi(request: Request, db_id: str, kpi_id: str) -> Response[KPI]:
             try:
-                return await self.storage.get_kpi(db_id, kpi_id)
+                return self.conditional(
+                    request, await self.storage.get_kpi(db_id, kpi_id)
+                )
             except Exception as e:
                 return Response.error(e)
 
@@ -139,17 +174,23 @@ class MetadataStorageHttpServer(HttpServer):
                 return Response.error(e)
 
         @self.get(Paths.FIELD)
-        async def get_fields(db_id: str, table_id: str) -> Response[list[Field]]:
+        async def get_fields(
+            request: Request, db_id: str, table_id: str
+        ) -> Response[list[Field]]:
             try:
-                return await self.storage.get_fields(db_id, table_id)
+                return self.conditional(
+                    request, await self.storage.get_fields(db_id, table_id)
+                )
             except Exception as e:
                 return Response.error(e)
 
         @self.get(Paths.FIELD_BY_ID)
         async def get_field(
-            db_id: str, table_id: str, field_id: str
+            request: Request, db_id: str, table_id: str, field_id: str
         ) -> Response[Field]:
             try:
-                return await self.storage.get_field(db_id, table_id, field_id)
+                return self.conditional(
+                    request, await self.storage.get_field(db_id, table_id, field_id)
+                )
             except Exception as e:
                 return Response.error(e)
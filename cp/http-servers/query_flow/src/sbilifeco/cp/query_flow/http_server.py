@@ -4,7 +4,13 @@ from traceback import format_exc
 from fastapi import Body
 from fastapi.responses import StreamingResponse, PlainTextResponse
 from sbilifeco.cp.common.http.server import HttpServer
-from sbilifeco.boundaries.query_flow import IQueryFlow, QueryFlowRequest
+from collections.abc import AsyncIterator
+from sbilifeco.boundaries.query_flow import (
+    IQueryFlow,
+    QueryFlowBatchRequest,
+    QueryFlowBatchResult,
+    QueryFlowRequest,
+)
 from sbilifeco.cp.query_flow.paths import Paths, QueryRequest
 from sbilifeco.models.base import Response
 
@@ -56,6 +62,7 @@ class QueryFlowHttpService(HttpServer):
                     req.question,
                     req.is_pii_allowed,
                     req.with_thoughts,
+                    req.use_cache,
                 )
             except Exception as e:
                 return Response.error(e)
@@ -78,3 +85,31 @@ class QueryFlowHttpService(HttpServer):
                 return StreamingResponse(ask_response.payload, media_type="text/plain")
             except Exception as e:
                 return PlainTextResponse(content=format_exc(), status_code=500)
+
+        @self.post(Paths.QUERY_BATCHES)
+        async def query_batch(
+            req: Annotated[QueryFlowBatchRequest, Body()],
+        ):
+            try:
+                batch_response = await self.query_flow.query_batch(req)
+                if not batch_response.is_success:
+                    return PlainTextResponse(
+                        content=batch_response.message, status_code=batch_response.code
+                    )
+                elif batch_response.payload is None:
+                    return PlainTextResponse(
+                        content="Response is inexplicably blank", status_code=500
+                    )
+
+                return StreamingResponse(
+                    self._as_ndjson(batch_response.payload),
+                    media_type="application/x-ndjson",
+                )
+            except Exception as e:
+                return PlainTextResponse(content=format_exc(), status_code=500)
+
+    async def _as_ndjson(
+        self, results: AsyncIterator[QueryFlowBatchResult]
+    ) -> AsyncIterator[str]:
+        async for result in results:
+            yield result.model_dump_json() + "\n"
@@ -2,7 +2,11 @@ from __future__ import annotations
 from sbilifeco.boundaries.session_data_manager import ISessionDataManager
 from sbilifeco.cp.common.http.server import HttpServer
 from sbilifeco.models.base import Response
-from sbilifeco.cp.session_data_manager.paths import Paths, SessionData
+from sbilifeco.cp.session_data_manager.paths import (
+    Paths,
+    SessionData,
+    SessionDataItem,
+)
 
 
 class SessionDataManagerHttpServer(HttpServer):
@@ -50,3 +54,25 @@ class SessionDataManagerHttpServer(HttpServer):
                 return await self.session_data_manager.get_session_data(session_id)
             except Exception as e:
                 return Response.error(e)
+
+        @self.post(Paths.SESSION_DATA_LIST_BY_ID)
+        async def append_session_data(
+            session_id: str, session_data_item: SessionDataItem
+        ) -> Response[None]:
+            try:
+                return await self.session_data_manager.append_session_data(
+                    session_id, session_data_item.data, session_data_item.max_items
+                )
+            except Exception as e:
+                return Response.error(e)
+
+        @self.get(Paths.SESSION_DATA_LIST_BY_ID)
+        async def get_session_data_list(
+            session_id: str, last_n: int = 0
+        ) -> Response[list[str]]:
+            try:
+                return await self.session_data_manager.get_session_data_list(
+                    session_id, last_n
+                )
+            except Exception as e:
+                return Response.error(e)
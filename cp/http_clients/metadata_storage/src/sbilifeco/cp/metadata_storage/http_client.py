@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from typing import Any
 from requests import Request
-from sbilifeco.cp.common.http.client import HttpClient
+from sbilifeco.cp.common.http.client import HttpClient, response_decoder
 from sbilifeco.boundaries.metadata_storage import IMetadataStorage
 from sbilifeco.models.base import Response
 from sbilifeco.models.db_metadata import DB, Field, Table, KPI
@@ -9,8 +11,68 @@ from sbilifeco.cp.metadata_storage.paths import Paths
 
 
 class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
+    """Reads are cached by URL along with their ETag, and revalidated on every call.
+
+    While the metadata is unchanged, the server answers 304 without a body and the
+    cached one is decoded instead.
+    """
+
     def __init__(self):
         HttpClient.__init__(self)
+        self.cache_size = 256
+        self._cache: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self.revalidated = 0
+        self.fetched = 0
+
+    def set_cache_size(self, cache_size: int) -> MetadataStorageHttpClient:
+        """0 turns the cache off."""
+        self.cache_size = cache_size
+        while len(self._cache) > max(cache_size, 0):
+            self._cache.popitem(last=False)
+        return self
+
+    @property
+    def cache_stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._cache),
+            "revalidated": self.revalidated,
+            "fetched": self.fetched,
+        }
+
+    async def request_as_cached_model(
+        self, req: Request, payload_type: Any = Any
+    ) -> Response[Any]:
+        """Like `request_as_model`, but conditional on the cached copy of the response, if any."""
+        cached = self._cache.get(req.url) if self.cache_size > 0 else None
+        if cached is not None:
+            req.headers["If-None-Match"] = cached[0]
+
+        http_response = await self.send(req)
+        if http_response.status_code == 304 and cached is not None:
+            self.revalidated += 1
+            self._cache.move_to_end(req.url)
+            content = cached[1]
+        elif http_response.is_error:
+            return Response.fail(
+                message=http_response.content.decode("utf-8"),
+                code=http_response.status_code,
+            )
+        else:
+            self.fetched += 1
+            content = http_response.content
+            etag = http_response.headers.get("ETag")
+            if etag and self.cache_size > 0:
+                self._cache[req.url] = (etag, content)
+                self._cache.move_to_end(req.url)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.pop(req.url, None)
+
+        try:
+            return response_decoder(payload_type).validate_json(content)
+        except Exception as e:
+            return Response.error(e)
 
     async def upsert_db(self, db: DB) -> Response[str]:
         try:
@@ -38,11 +100,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.DB}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = [DB.model_validate(db) for db in response.payload]
-
-            return response
+            return await self.request_as_cached_model(req, list[DB])
         except Exception as e:
             return Response.error(e)
 
@@ -68,19 +126,8 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{the_path}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                db = DB.model_validate(response.payload)
-                if db.tables is not None:
-                    db.tables = [Table.model_validate(table) for table in db.tables]
-                    for table in db.tables:
-                        if table.fields is not None:
-                            table.fields = [
-                                Field.model_validate(field) for field in table.fields
-                            ]
-                response.payload = db
-
-            return response
+            # Tables and fields are parsed along with the DB, in the same pass
+            return await self.request_as_cached_model(req, DB)
         except Exception as e:
             return Response.error(e)
 
@@ -112,13 +159,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.TABLE.format(db_id=db_id)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = [
-                    Table.model_validate(table) for table in response.payload
-                ]
-
-            return response
+            return await self.request_as_cached_model(req, list[Table])
         except Exception as e:
             return Response.error(e)
 
@@ -131,16 +172,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.TABLE_BY_ID_WITH_FLAGS.format(db_id=db_id, table_id=table_id, with_fields=with_fields)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                table = Table.model_validate(response.payload)
-                if table.fields is not None:
-                    table.fields = [
-                        Field.model_validate(field) for field in table.fields
-                    ]
-                response.payload = table
-
-            return response
+            return await self.request_as_cached_model(req, Table)
         except Exception as e:
             return Response.error(e)
 
@@ -172,11 +204,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.KPI.format(db_id=db_id)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = [KPI.model_validate(kpi) for kpi in response.payload]
-
-            return response
+            return await self.request_as_cached_model(req, list[KPI])
         except Exception as e:
             return Response.error(e)
 
@@ -187,11 +215,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.KPI_BY_ID.format(db_id=db_id, kpi_id=kpi_id)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = KPI.model_validate(response.payload)
-
-            return response
+            return await self.request_as_cached_model(req, KPI)
         except Exception as e:
             return Response.error(e)
 
@@ -227,13 +251,7 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.FIELD.format(db_id=db_id, table_id=table_id)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = [
-                    Field.model_validate(field) for field in response.payload
-                ]
-
-            return response
+            return await self.request_as_cached_model(req, list[Field])
         except Exception as e:
             return Response.error(e)
 
@@ -246,10 +264,6 @@ class MetadataStorageHttpClient(HttpClient, IMetadataStorage):
                 url=f"{self.url_base}{Paths.FIELD_BY_ID.format(db_id=db_id, table_id=table_id, field_id=field_id)}",
             )
 
-            response = await self.request_as_model(req)
-            if response.payload is not None:
-                response.payload = Field.model_validate(response.payload)
-
-            return response
+            return await self.request_as_cached_model(req, Field)
         except Exception as e:
             return Response.error(e)
@@ -0,0 +1,73 @@
+import sys
+
+sys.path.append("./src")
+
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+from sbilifeco.boundaries.metadata_storage import IMetadataStorage
+from sbilifeco.cp.common.http.client import HttpClient
+from sbilifeco.cp.metadata_storage.http_client import MetadataStorageHttpClient
+from sbilifeco.cp.metadata_storage.http_server import MetadataStorageHttpServer
+from sbilifeco.models.base import Response
+from sbilifeco.models.db_metadata import DB, Table
+
+
+class ConditionalGetTest(IsolatedAsyncioTestCase):
+    HTTP_PORT = 8183
+
+    async def asyncSetUp(self) -> None:
+        self.storage = AsyncMock(spec=IMetadataStorage)
+        self.server = MetadataStorageHttpServer().set_metadata_storage(self.storage)
+        self.server.set_http_port(self.HTTP_PORT)
+        await self.server.start()
+
+        self.client = MetadataStorageHttpClient()
+        self.client.set_proto("http").set_host("localhost").set_port(self.HTTP_PORT)
+
+    async def asyncTearDown(self) -> None:
+        await self.server.stop()
+        await HttpClient.close_pools()
+
+    async def test_unchanged_metadata_is_revalidated(self) -> None:
+        # Arrange
+        db = DB(
+            id="sales",
+            name="Sales",
+            description="Policies sold",
+            tables=[Table(id="policies", name="policies", description="Policies")],
+        )
+        self.storage.get_db.return_value = Response.ok(db)
+
+        # Act
+        responses = [await self.client.get_db("sales", with_tables=True)]
+        responses.append(await self.client.get_db("sales", with_tables=True))
+
+        # Assert
+        # The second read is answered from the cache after a 304
+        self.assertEqual([response.payload for response in responses], [db, db])
+        self.assertEqual(
+            self.client.cache_stats, {"size": 1, "revalidated": 1, "fetched": 1}
+        )
+
+        # Arrange
+        changed_db = db.model_copy(update={"description": "Policies sold and lapsed"})
+        self.storage.get_db.return_value = Response.ok(changed_db)
+
+        # Act
+        response = await self.client.get_db("sales", with_tables=True)
+
+        # Assert
+        self.assertEqual(response.payload, changed_db)
+        self.assertEqual(self.client.cache_stats["fetched"], 2)
+
+    async def test_failures_are_not_cached(self) -> None:
+        # Arrange
+        self.storage.get_table.return_value = Response.fail("Table not found", 404)
+
+        # Act
+        response = await self.client.get_table("sales", "policies")
+
+        # Assert
+        self.assertFalse(response.is_success)
+        self.assertEqual(response.code, 404)
+        self.assertEqual(self.client.cache_stats["size"], 0)
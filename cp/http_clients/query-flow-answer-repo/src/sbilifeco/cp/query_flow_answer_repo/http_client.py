@@ -25,15 +25,6 @@ class QueryFlowAnswerRepoHttpClient(HttpClient, IQueryFlowAnswerRepo):
             req = Request(url=url, method="GET", params=request.model_dump())
 
             # Send request
-            res = await self.request_as_model(req)
-
-            # Triage response
-            if res.payload is not None:
-                res.payload = [
-                    QueryFlowAnswer.model_validate(item) for item in res.payload
-                ]
-
-            # Return response
-            return res
+            return await self.request_as_model(req, list[QueryFlowAnswer])
         except Exception as e:
             return Response.error(e)
@@ -1,12 +1,15 @@
 from collections.abc import AsyncIterator
 from traceback import format_exc
-from functools import partial
-from asyncio import get_running_loop
 
 from sbilifeco.cp.common.http.client import HttpClient
-from sbilifeco.boundaries.query_flow import IQueryFlow, QueryFlowRequest
+from sbilifeco.boundaries.query_flow import (
+    IQueryFlow,
+    QueryFlowBatchRequest,
+    QueryFlowBatchResult,
+    QueryFlowRequest,
+)
 from sbilifeco.models.base import Response
-from requests import Request, Session
+from requests import Request
 from sbilifeco.cp.query_flow.paths import Paths, QueryRequest
 
 
@@ -52,6 +55,7 @@ class QueryFlowHttpClient(HttpClient, IQueryFlow):
         question: str,
         is_pii_allowed: bool = False,
         with_thoughts: bool = False,
+        use_cache: bool = True,
     ) -> Response[str]:
         try:
             req = Request(
@@ -62,6 +66,7 @@ class QueryFlowHttpClient(HttpClient, IQueryFlow):
                     question=question,
                     is_pii_allowed=is_pii_allowed,
                     with_thoughts=with_thoughts,
+                    use_cache=use_cache,
                 ).model_dump(),
             )
             return await self.request_as_model(req)
@@ -76,22 +81,21 @@ class QueryFlowHttpClient(HttpClient, IQueryFlow):
             url = f"{self.url_base}{Paths.ASKS}"
             req = Request(url=url, method="POST", json=query_flow_request.model_dump())
 
-            # Send request
-            with Session() as session:
-                res = await get_running_loop().run_in_executor(
-                    None,
-                    partial(session.send, session.prepare_request(req), stream=True),
-                )
+            # Send request, leaving the body to be read as it streams in
+            res = await self.send(req, stream=True)
+            if res.is_error:
+                message = (await res.aread()).decode("utf-8")
+                await res.aclose()
+                return Response.fail(message, res.status_code)
 
-            # Triage response
+            # Chunks are read off the socket only as the caller asks for them, and
+            # the connection is closed if the caller stops early or is cancelled
             async def stream_content() -> AsyncIterator[str]:
-                for chunk in res.iter_content(chunk_size=4096, decode_unicode=True):
-                    try:
+                try:
+                    async for chunk in res.aiter_text():
                         yield chunk
-                    except Exception as e:
-                        print(f"Error in streaming response: {e}")
-                        print(format_exc())
-                        continue
+                finally:
+                    await res.aclose()
 
             # Return response
             return Response.ok(stream_content())
@@ -99,5 +103,29 @@ class QueryFlowHttpClient(HttpClient, IQueryFlow):
             print(f"Error: {e}")
             print(format_exc())
             return Response.error(e)
-        finally:
-            ...
+
+    async def query_batch(
+        self, batch_request: QueryFlowBatchRequest
+    ) -> Response[AsyncIterator[QueryFlowBatchResult]]:
+        try:
+            url = f"{self.url_base}{Paths.QUERY_BATCHES}"
+            req = Request(url=url, method="POST", json=batch_request.model_dump())
+
+            res = await self.send(req, stream=True)
+            if res.is_error:
+                message = (await res.aread()).decode("utf-8")
+                await res.aclose()
+                return Response.fail(message, res.status_code)
+
+            # One result per line, read as each question completes
+            async def stream_results() -> AsyncIterator[QueryFlowBatchResult]:
+                try:
+                    async for line in res.aiter_lines():
+                        if line:
+                            yield QueryFlowBatchResult.model_validate_json(line)
+                finally:
+                    await res.aclose()
+
+            return Response.ok(stream_results())
+        except Exception as e:
+            return Response.error(e)
@@ -4,12 +4,19 @@ import sys
 
 sys.path.append("./src")
 
+from asyncio import gather, sleep
+from time import perf_counter
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, patch
 from sbilifeco.cp.query_flow.http_client import QueryFlowHttpClient
 from sbilifeco.cp.query_flow.http_server import QueryFlowHttpService
 from sbilifeco.models.base import Response
-from sbilifeco.boundaries.query_flow import IQueryFlow, QueryFlowRequest
+from sbilifeco.boundaries.query_flow import (
+    IQueryFlow,
+    QueryFlowBatchRequest,
+    QueryFlowBatchResult,
+    QueryFlowRequest,
+)
 from faker import Faker
 from uuid import uuid4
 
@@ -100,7 +107,7 @@ class HttpClientTest(IsolatedAsyncioTestCase):
         self.assertEqual(response.payload, answer)
 
         patched_query_method.assert_called_once_with(
-            db_id, session_id, question, is_pii_allowed, with_thoughts
+            db_id, session_id, question, is_pii_allowed, with_thoughts, True
         )
 
     async def test_ask(self) -> None:
@@ -124,3 +131,72 @@ class HttpClientTest(IsolatedAsyncioTestCase):
         assert fetched is not None
 
         self.assertTrue(fetched)
+
+    async def test_concurrent_asks_stream_without_blocking(self) -> None:
+        # Arrange
+        chunks = [self.faker.word() + " " for _ in range(3)]
+
+        async def ask(request: QueryFlowRequest) -> Response:
+            async def stream_answer():
+                for chunk in chunks:
+                    # The server shares this loop, so a blocking read would stall it
+                    await sleep(0.05)
+                    yield chunk
+
+            return Response.ok(stream_answer())
+
+        patch.object(self.flow, "ask", side_effect=ask).start()
+        requests = [
+            QueryFlowRequest(db_id=uuid4().hex, question=self.faker.sentence())
+            for _ in range(4)
+        ]
+
+        async def read_answer(request: QueryFlowRequest) -> str:
+            response = await self.client.ask(request)
+            assert response.payload is not None
+            return "".join([chunk async for chunk in response.payload])
+
+        # Act
+        time_before = perf_counter()
+        answers = await gather(*[read_answer(request) for request in requests])
+        time_taken = perf_counter() - time_before
+
+        # Assert
+        self.assertEqual(answers, ["".join(chunks)] * len(requests))
+        self.assertLess(time_taken, 0.5)
+
+    async def test_query_batch(self) -> None:
+        # Arrange
+        req = QueryFlowBatchRequest(
+            db_id=uuid4().hex,
+            questions=[self.faker.sentence() for _ in range(3)],
+            max_concurrency=2,
+        )
+        results = [
+            QueryFlowBatchResult(
+                index=index,
+                session_id=uuid4().hex,
+                question=question,
+                response=Response.ok(self.faker.sentence()),
+            )
+            for index, question in reversed(list(enumerate(req.questions)))
+        ]
+
+        async def stream_results():
+            for result in results:
+                yield result
+
+        fn_query_batch = patch.object(
+            self.flow, "query_batch", return_value=Response.ok(stream_results())
+        ).start()
+
+        # Act
+        response = await self.client.query_batch(req)
+
+        # Assert
+        self.assertTrue(response.is_success, response.message)
+        assert response.payload is not None
+        fetched = [result async for result in response.payload]
+
+        fn_query_batch.assert_called_once_with(req)
+        self.assertEqual(fetched, results)
@@ -1,7 +1,11 @@
 from sbilifeco.cp.common.http.client import HttpClient
 from sbilifeco.boundaries.session_data_manager import ISessionDataManager
 from sbilifeco.models.base import Response
-from sbilifeco.cp.session_data_manager.paths import Paths, SessionData
+from sbilifeco.cp.session_data_manager.paths import (
+    Paths,
+    SessionData,
+    SessionDataItem,
+)
 from requests import Request
 
 
@@ -32,6 +36,34 @@ class SessionDataManagerHttpClient(HttpClient, ISessionDataManager):
         except Exception as e:
             return Response.error(e)
 
+    async def append_session_data(
+        self, session_id: str, data: str, max_items: int = 0
+    ) -> Response[None]:
+        try:
+            return await self.request_as_model(
+                Request(
+                    method="POST",
+                    url=f"{self.url_base}{Paths.SESSION_DATA_LIST_BY_ID.format(session_id=session_id)}",
+                    json=SessionDataItem(data=data, max_items=max_items).model_dump(),
+                )
+            )
+        except Exception as e:
+            return Response.error(e)
+
+    async def get_session_data_list(
+        self, session_id: str, last_n: int = 0
+    ) -> Response[list[str]]:
+        try:
+            return await self.request_as_model(
+                Request(
+                    method="GET",
+                    url=f"{self.url_base}{Paths.SESSION_DATA_LIST_BY_ID.format(session_id=session_id)}",
+                    params={"last_n": last_n},
+                )
+            )
+        except Exception as e:
+            return Response.error(e)
+
     async def delete_session_data(self, session_id: str) -> Response[None]:
         try:
             return await self.request_as_model(
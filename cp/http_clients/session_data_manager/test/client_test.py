@@ -105,3 +105,38 @@ class Test(IsolatedAsyncioTestCase):
         self.assertTrue(get_response.is_success)
         self.assertEqual(get_response.payload, session_data)
         patched_get_method.assert_called_once_with(session_id)
+
+    async def test_append_session_data(self) -> None:
+        # Arrange
+        session_id = uuid4().hex
+        session_data = self.faker.paragraph()
+        patched_append_method = patch.object(
+            self.gateway, "append_session_data", return_value=Response.ok(None)
+        ).start()
+
+        # Act
+        append_response = await self.http_client.append_session_data(
+            session_id, session_data, 10
+        )
+
+        # Assert
+        self.assertTrue(append_response.is_success, append_response.message)
+        patched_append_method.assert_called_once_with(session_id, session_data, 10)
+
+    async def test_get_session_data_list(self) -> None:
+        # Arrange
+        session_id = uuid4().hex
+        session_data = [self.faker.sentence() for _ in range(3)]
+        patched_get_method = patch.object(
+            self.gateway,
+            "get_session_data_list",
+            return_value=Response.ok(session_data),
+        ).start()
+
+        # Act
+        get_response = await self.http_client.get_session_data_list(session_id, 3)
+
+        # Assert
+        self.assertTrue(get_response.is_success, get_response.message)
+        self.assertEqual(get_response.payload, session_data)
+        patched_get_method.assert_called_once_with(session_id, 3)
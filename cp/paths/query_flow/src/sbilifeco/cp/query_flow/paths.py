@@ -9,6 +9,7 @@ class Paths:
     SESSION_RESET = SESSION_BY_ID + "/reset"
     QUERIES = SESSION_BY_ID + "/queries"
     ASKS = BASE + "/asks"
+    QUERY_BATCHES = BASE + "/query-batches"
     ANSWERS = BASE + "/answers"
     FAILURES = BASE + "/failures"
 
@@ -18,6 +19,7 @@ class QueryRequest(BaseModel):
     question: str
     is_pii_allowed: bool = False
     with_thoughts: bool = False
+    use_cache: bool = True
 
 
 class QueryFailure(BaseModel):
@@ -4,7 +4,13 @@ from pydantic import BaseModel
 class Paths:
     BASE = "/api/v1/session-data"
     SESSION_DATA_BY_ID = BASE + "/{session_id}"
+    SESSION_DATA_LIST_BY_ID = SESSION_DATA_BY_ID + "/list"
 
 
 class SessionData(BaseModel):
     data: str
+
+
+class SessionDataItem(BaseModel):
+    data: str
+    max_items: int = 0
@@ -38,6 +38,7 @@ class LogDirectoryPresenter(IQueryFlowListener):
                         query_flow_answer.question,
                         query_flow_answer.answer,
                         query_flow_answer.response_time_seconds,
+                        "cached" if query_flow_answer.is_cached else "",
                     ]
                 )
                 f.flush()
@@ -11,6 +11,7 @@ class QueryFlowRequest(BaseModel):
     question: str
     is_pii_allowed: bool = False
     with_thoughts: bool = False
+    use_cache: bool = True  # False to always generate a fresh answer
 
 
 class QueryFlowAnswer(BaseModel):
@@ -19,6 +20,23 @@ class QueryFlowAnswer(BaseModel):
     question: str
     answer: str
     response_time_seconds: float = -1
+    is_cached: bool = False
+
+
+class QueryFlowBatchRequest(BaseModel):
+    db_id: str
+    questions: list[str]
+    is_pii_allowed: bool = False
+    with_thoughts: bool = False
+    use_cache: bool = True
+    max_concurrency: int = 0  # Caps parallel LLM calls below the flow's limit
+
+
+class QueryFlowBatchResult(BaseModel):
+    index: int  # Position in the batch, as results arrive in completion order
+    session_id: str
+    question: str
+    response: Response[str]
 
 
 class GetQueryFlowAnswersRequest(BaseModel):
@@ -42,6 +60,7 @@ class IQueryFlow(Protocol):
         question: str,
         is_pii_allowed=False,
         with_thoughts: bool = False,
+        use_cache: bool = True,
     ) -> Response[str]:
         raise NotImplementedError()
 
@@ -50,6 +69,11 @@ class IQueryFlow(Protocol):
     ) -> Response[AsyncIterator[str]]:
         raise NotImplementedError()
 
+    async def query_batch(
+        self, batch_request: QueryFlowBatchRequest
+    ) -> Response[AsyncIterator[QueryFlowBatchResult]]:
+        raise NotImplementedError()
+
 
 class IQueryFlowListener(Protocol):
     async def on_fail(
@@ -14,3 +14,15 @@ class ISessionDataManager(Protocol):
 
     async def delete_all_session_data(self) -> Response[None]:
         raise NotImplementedError("Method must be implemented by subclasses")
+
+    async def append_session_data(
+        self, session_id: str, data: str, max_items: int = 0
+    ) -> Response[None]:
+        """Appends to the list kept under `session_id`, keeping only the last `max_items` (all if 0)."""
+        raise NotImplementedError("Method must be implemented by subclasses")
+
+    async def get_session_data_list(
+        self, session_id: str, last_n: int = 0
+    ) -> Response[list[str]]:
+        """Oldest first, limited to the last `last_n` items (all if 0). Empty if nothing was appended."""
+        raise NotImplementedError("Method must be implemented by subclasses")
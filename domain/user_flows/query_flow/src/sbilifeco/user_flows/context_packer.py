@@ -0,0 +1,82 @@
+from __future__ import annotations
+from collections.abc import Callable, Sequence
+from sbilifeco.boundaries.metadata_storage import DB
+
+# Close enough for English text and SQL identifiers with the tokenisers we use
+CHARS_PER_TOKEN = 4
+TABLE_OVERHEAD_TOKENS = 8
+FIELD_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class ContextPacker:
+    """Trims optional prompt sections so that they fit a token budget.
+
+    Each method returns what fits and the tokens it is estimated to take, keeping
+    the most relevant part of the section: the best ranked tables and fields, the
+    most recent questions and answers, or the leading lines.
+    """
+
+    TRUNCATION_NOTE = "(truncated to fit the prompt budget)"
+
+    def pack_db(self, db: DB, budget: int) -> tuple[DB, int]:
+        """Keeps tables and fields in rank order while they fit."""
+        used = estimate_tokens(db.name + db.description)
+        tables = []
+
+        for table in db.tables or []:
+            table_cost = TABLE_OVERHEAD_TOKENS + estimate_tokens(
+                table.name + table.description
+            )
+            if used + table_cost > budget:
+                break
+            used += table_cost
+
+            fields = []
+            for field in table.fields or []:
+                field_cost = FIELD_OVERHEAD_TOKENS + estimate_tokens(
+                    field.name + field.type + field.description
+                )
+                if used + field_cost > budget:
+                    break
+                used += field_cost
+                fields.append(field)
+
+            tables.append(table.model_copy(update={"fields": fields}))
+
+        return db.model_copy(update={"tables": tables}), used
+
+    def pack_turns[T](
+        self, turns: Sequence[T], render: Callable[[T], str], budget: int
+    ) -> tuple[list[T], int]:
+        """Keeps the most recent conversation turns that fit, each costed as `render` formats it."""
+        kept: list[T] = []
+        used = 0
+        for turn in reversed(turns):
+            turn_cost = estimate_tokens(render(turn))
+            if used + turn_cost > budget:
+                break
+            kept.append(turn)
+            used += turn_cost
+        return kept[::-1], used
+
+    def pack_lines(self, text: str, budget: int) -> tuple[str, int]:
+        """Keeps whole leading lines that fit."""
+        if estimate_tokens(text) <= budget:
+            return text, estimate_tokens(text)
+
+        budget -= estimate_tokens(self.TRUNCATION_NOTE)
+        kept: list[str] = []
+        used = 0
+        for line in text.splitlines():
+            line_cost = estimate_tokens(line) + 1
+            if used + line_cost > budget:
+                break
+            kept.append(line)
+            used += line_cost
+
+        kept.append(self.TRUNCATION_NOTE)
+        return "\n".join(kept), used + estimate_tokens(self.TRUNCATION_NOTE)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from collections.abc import Sequence
+from pydantic import BaseModel, ValidationError
+from sbilifeco.user_flows.context_packer import estimate_tokens
+
+
+class ConversationTurn(BaseModel):
+    question: str
+    answer: str
+    has_sql: bool = False
+
+
+class HistorySettings(BaseModel):
+    max_turns: int = 10  # Turns kept per session, older ones are trimmed on write
+    max_tokens: int = 2000  # Oldest turns are left out beyond this, 0 for no cap
+    turn_template: str = "Q: {question}\nA: {answer}\n\n"
+    since_last_sql: bool = True  # Turns before the latest SQL answer are left out
+
+
+class ConversationHistory:
+    """Encodes conversation turns for the session store and renders the recent ones into the prompt.
+
+    Turns are appended one at a time to a list that the store trims to the last
+    `max_turns`, so neither the write nor the read grows with the length of the session.
+    """
+
+    EMPTY = "None"
+
+    def __init__(self) -> None:
+        self.settings = HistorySettings()
+
+    def set_settings(self, settings: HistorySettings) -> ConversationHistory:
+        self.settings = settings
+        return self
+
+    def encode(self, question: str, answer: str, has_sql: bool) -> str:
+        return ConversationTurn(
+            question=question, answer=answer, has_sql=has_sql
+        ).model_dump_json()
+
+    def decode(self, items: Sequence[str]) -> list[ConversationTurn]:
+        turns = []
+        for item in items:
+            try:
+                turns.append(ConversationTurn.model_validate_json(item))
+            except ValidationError:
+                continue
+        return turns
+
+    def select(self, items: Sequence[str]) -> list[ConversationTurn]:
+        turns = self.decode(items)
+
+        # A SQL answer settles the question, so earlier turns no longer add context
+        if self.settings.since_last_sql:
+            for index in range(len(turns) - 1, -1, -1):
+                if turns[index].has_sql:
+                    turns = turns[index:]
+                    break
+
+        selected: list[ConversationTurn] = []
+        used = 0
+        for turn in reversed(turns):
+            used += estimate_tokens(self.format_turn(turn))
+            if self.settings.max_tokens > 0 and used > self.settings.max_tokens:
+                break
+            selected.append(turn)
+        return selected[::-1]
+
+    def render(self, items: Sequence[str]) -> str:
+        return self.render_turns(self.select(items))
+
+    def render_turns(self, turns: Sequence[ConversationTurn]) -> str:
+        if not turns:
+            return self.EMPTY
+        return "".join(self.format_turn(turn) for turn in turns)
+
+    def format_turn(self, turn: ConversationTurn) -> str:
+        return self.settings.turn_template.format(
+            question=turn.question, answer=turn.answer
+        )
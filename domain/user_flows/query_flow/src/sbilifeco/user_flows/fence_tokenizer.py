@@ -0,0 +1,69 @@
+from __future__ import annotations
+from typing import Sequence
+
+
+class FenceTokenizer:
+    """Splits a streamed answer into segments that end with a completed fenced block.
+
+    Only newly fed text is scanned. A few trailing characters are carried over
+    between feeds so that fences split across chunks are still recognised.
+    """
+
+    CLOSING_FENCE = "```"
+
+    def __init__(self, opening_fences: Sequence[str]) -> None:
+        self.opening_fences = list(opening_fences)
+        self._opening_carry = max(len(fence) for fence in self.opening_fences) - 1
+        self._closing_carry = len(self.CLOSING_FENCE) - 1
+        self._pending: list[str] = []
+        self._carry = ""
+        self._open_fence: str | None = None
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """Returns (segment, opening fence) for every block closed by this chunk."""
+        completed: list[tuple[str, str]] = []
+        window = self._carry + chunk
+        segment_start = 0
+        position = 0
+
+        while True:
+            if self._open_fence is None:
+                index, fence = self._find_opening(window, position)
+                if index < 0:
+                    carry_start = max(len(window) - self._opening_carry, position)
+                    break
+                self._open_fence = fence
+                position = index + len(fence)
+            else:
+                index = window.find(self.CLOSING_FENCE, position)
+                if index < 0:
+                    carry_start = max(len(window) - self._closing_carry, position)
+                    break
+                segment_end = index + len(self.CLOSING_FENCE)
+
+                self._pending.append(window[segment_start:segment_end])
+                completed.append(("".join(self._pending), self._open_fence))
+
+                self._pending.clear()
+                self._open_fence = None
+                segment_start = position = segment_end
+
+        self._pending.append(window[segment_start:carry_start])
+        self._carry = window[carry_start:]
+        return completed
+
+    def flush(self) -> str:
+        """Returns whatever is left after the last completed block and resets."""
+        remainder = "".join(self._pending) + self._carry
+        self._pending.clear()
+        self._carry = ""
+        self._open_fence = None
+        return remainder
+
+    def _find_opening(self, window: str, position: int) -> tuple[int, str]:
+        found_index, found_fence = -1, ""
+        for fence in self.opening_fences:
+            index = window.find(fence, position)
+            if index >= 0 and (found_index < 0 or index < found_index):
+                found_index, found_fence = index, fence
+        return found_index, found_fence
@@ -0,0 +1,122 @@
+from __future__ import annotations
+from asyncio import get_running_loop
+from logging import (
+    DEBUG,
+    ERROR,
+    INFO,
+    WARNING,
+    Formatter,
+    Logger,
+    LogRecord,
+    StreamHandler,
+    getLevelName,
+)
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from queue import SimpleQueue
+from random import random
+from sys import stdout
+from typing import Any, TextIO
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # Formatting is left to the listener thread, off the event loop
+        return record
+
+
+class FlowLogger:
+    """Levelled logger whose records are written to stdout by a background thread.
+
+    Callers only pay for putting a record on a queue. Full prompts are logged for
+    a sampled fraction of requests, and can optionally be dumped one file per request.
+    """
+
+    def __init__(
+        self,
+        name: str = "sbilifeco.query_flow",
+        level: int = INFO,
+        stream: TextIO = stdout,
+    ) -> None:
+        # Not registered with logging.getLogger, so each flow owns its handlers
+        self._logger = Logger(name, level)
+        self._logger.propagate = False
+        self._queue: SimpleQueue[LogRecord] = SimpleQueue()
+        self._logger.addHandler(_DeferredQueueHandler(self._queue))
+
+        handler = StreamHandler(stream)
+        handler.setFormatter(
+            Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+        )
+        self._listener = QueueListener(self._queue, handler)
+        self._is_started = False
+
+        self.prompt_sample_rate: float = 0.0
+        self.prompt_dump_dir: Path | None = None
+
+    def set_level(self, level: int | str) -> FlowLogger:
+        self._logger.setLevel(level.upper() if isinstance(level, str) else level)
+        return self
+
+    def set_prompt_sample_rate(self, rate: float) -> FlowLogger:
+        self.prompt_sample_rate = min(max(rate, 0.0), 1.0)
+        return self
+
+    def set_prompt_dump_dir(self, path: str | Path | None) -> FlowLogger:
+        self.prompt_dump_dir = Path(path) if path else None
+        return self
+
+    @property
+    def level(self) -> str:
+        return getLevelName(self._logger.level)
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def start(self) -> None:
+        if not self._is_started:
+            self._listener.start()
+            self._is_started = True
+
+    def stop(self) -> None:
+        """Writes out everything still queued and stops the background thread."""
+        if self._is_started:
+            self._listener.stop()
+            self._is_started = False
+
+    def debug(self, message: str, **fields: Any) -> None:
+        self._log(DEBUG, message, fields)
+
+    def info(self, message: str, **fields: Any) -> None:
+        self._log(INFO, message, fields)
+
+    def warning(self, message: str, **fields: Any) -> None:
+        self._log(WARNING, message, fields)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self._log(ERROR, message, fields)
+
+    def log_prompt(self, request_id: str, prompt: str) -> None:
+        if self.prompt_sample_rate > 0 and random() < self.prompt_sample_rate:
+            self.info(f"Formed prompt:\n{prompt}", request_id=request_id)
+
+        if self.prompt_dump_dir is not None:
+            get_running_loop().run_in_executor(
+                None, self._dump_prompt, self.prompt_dump_dir, request_id, prompt
+            )
+
+    def _log(self, level: int, message: str, fields: dict[str, Any]) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+
+        self.start()
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        self._logger.log(level, message)
+
+    def _dump_prompt(self, dump_dir: Path, request_id: str, prompt: str) -> None:
+        try:
+            dump_dir.mkdir(parents=True, exist_ok=True)
+            (dump_dir / f"{request_id}.txt").write_text(prompt, encoding="utf-8")
+        except OSError as e:
+            self.warning(f"Could not dump prompt: {e}", request_id=request_id)
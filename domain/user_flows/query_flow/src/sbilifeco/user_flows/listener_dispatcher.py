@@ -0,0 +1,179 @@
+from __future__ import annotations
+from asyncio import (
+    CancelledError,
+    Queue,
+    QueueEmpty,
+    QueueFull,
+    Task,
+    create_task,
+    timeout,
+    wait_for,
+)
+from collections.abc import Awaitable, Callable
+from time import perf_counter
+from sbilifeco.boundaries.query_flow import IQueryFlowListener, QueryFlowAnswer
+from sbilifeco.models.base import Response
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.stage_metrics import observe_stage
+
+ListenerCall = Callable[[IQueryFlowListener], Awaitable[None]]
+# The call, the db id it concerns and when it was queued
+ListenerEvent = tuple[ListenerCall, str, float]
+
+
+class ListenerDispatcher:
+    """Delivers query flow events to listeners from a bounded queue drained by a fixed pool of workers."""
+
+    POLICY_DROP_NEWEST = "drop_newest"
+    POLICY_DROP_OLDEST = "drop_oldest"
+    POLICY_BLOCK = "block"
+
+    def __init__(self, listeners: list[IQueryFlowListener], log: FlowLogger) -> None:
+        self.listeners = listeners
+        self._log = log
+        self.max_queue_size = 1000
+        self.num_workers = 4
+        self.listener_timeout_seconds = 10.0
+        self.overflow_policy = self.POLICY_DROP_NEWEST
+        self._queue: Queue[ListenerEvent] | None = None
+        self._workers: list[Task[None]] = []
+        self.delivered = 0
+        self.dropped = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    def set_max_queue_size(self, max_queue_size: int) -> ListenerDispatcher:
+        self.max_queue_size = max_queue_size
+        return self
+
+    def set_num_workers(self, num_workers: int) -> ListenerDispatcher:
+        self.num_workers = max(num_workers, 1)
+        return self
+
+    def set_listener_timeout(self, seconds: float) -> ListenerDispatcher:
+        self.listener_timeout_seconds = seconds
+        return self
+
+    def set_overflow_policy(self, policy: str) -> ListenerDispatcher:
+        if policy not in (
+            self.POLICY_DROP_NEWEST,
+            self.POLICY_DROP_OLDEST,
+            self.POLICY_BLOCK,
+        ):
+            raise ValueError(f"Unknown listener overflow policy: {policy}")
+        self.overflow_policy = policy
+        return self
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+        }
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = Queue(self.max_queue_size)
+        while len(self._workers) < self.num_workers:
+            self._workers.append(create_task(self._work()))
+
+    async def stop(self, drain_timeout_seconds: float = 10.0) -> None:
+        """Waits for queued events to be delivered, then stops the workers."""
+        if self._queue is not None and self._workers:
+            try:
+                await wait_for(self._queue.join(), drain_timeout_seconds)
+            except TimeoutError:
+                self._log.warning(
+                    f"Gave up draining listener queue after {drain_timeout_seconds} seconds",
+                    pending=self._queue.qsize(),
+                )
+
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except CancelledError:
+                pass
+        self._workers.clear()
+        self._queue = None
+
+    async def drain(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def dispatch_answer(self, query_flow_answer: QueryFlowAnswer) -> None:
+        async def call(listener: IQueryFlowListener) -> None:
+            await listener.on_answer(query_flow_answer)
+
+        await self._enqueue((call, query_flow_answer.db_id, perf_counter()))
+
+    async def dispatch_fail(
+        self, session_id: str, db_id: str, question: str, failure_response: Response
+    ) -> None:
+        async def call(listener: IQueryFlowListener) -> None:
+            await listener.on_fail(session_id, db_id, question, failure_response)
+
+        await self._enqueue((call, db_id, perf_counter()))
+
+    async def _enqueue(self, event: ListenerEvent) -> None:
+        if not self.listeners:
+            return
+
+        self.start()
+        assert self._queue is not None
+
+        if self.overflow_policy == self.POLICY_BLOCK:
+            await self._queue.put(event)
+            return
+
+        try:
+            self._queue.put_nowait(event)
+            return
+        except QueueFull:
+            pass
+
+        self.dropped += 1
+        if self.overflow_policy == self.POLICY_DROP_NEWEST:
+            self._log.warning("Listener queue is full, dropping the newest event")
+            return
+
+        self._log.warning("Listener queue is full, dropping the oldest event")
+        try:
+            self._queue.get_nowait()
+            self._queue.task_done()
+        except QueueEmpty:
+            pass
+        self._queue.put_nowait(event)
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+
+        while True:
+            call, db_id, queued_at = await queue.get()
+            try:
+                time_before = perf_counter()
+                observe_stage("listener_queue_wait", db_id, time_before - queued_at)
+                for listener in list(self.listeners):
+                    await self._deliver(listener, call)
+                observe_stage("listener_dispatch", db_id, perf_counter() - time_before)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, listener: IQueryFlowListener, call: ListenerCall) -> None:
+        try:
+            async with timeout(self.listener_timeout_seconds):
+                await call(listener)
+            self.delivered += 1
+        except TimeoutError:
+            self.timed_out += 1
+            self._log.warning(
+                f"Listener {type(listener).__name__} timed out after {self.listener_timeout_seconds} seconds"
+            )
+        except Exception as e:
+            self.failed += 1
+            self._log.warning(f"Listener {type(listener).__name__} failed: {e}")
@@ -0,0 +1,102 @@
+from __future__ import annotations
+from collections.abc import Mapping, Sequence
+from hashlib import sha1
+from typing import Any
+from pydantic import BaseModel
+from sbilifeco.user_flows.conversation_history import ConversationTurn
+from sbilifeco.user_flows.prompt_template_cache import CompiledPrompt
+
+
+class PromptMessage(BaseModel):
+    role: str
+    content: str
+
+
+class LayeredPrompt(BaseModel):
+    prefix: str
+    prefix_hash: str
+    messages: list[PromptMessage]
+
+    def render(self) -> str:
+        rendered = [self.prefix]
+        for message in self.messages:
+            rendered.append(f"### {message.role}\n{message.content}\n\n")
+        # The LLM carries on as the assistant
+        rendered.append(f"### {PromptLayout.ASSISTANT}\n")
+        return "".join(rendered)
+
+
+class PromptLayout:
+    """Lays a prompt out from its most static part to its most dynamic one, so LLM backends can cache the prefix.
+
+    Placeholders that change from request to request are replaced in the template by a
+    reference. Their values follow the template in a request message, then come the
+    earlier turns of the conversation and the question as user and assistant messages.
+    A session's next turn therefore extends the previous prompt rather than rewriting it.
+    """
+
+    REQUEST = "Request"
+    USER = "User"
+    ASSISTANT = "Assistant"
+    HISTORY_REFERENCE = "[see the conversation below]"
+    QUESTION_REFERENCE = f"[see the last {USER} message below]"
+
+    def __init__(self) -> None:
+        self._last_prefix_hash_by_db: dict[str, str] = {}
+        self.reused = 0
+        self.changed = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "prefixes": len(self._last_prefix_hash_by_db),
+            "reused": self.reused,
+            "changed": self.changed,
+        }
+
+    def build(
+        self,
+        db_id: str,
+        template: CompiledPrompt,
+        values: Mapping[str, Any],
+        request_labels: Mapping[str, str],
+        history_placeholder: str,
+        question_placeholder: str,
+        turns: Sequence[ConversationTurn],
+    ) -> LayeredPrompt:
+        """`request_labels` maps the per-request placeholders to their labels, most static first."""
+        references: dict[str, Any] = {
+            placeholder: f"[{label}]" for placeholder, label in request_labels.items()
+        }
+        references[history_placeholder] = self.HISTORY_REFERENCE
+        references[question_placeholder] = self.QUESTION_REFERENCE
+        prefix = template.render({**values, **references}).rstrip() + "\n\n"
+
+        messages = [
+            PromptMessage(
+                role=self.REQUEST,
+                content="\n".join(
+                    f"{label}: {values[placeholder]}"
+                    for placeholder, label in request_labels.items()
+                ),
+            )
+        ]
+        for turn in turns:
+            messages.append(PromptMessage(role=self.USER, content=turn.question))
+            messages.append(PromptMessage(role=self.ASSISTANT, content=turn.answer))
+        messages.append(
+            PromptMessage(role=self.USER, content=str(values[question_placeholder]))
+        )
+
+        prefix_hash = self._hash(db_id, template.version, prefix)
+        if self._last_prefix_hash_by_db.get(db_id) == prefix_hash:
+            self.reused += 1
+        else:
+            self.changed += 1
+            self._last_prefix_hash_by_db[db_id] = prefix_hash
+
+        return LayeredPrompt(prefix=prefix, prefix_hash=prefix_hash, messages=messages)
+
+    def _hash(self, db_id: str, template_version: str, prefix: str) -> str:
+        key = "\0".join([db_id, template_version, prefix])
+        return sha1(key.encode("utf-8")).hexdigest()[:16]
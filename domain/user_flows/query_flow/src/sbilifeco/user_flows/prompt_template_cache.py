@@ -0,0 +1,135 @@
+from __future__ import annotations
+from hashlib import sha1
+from io import TextIOBase, RawIOBase, BufferedIOBase
+from os import stat, fstat
+from string import Formatter
+from typing import Any, Mapping
+from sbilifeco.user_flows.flow_logger import FlowLogger
+
+PromptSource = str | TextIOBase | RawIOBase | BufferedIOBase
+
+
+class CompiledPrompt:
+    """A prompt template pre-split into literal text and placeholders."""
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        self.version = sha1(template.encode("utf-8")).hexdigest()[:12]
+        self.placeholders: list[str] = []
+        self._parts: list[tuple[str, str | None]] = []
+        self._is_simple = True
+
+        for literal, field_name, format_spec, conversion in Formatter().parse(template):
+            if field_name is None:
+                self._parts.append((literal, None))
+                continue
+
+            if format_spec or conversion or not field_name.isidentifier():
+                # Attribute access, indexing, conversions and format specs are left to str.format_map
+                self._is_simple = False
+
+            self._parts.append((literal, field_name))
+            self.placeholders.append(field_name)
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        if not self._is_simple:
+            return self.template.format_map(values)
+
+        pieces: list[str] = []
+        for literal, field_name in self._parts:
+            pieces.append(literal)
+            if field_name is not None:
+                pieces.append(str(values[field_name]))
+        return "".join(pieces)
+
+
+class _CacheEntry:
+    def __init__(
+        self,
+        source: PromptSource,
+        signature: tuple[int, int] | None,
+        prompt: CompiledPrompt,
+    ) -> None:
+        self.source = source
+        self.signature = signature
+        self.prompt = prompt
+
+
+class PromptTemplateCache:
+    """Loads and compiles prompt templates once, reloading file-backed ones when their mtime or size changes."""
+
+    FILE_SCHEME = "file://"
+
+    def __init__(self, log: FlowLogger) -> None:
+        self._log = log
+        self._entries: dict[str, _CacheEntry] = {}
+        self.hits = 0
+        self.reloads = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "templates": len(self._entries),
+            "hits": self.hits,
+            "reloads": self.reloads,
+        }
+
+    def invalidate(self, key: str | None = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def get(self, key: str, source: PromptSource) -> CompiledPrompt:
+        entry = self._entries.get(key)
+        signature = self._signature_of(source)
+
+        if (
+            entry is not None
+            and entry.source is source
+            and entry.signature == signature
+        ):
+            self.hits += 1
+            return entry.prompt
+
+        self._log.debug(f"Loading and compiling prompt template for key '{key}'")
+        prompt = CompiledPrompt(self._read(source))
+        self._entries[key] = _CacheEntry(source, signature, prompt)
+        self.reloads += 1
+        return prompt
+
+    def _signature_of(self, source: PromptSource) -> tuple[int, int] | None:
+        try:
+            if isinstance(source, str):
+                if not source.startswith(self.FILE_SCHEME):
+                    return None
+                file_stat = stat(source[len(self.FILE_SCHEME) :])
+            else:
+                file_stat = fstat(source.fileno())
+            return (file_stat.st_mtime_ns, file_stat.st_size)
+        except (OSError, ValueError):
+            # In-memory streams have no file descriptor; they are read once
+            return None
+
+    def _read(self, source: PromptSource) -> str:
+        if isinstance(source, str):
+            if source.startswith(self.FILE_SCHEME):
+                self._log.debug(f"Prompt template is inside the file {source}")
+                file_path = source[len(self.FILE_SCHEME) :]
+                with open(file_path, "r", encoding="utf-8") as prompt_template_file:
+                    return prompt_template_file.read()
+
+            self._log.debug("Prompt template is a raw string")
+            return source
+        elif isinstance(source, (RawIOBase, BufferedIOBase)):
+            self._log.debug(
+                "Prompt template is an open binary stream, seeking to start"
+            )
+            source.seek(0)
+            return source.read().decode("utf-8")
+        elif isinstance(source, TextIOBase):
+            self._log.debug("Prompt template is an open text stream, seeking to start")
+            source.seek(0)
+            return source.read()
+
+        return ""
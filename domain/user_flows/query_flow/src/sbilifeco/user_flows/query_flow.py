@@ -1,11 +1,20 @@
 from __future__ import annotations
 from collections.abc import AsyncIterator
-from json import dumps, loads
-from re import search
-from typing import Sequence
+from hashlib import sha1
+from json import loads
+from typing import Any, Awaitable, Coroutine, Sequence, TypeVar
 from uuid import uuid4
-from asyncio import create_task, get_running_loop
-from sbilifeco.boundaries.metadata_storage import IMetadataStorage, DB, Table, Field
+from asyncio import (
+    CancelledError,
+    Semaphore,
+    Task,
+    as_completed,
+    create_task,
+    gather,
+    sleep,
+    timeout,
+)
+from sbilifeco.boundaries.metadata_storage import IMetadataStorage, DB
 from sbilifeco.boundaries.llm import ILLM
 from sbilifeco.boundaries.session_data_manager import ISessionDataManager
 from sbilifeco.boundaries.tool_support import (
@@ -17,21 +26,74 @@ from sbilifeco.boundaries.query_flow import (
     IQueryFlow,
     QueryFlowAnswer,
     IQueryFlowListener,
+    QueryFlowBatchRequest,
+    QueryFlowBatchResult,
     QueryFlowRequest,
 )
 from sbilifeco.boundaries.vectoriser import BaseVectoriser
 from sbilifeco.boundaries.vector_repo import BaseVectorRepo
-from sbilifeco.models.base import Response
+from sbilifeco.models.base import Response, BaseModel
+from sbilifeco.models.vectorisation import VectorisedRecord
+from sbilifeco.user_flows.prompt_template_cache import (
+    PromptTemplateCache,
+    CompiledPrompt,
+)
+from sbilifeco.user_flows.ttl_cache import TTLCache
+from sbilifeco.user_flows.fence_tokenizer import FenceTokenizer
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.listener_dispatcher import ListenerDispatcher
+from sbilifeco.user_flows.context_packer import ContextPacker, estimate_tokens
+from sbilifeco.user_flows.conversation_history import (
+    ConversationHistory,
+    ConversationTurn,
+    HistorySettings,
+)
+from sbilifeco.user_flows.prompt_layout import PromptLayout
+from sbilifeco.user_flows.schema_assembler import SchemaAssembler
+from sbilifeco.user_flows.single_flight import SingleFlight
+from sbilifeco.user_flows.tool_call_loop import (
+    TOOL_CALL_SIGNATURE,
+    ToolCallLoop,
+    ToolLoopOutcome,
+    ToolLoopSettings,
+)
+from sbilifeco.user_flows.stage_metrics import (
+    observe_prompt_tokens,
+    observe_stage,
+    observe_timings,
+)
 from datetime import datetime
 from pprint import pformat
 from io import TextIOBase, RawIOBase, BufferedIOBase
 from time import perf_counter
 from yaml import dump as yaml_dump
 
+T = TypeVar("T")
+
+
+class QueryFlowContext(BaseModel):
+    db_metadata: str
+    is_db_metadata_cached: bool = False
+    master_values: str = "Not defined"
+    last_qa: str = "None"
+    turns: list[ConversationTurn] = []  # The turns rendered into last_qa
+    narrowed_db: DB | None = (
+        None  # Ranked tables and fields, when the schema was narrowed
+    )
+    timings: dict[str, float] = {}
+
+
+class RetrievalSettings(BaseModel):
+    initial_top_k: int = 20  # Hits asked of the vector repo in the first round
+    max_top_k: int = 160  # Rounds double the hits asked for, up to this many
+    min_matches: int = 8  # In-db matches that are enough to stop expanding
+    score_threshold: float = 0.5  # Hits must score above this to count
+
 
 class QueryFlow(IQueryFlow):
     SUFFIX_METADATA = "-metadata"
-    SUFFIX_LAST_QA = "-last-qa"
+    SUFFIX_HISTORY = "-history"
+    SUFFIX_LAST_QA = "-last-qa"  # Legacy single-string history, still cleared
     SUFFIX_MASTER_VALUES = "-master-values"
     PLACEHOLDER_METADATA = "db_metadata"
     PLACEHOLDER_LAST_QA = "last_qa"
@@ -41,9 +103,17 @@ class QueryFlow(IQueryFlow):
     PLACEHOLDER_IS_PII_ALLOWED = "is_pii_allowed"
     PLACEHOLDER_SHOULD_SHOW_THOUGHTS = "should_show_thoughts"
     PLACEHOLDER_TOOLS = "tools_available"
-    TOOL_CALL_SIGNATURE = r"- Tool name:(.*)\n(.*)- Tool input:.*(\{.*\}).*"
+    TOOL_CALL_SIGNATURE = TOOL_CALL_SIGNATURE
     SQL_SIGNATURE = "```sql"
     JSON_SIGNATURE = "```json"
+    GENERIC_PROMPT_KEY = "*"
+    NO_TOOLS_AVAILABLE = "No external tools are available."
+    PREFIX_REQUEST_LABELS = {
+        PLACEHOLDER_TODAY: "Today",
+        PLACEHOLDER_IS_PII_ALLOWED: "PII allowed",
+        PLACEHOLDER_SHOULD_SHOW_THOUGHTS: "Show thoughts",
+    }
+    PREFIX_NARROWED_SCHEMA_LABEL = "Relevant schema"
 
     def __init__(self):
         self._metadata_storage: IMetadataStorage
@@ -55,10 +125,38 @@ class QueryFlow(IQueryFlow):
         ] = {}
         self._external_tool_repo: IExternalToolRepo
         self._external_tools: list[ExternalTool] = []
+        self._tools_available: str = self.NO_TOOLS_AVAILABLE
+        self._tool_refresh_interval_seconds: float = 0.0
+        self._tool_refresh_task: Task[None] | None = None
         self._vectoriser: BaseVectoriser
         self._vector_repo: BaseVectorRepo
         self._is_tool_call_enabled: bool = False
+        self._lookup_timeout_seconds: float = 30.0
+        self._schema_cache = TTLCache[str, str](max_size=32, ttl_seconds=600.0)
+        self._retrieval_cache = TTLCache[
+            tuple[str, str], tuple[list[float], list[VectorisedRecord]]
+        ](max_size=1024, ttl_seconds=600.0)
+        self._schema_assembler = SchemaAssembler()
+        self._context_packer = ContextPacker()
+        self._history = ConversationHistory()
+        self._prompt_layout = PromptLayout()
+        self._is_prefix_prompt_enabled = False
+        self._prompt_token_budget = 0
+        self._prompt_token_budgets_by_db: dict[str, int] = {}
+        self._retrieval_settings = RetrievalSettings()
+        self._retrieval_settings_by_db: dict[str, RetrievalSettings] = {}
+        self._answer_cache = TTLCache[tuple[str, ...], str](
+            max_size=256, ttl_seconds=3600.0
+        )
+        self._batch_concurrency = 4
+        self._single_flight = SingleFlight()
+        self._is_single_flight_enabled = True
+        self._log = FlowLogger()
+        self._prompt_templates = PromptTemplateCache(self._log)
         self.listeners: list[IQueryFlowListener] = []
+        self._listener_dispatcher = ListenerDispatcher(self.listeners, self._log)
+        self._tool_call_loop = ToolCallLoop(self._log)
+        self._background_tasks: set[Task[object]] = set()
 
     def set_metadata_storage(self, metadata_storage: IMetadataStorage) -> QueryFlow:
         self._metadata_storage = metadata_storage
@@ -86,12 +184,14 @@ class QueryFlow(IQueryFlow):
         self, prompt: str | TextIOBase | RawIOBase | BufferedIOBase
     ) -> QueryFlow:
         self._prompt = prompt
+        self._prompt_templates.invalidate(self.GENERIC_PROMPT_KEY)
         return self
 
     def set_prompt_by_db(
         self, db_id: str, prompt: str | TextIOBase | RawIOBase | BufferedIOBase
     ) -> QueryFlow:
         self._prompts_by_db[db_id] = prompt
+        self._prompt_templates.invalidate(db_id)
         return self
 
     def set_external_tool_repo(
@@ -104,23 +204,370 @@ class QueryFlow(IQueryFlow):
         self._is_tool_call_enabled = is_enabled
         return self
 
+    def set_tool_loop_settings(self, settings: ToolLoopSettings) -> QueryFlow:
+        self._tool_call_loop.set_settings(settings)
+        return self
+
+    def set_tool_refresh_interval(self, seconds: float) -> QueryFlow:
+        self._tool_refresh_interval_seconds = seconds
+        return self
+
+    def set_lookup_timeout(self, seconds: float) -> QueryFlow:
+        self._lookup_timeout_seconds = seconds
+        return self
+
+    def set_schema_cache(self, max_size: int, ttl_seconds: float) -> QueryFlow:
+        self._schema_cache.set_max_size(max_size).set_ttl(ttl_seconds)
+        return self
+
+    def set_retrieval_cache(self, max_size: int, ttl_seconds: float) -> QueryFlow:
+        self._retrieval_cache.set_max_size(max_size).set_ttl(ttl_seconds)
+        return self
+
+    def set_retrieval_settings(self, settings: RetrievalSettings) -> QueryFlow:
+        self._retrieval_settings = settings
+        self.invalidate_retrieval()
+        return self
+
+    def set_retrieval_settings_by_db(
+        self, db_id: str, settings: RetrievalSettings
+    ) -> QueryFlow:
+        self._retrieval_settings_by_db[db_id] = settings
+        self.invalidate_retrieval(db_id)
+        return self
+
+    def set_prompt_token_budget(self, max_tokens: int) -> QueryFlow:
+        """Caps the estimated prompt size; 0 leaves it unbounded."""
+        self._prompt_token_budget = max_tokens
+        return self
+
+    def set_prompt_token_budget_by_db(self, db_id: str, max_tokens: int) -> QueryFlow:
+        self._prompt_token_budgets_by_db[db_id] = max_tokens
+        return self
+
+    def set_history_settings(self, settings: HistorySettings) -> QueryFlow:
+        self._history.set_settings(settings)
+        return self
+
+    def set_is_prefix_prompt_enabled(self, is_enabled: bool) -> QueryFlow:
+        self._is_prefix_prompt_enabled = is_enabled
+        return self
+
+    def set_batch_concurrency(self, max_concurrency: int) -> QueryFlow:
+        self._batch_concurrency = max(max_concurrency, 1)
+        return self
+
+    def set_is_single_flight_enabled(self, is_enabled: bool) -> QueryFlow:
+        self._is_single_flight_enabled = is_enabled
+        return self
+
+    def set_answer_cache(self, max_size: int, ttl_seconds: float) -> QueryFlow:
+        self._answer_cache.set_max_size(max_size).set_ttl(ttl_seconds)
+        return self
+
+    def set_log_level(self, level: int | str) -> QueryFlow:
+        self._log.set_level(level)
+        return self
+
+    def set_prompt_log_sample_rate(self, rate: float) -> QueryFlow:
+        self._log.set_prompt_sample_rate(rate)
+        return self
+
+    def set_prompt_dump_dir(self, path: str | None) -> QueryFlow:
+        self._log.set_prompt_dump_dir(path)
+        return self
+
+    def set_listener_dispatch(
+        self,
+        max_queue_size: int,
+        num_workers: int,
+        timeout_seconds: float,
+        overflow_policy: str = ListenerDispatcher.POLICY_DROP_NEWEST,
+    ) -> QueryFlow:
+        (
+            self._listener_dispatcher.set_max_queue_size(max_queue_size)
+            .set_num_workers(num_workers)
+            .set_listener_timeout(timeout_seconds)
+            .set_overflow_policy(overflow_policy)
+        )
+        return self
+
     def add_listener(self, listener: IQueryFlowListener) -> QueryFlow:
         self.listeners.append(listener)
         return self
 
+    @property
+    def prompt_template_stats(self) -> dict[str, int]:
+        return self._prompt_templates.stats
+
+    @property
+    def schema_cache_stats(self) -> dict[str, int]:
+        return self._schema_cache.stats
+
+    @property
+    def listener_dispatch_stats(self) -> dict[str, int]:
+        return self._listener_dispatcher.stats
+
+    async def drain_listeners(self) -> None:
+        """Waits until every queued listener notification has been delivered."""
+        await self._listener_dispatcher.drain()
+
+    def invalidate_schema(self, db_id: str | None = None) -> None:
+        self._schema_cache.invalidate(db_id)
+
+    @property
+    def retrieval_cache_stats(self) -> dict[str, int]:
+        return self._retrieval_cache.stats
+
+    def invalidate_retrieval(self, db_id: str | None = None) -> None:
+        if db_id is None:
+            self._retrieval_cache.invalidate()
+        else:
+            self._retrieval_cache.invalidate_where(lambda key: key[0] == db_id)
+
+    @property
+    def tool_result_cache_stats(self) -> dict[str, int]:
+        return self._tool_call_loop.stats
+
+    @property
+    def single_flight_stats(self) -> dict[str, int]:
+        return self._single_flight.stats
+
+    @property
+    def prompt_prefix_stats(self) -> dict[str, int]:
+        return self._prompt_layout.stats
+
+    @property
+    def answer_cache_stats(self) -> dict[str, int]:
+        return self._answer_cache.stats
+
+    def invalidate_answers(self, db_id: str | None = None) -> None:
+        if db_id is None:
+            self._answer_cache.invalidate()
+        else:
+            self._answer_cache.invalidate_where(lambda key: key[0] == db_id)
+
+    @staticmethod
+    def _normalise_question(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    def _get_prompt_template(self, db_id: str) -> CompiledPrompt:
+        if db_id in self._prompts_by_db:
+            return self._prompt_templates.get(db_id, self._prompts_by_db[db_id])
+        return self._prompt_templates.get(self.GENERIC_PROMPT_KEY, self._prompt)
+
+    def _answer_cache_key(
+        self,
+        db_id: str,
+        question: str,
+        prompt_template: CompiledPrompt,
+        context: QueryFlowContext,
+        today: str,
+        is_pii_allowed: bool,
+        with_thoughts: bool,
+    ) -> tuple[str, ...] | None:
+        # Follow-up questions depend on the conversation so far, hence never shared
+        if context.last_qa != "None":
+            return None
+
+        prompt_inputs = "\0".join(
+            [context.db_metadata, context.master_values, self._tools_available]
+        )
+        return (
+            db_id,
+            self._normalise_question(question),
+            prompt_template.version,
+            sha1(prompt_inputs.encode("utf-8")).hexdigest(),
+            # Relative dates in the question resolve against the date in the prompt
+            today,
+            "pii" if is_pii_allowed else "",
+            "thoughts" if with_thoughts else "",
+        )
+
+    def _pack_context(
+        self,
+        db_id: str,
+        prompt_template: CompiledPrompt,
+        question: str,
+        context: QueryFlowContext,
+    ) -> QueryFlowContext:
+        budget = self._prompt_token_budgets_by_db.get(db_id, self._prompt_token_budget)
+        if budget <= 0:
+            return context
+
+        # Template text, question and tool catalogue are always sent in full
+        mandatory_tokens = (
+            estimate_tokens(prompt_template.template)
+            + estimate_tokens(question)
+            + estimate_tokens(self._tools_available)
+            + 16  # Date and yes/no flags
+        )
+        remaining = budget - mandatory_tokens
+
+        # Schema has the first claim on what is left, then the conversation, then master values
+        if context.narrowed_db is not None:
+            packed_db, used = self._context_packer.pack_db(
+                context.narrowed_db, remaining
+            )
+            if packed_db.tables != context.narrowed_db.tables:
+                db_metadata = self._render_db_for_ask(packed_db)
+                used = estimate_tokens(db_metadata)
+            else:
+                db_metadata = context.db_metadata
+        else:
+            db_metadata, used = self._context_packer.pack_lines(
+                context.db_metadata, remaining
+            )
+        remaining -= used
+
+        turns, used = self._context_packer.pack_turns(
+            context.turns, self._history.format_turn, max(remaining, 0)
+        )
+        last_qa = self._history.render_turns(turns)
+        remaining -= max(used, estimate_tokens(last_qa))
+
+        master_values, used = self._context_packer.pack_lines(
+            context.master_values, max(remaining, 0)
+        )
+        remaining -= used
+
+        if remaining < 0:
+            self._log.warning(
+                f"Prompt for DB ID {db_id} is still over its budget of {budget} tokens",
+                over_by=-remaining,
+            )
+
+        return context.model_copy(
+            update={
+                "db_metadata": db_metadata,
+                "last_qa": last_qa,
+                "turns": turns,
+                "master_values": master_values,
+            }
+        )
+
+    def _render_prompt(
+        self,
+        db_id: str,
+        prompt_template: CompiledPrompt,
+        template_map: dict[str, Any],
+        context: QueryFlowContext,
+    ) -> str:
+        if not self._is_prefix_prompt_enabled:
+            return prompt_template.render(template_map)
+
+        request_labels = dict(self.PREFIX_REQUEST_LABELS)
+        # A schema narrowed to the question changes with every ask, so it follows the prefix
+        if context.narrowed_db is not None:
+            request_labels[self.PLACEHOLDER_METADATA] = (
+                self.PREFIX_NARROWED_SCHEMA_LABEL
+            )
+
+        layered_prompt = self._prompt_layout.build(
+            db_id,
+            prompt_template,
+            template_map,
+            request_labels,
+            self.PLACEHOLDER_LAST_QA,
+            self.PLACEHOLDER_QUESTION,
+            context.turns,
+        )
+        self._log.info(
+            f"Prompt for DB ID {db_id} is laid out for prefix caching",
+            prefix_hash=layered_prompt.prefix_hash,
+            prefix_tokens=estimate_tokens(layered_prompt.prefix),
+        )
+        return layered_prompt.render()
+
+    def _append_turn(
+        self, session_id: str, question: str, answer: str
+    ) -> Awaitable[Response[None]]:
+        return self._session_data_manager.append_session_data(
+            f"{session_id}{self.SUFFIX_HISTORY}",
+            self._history.encode(question, answer, self.SQL_SIGNATURE in answer),
+            self._history.settings.max_turns,
+        )
+
+    async def _fetch_history(self, session_id: str | None) -> Response[list[str]]:
+        if session_id is None:
+            return Response.ok([])
+        return await self._session_data_manager.get_session_data_list(
+            f"{session_id}{self.SUFFIX_HISTORY}", self._history.settings.max_turns
+        )
+
     async def async_init(self) -> None:
+        self._log.start()
+        self._listener_dispatcher.start()
+
         if self._is_tool_call_enabled and self._external_tool_repo is not None:
-            tools = await self._external_tool_repo.fetch_tools()
-            self._external_tools.extend(tools)
+            await self.refresh_tools()
+
+            if self._tool_refresh_interval_seconds > 0:
+                self._tool_refresh_task = create_task(self._refresh_tools_forever())
 
     async def async_shutdown(self) -> None:
-        self._external_tools.clear()
+        if self._tool_refresh_task is not None:
+            self._tool_refresh_task.cancel()
+            try:
+                await self._tool_refresh_task
+            except CancelledError:
+                pass
+            self._tool_refresh_task = None
+
+        self._set_external_tools([])
+        await self._listener_dispatcher.stop()
+        self._log.stop()
+
+    async def refresh_tools(self) -> None:
+        tools = await self._external_tool_repo.fetch_tools()
+        if not tools and self._external_tools:
+            # A failed fetch also comes back empty, so the last good catalogue stays
+            self._log.warning(
+                f"Tool repo returned no tools, keeping the {len(self._external_tools)} known ones"
+            )
+            return
+        if tools != self._external_tools:
+            self._log.info(
+                f"Tool catalogue changed, now {len(tools)} tools are available"
+            )
+            self._set_external_tools(tools)
+
+    async def _refresh_tools_forever(self) -> None:
+        while True:
+            await sleep(self._tool_refresh_interval_seconds)
+            try:
+                await self.refresh_tools()
+            except Exception as e:
+                self._log.warning(f"Could not refresh tool catalogue: {e}")
+
+    def _set_external_tools(self, tools: list[ExternalTool]) -> None:
+        if not tools:
+            tools_available = self.NO_TOOLS_AVAILABLE
+        else:
+            tools_available = "The following external tools are available:\n"
+            for tool in tools:
+                tools_available += f"- Tool name: {tool.name}\n"
+                tools_available += f"  Description: {tool.description}\n"
+                tools_available += "  Parameters:\n"
+                for param in tool.params:
+                    tools_available += (
+                        f"    - Name: {param.name}\n"
+                        f"      Description: {param.description}\n"
+                        f"      Type: {param.type}\n"
+                    )
+
+        # Swapped together, with no await in between, so requests never see a mismatch
+        self._external_tools = list(tools)
+        self._tools_available = tools_available
 
     async def start_session(self) -> Response[str]:
         return Response.ok(uuid4().hex)
 
     async def stop_session(self, session_id: str) -> Response[None]:
         try:
+            await self._session_data_manager.delete_session_data(
+                f"{session_id}{self.SUFFIX_HISTORY}"
+            )
             await self._session_data_manager.delete_session_data(
                 f"{session_id}{self.SUFFIX_LAST_QA}"
             )
@@ -135,6 +582,9 @@ class QueryFlow(IQueryFlow):
 
     async def reset_session(self, session_id: str) -> Response[None]:
         try:
+            await self._session_data_manager.delete_session_data(
+                f"{session_id}{self.SUFFIX_HISTORY}"
+            )
             await self._session_data_manager.delete_session_data(
                 f"{session_id}{self.SUFFIX_LAST_QA}"
             )
@@ -153,563 +603,314 @@ class QueryFlow(IQueryFlow):
         question: str,
         is_pii_allowed: bool = False,
         with_thoughts: bool = False,
+        use_cache: bool = True,
     ) -> Response[str]:
         try:
-            print(f"Fetching cached db metadata for session: {session_id}", flush=True)
-            cached_db_metadata_response = (
-                await self._session_data_manager.get_session_data(
-                    f"{session_id}{self.SUFFIX_METADATA}"
+            time_started = perf_counter()
+            context_response = await self._gather_query_context(dbId, session_id)
+            if not context_response.is_success:
+                await self._listener_dispatcher.dispatch_fail(
+                    session_id, dbId, question, context_response
                 )
+                return Response.fail(context_response.message, context_response.code)
+            if context_response.payload is None:
+                return Response.fail("Context is inexplicably blank", 500)
+            context = context_response.payload
+
+            answer_response = await self._answer_in_context(
+                dbId,
+                session_id,
+                question,
+                context,
+                is_pii_allowed,
+                with_thoughts,
+                use_cache,
+                time_started,
             )
-            if not cached_db_metadata_response.is_success:
-                print(
-                    f"Could not get cached metadata: {cached_db_metadata_response.message}",
-                    flush=True,
-                )
-                for listener in self.listeners:
-                    await listener.on_fail(
-                        session_id, dbId, question, cached_db_metadata_response
-                    )
-                return Response.fail(
-                    cached_db_metadata_response.message,
-                    cached_db_metadata_response.code,
-                )
-            if cached_db_metadata_response.payload is None:
-                return Response.fail("Metadata is inexplicably None", 500)
-            db_metadata = cached_db_metadata_response.payload
+            if not answer_response.is_success or answer_response.payload is None:
+                return answer_response
+            answer = answer_response.payload
 
-            # DB metadata, try cache, otherwise build
-            if db_metadata == "":
-                print("No pre-saved context found, need to generate", flush=True)
-
-                print(f"Building metadata for dbId: {dbId}", flush=True)
-                db_response = await self._metadata_storage.get_db(
-                    dbId,
-                    with_tables=True,
-                    with_fields=True,
-                    with_kpis=True,
-                    with_additional_info=True,
+            # Save updated metadata and last QA
+            if not context.is_db_metadata_cached:
+                self._log.info(f"Caching DB metadata for DB ID {dbId}")
+                await self._session_data_manager.update_session_data(
+                    f"{session_id}{self.SUFFIX_METADATA}", context.db_metadata
                 )
-                if not db_response.is_success:
-                    print(
-                        f"Could not get DB metadata: {db_response.message}", flush=True
-                    )
-                    for listener in self.listeners:
-                        await listener.on_fail(session_id, dbId, question, db_response)
-                    return Response.fail(db_response.message, db_response.code)
-                db = db_response.payload
-                if db is None:
-                    return Response.fail("Metadata is inexplicably blank", 500)
-
-                db_metadata = ""
-                db_metadata += f"Database name: {db.name}\n"
-                if db.description:
-                    db_metadata += f"Database description: {db.description}\n"
-                if db.tables is not None:
-                    for table in db.tables:
-                        db_metadata += f"\tTable name: {table.name}\n"
-                        db_metadata += f"\tTable description: {table.description}\n"
-                        if table.fields is not None:
-                            for field in table.fields:
-                                db_metadata += f"\t\tField name: {field.name}, type: {field.type}\n"
-                                if field.description:
-                                    db_metadata += (
-                                        f"\t\tField description: {field.description}\n"
-                                    )
-                                if field.aka:
-                                    db_metadata += f"\t\tOther names for field '{field.name}': {field.aka}\n"
-                if db.kpis:
-                    db_metadata += "KPIs:\n"
-                    for kpi in db.kpis:
-                        db_metadata += f"\tKPI name: {kpi.name}\n"
-                        db_metadata += f"\tKPI other names: {kpi.aka}\n"
-                        db_metadata += f"\tKPI description: {kpi.description}\n"
-                        db_metadata += f"\tKPI formula: {kpi.formula}\n"
-
-                if db.additional_info:
-                    db_metadata += (
-                        "Also keep in mind the following additional points.\n"
-                        f"{db.additional_info}\n"
-                    )
-            else:
-                print("Pre-saved db metadata found, using it", flush=True)
 
-            # Master values, try cache
-            print(
-                f"Fetching cached master dimension values for DB ID {dbId}", flush=True
+            self._log.info(
+                f"Caching this question and answer for use in the next prompt during session {session_id}"
             )
-            master_values = "Not defined"
-            cached_master_values = await self._session_data_manager.get_session_data(
-                f"{dbId}{self.SUFFIX_MASTER_VALUES}"
-            )
-            if not cached_master_values.is_success:
-                print(
-                    f"Could not get master dimension values due to: {cached_master_values.message}, continuing",
-                    flush=True,
-                )
-            elif not cached_master_values.payload:
-                print("No master dimension values cached, continuing", flush=True)
-            else:
-                try:
-                    cache = loads(cached_master_values.payload)
-                    master_values = pformat(cache, indent=2)
-                except Exception as e:
-                    print(
-                        f"Could not parse master dimension values due to: {e}, continuing",
-                        flush=True,
-                    )
+            await self._append_turn(session_id, question, answer)
 
-            # Last question and answer
-            print(
-                f"Fetching cached last question and answer for session {session_id}",
-                flush=True,
+            return Response.ok(answer.strip())
+        except Exception as e:
+            self._log.error(f"Exception during query flow: {e}")
+            rsp = Response.error(e)
+            await self._listener_dispatcher.dispatch_fail(
+                session_id, dbId, question, rsp
             )
-            cached_last_qa_response = await self._session_data_manager.get_session_data(
-                f"{session_id}{QueryFlow.SUFFIX_LAST_QA}"
+            return rsp
+
+    async def query_batch(
+        self, batch_request: QueryFlowBatchRequest
+    ) -> Response[AsyncIterator[QueryFlowBatchResult]]:
+        try:
+            time_started = perf_counter()
+            db_id = batch_request.db_id
+
+            # Questions in a batch stand alone, so they share one context and keep no history
+            context_response = await self._gather_query_context(db_id, None)
+            if not context_response.is_success:
+                return Response.fail(context_response.message, context_response.code)
+            if context_response.payload is None:
+                return Response.fail("Context is inexplicably blank", 500)
+            context = context_response.payload
+
+            max_concurrency = self._batch_concurrency
+            if batch_request.max_concurrency > 0:
+                max_concurrency = min(batch_request.max_concurrency, max_concurrency)
+            semaphore = Semaphore(max_concurrency)
+            self._log.info(
+                f"Answering a batch of {len(batch_request.questions)} questions for DB ID {db_id}",
+                max_concurrency=max_concurrency,
             )
-            if not cached_last_qa_response.is_success:
-                print(
-                    f"Could not get cached last QA: {cached_last_qa_response.message}",
-                    flush=True,
-                )
-                for listener in self.listeners:
-                    await listener.on_fail(
-                        session_id, dbId, question, cached_last_qa_response
-                    )
-                return Response.fail(
-                    cached_last_qa_response.message, cached_last_qa_response.code
-                )
-            last_qa = cached_last_qa_response.payload or "None"
 
-            # Tool calls available
-            print("Gathering tool call information", flush=True)
-            if not self._external_tools:
-                tools_available = "No external tools are available."
-            else:
-                tools_available = "The following external tools are available:\n"
-                for tool in self._external_tools:
-                    tools_available += f"- Tool name: {tool.name}\n"
-                    tools_available += f"  Description: {tool.description}\n"
-                    tools_available += f"  Parameters:\n"
-                    for param in tool.params:
-                        tools_available += (
-                            f"    - Name: {param.name}\n"
-                            f"      Description: {param.description}\n"
-                            f"      Type: {param.type}\n"
+            async def answer(index: int, question: str) -> QueryFlowBatchResult:
+                session_id = uuid4().hex
+                async with semaphore:
+                    try:
+                        response = await self._answer_in_context(
+                            db_id,
+                            session_id,
+                            question,
+                            context,
+                            batch_request.is_pii_allowed,
+                            batch_request.with_thoughts,
+                            batch_request.use_cache,
+                            time_started,
                         )
-
-            template_map = {
-                self.PLACEHOLDER_METADATA: db_metadata,
-                self.PLACEHOLDER_LAST_QA: last_qa,
-                self.PLACEHOLDER_QUESTION: question,
-                self.PLACEHOLDER_MASTER_VALUES: master_values,
-                self.PLACEHOLDER_TODAY: datetime.now().strftime("%02d %B %Y"),
-                self.PLACEHOLDER_IS_PII_ALLOWED: "Yes" if is_pii_allowed else "No",
-                self.PLACEHOLDER_SHOULD_SHOW_THOUGHTS: "Yes" if with_thoughts else "No",
-                self.PLACEHOLDER_TOOLS: tools_available,
-            }
-
-            # Prompt template
-            print(f"Preparing prompt template for DB ID {dbId}", flush=True)
-            prompt_template: str = ""
-            prompt_source = self._prompts_by_db.get(dbId, self._prompt)
-            if isinstance(prompt_source, str):
-                if prompt_source.startswith("file://"):
-                    print(
-                        f"Prompt template is inside the file {prompt_source}",
-                        flush=True,
-                    )
-                    file_path = prompt_source[7:]
-                    with open(file_path, "r", encoding="utf-8") as prompt_template_file:
-                        prompt_template = prompt_template_file.read()
-                else:
-                    print("Prompt template is a raw string", flush=True)
-                    prompt_template = prompt_source
-            elif isinstance(prompt_source, (RawIOBase, BufferedIOBase)):
-                print(
-                    "Prompt template is an open binary stream, seeking to start",
-                    flush=True,
-                )
-                prompt_source.seek(0)
-                prompt_template = prompt_source.read().decode("utf-8")
-            elif isinstance(prompt_source, TextIOBase):
-                print(
-                    "Prompt template is an open text stream, seeking to start",
-                    flush=True,
+                    except Exception as e:
+                        self._log.error(f"Exception during batch query flow: {e}")
+                        response = Response.error(e)
+                        await self._listener_dispatcher.dispatch_fail(
+                            session_id, db_id, question, response
+                        )
+                if response.is_success and response.payload is not None:
+                    response = Response.ok(response.payload.strip())
+                return QueryFlowBatchResult(
+                    index=index,
+                    session_id=session_id,
+                    question=question,
+                    response=response,
                 )
-                prompt_source.seek(0)
-                prompt_template = prompt_source.read()
-
-            next_full_prompt = prompt_template.format_map(template_map)
-            print(next_full_prompt, flush=True)
-            print(f"Sending {len(next_full_prompt)} characters to LLM", flush=True)
-
-            time_before = perf_counter()
 
-            faux_request_id = uuid4().hex
-            query_response = await self._llm.generate_streamed_reply(
-                faux_request_id, next_full_prompt
-            )
-
-            if not query_response.is_success:
-                print(
-                    f"LLM generate_streamed_reply failed: {query_response.message}",
-                    flush=True,
-                )
-                for listener in self.listeners:
-                    await listener.on_fail(session_id, dbId, question, query_response)
-                return Response.fail(query_response.message, query_response.code)
-            if query_response.payload is None:
-                return Response.fail("LLM did not return a valid answer", 500)
+            async def results_as_completed() -> AsyncIterator[QueryFlowBatchResult]:
+                tasks = [
+                    create_task(answer(index, question))
+                    for index, question in enumerate(batch_request.questions)
+                ]
+                try:
+                    for next_result in as_completed(tasks):
+                        yield await next_result
+                finally:
+                    # The consumer may stop early, e.g. when the client disconnects
+                    for task in tasks:
+                        task.cancel()
+
+            return Response.ok(results_as_completed())
+        except Exception as e:
+            self._log.error(f"Exception during batch query flow: {e}")
+            return Response.error(e)
 
-            time_after = perf_counter()
-            print(
-                f"LLM responded in {time_after - time_before:.2f} seconds with a stream",
-                flush=True,
+    async def _answer_in_context(
+        self,
+        dbId: str,
+        session_id: str,
+        question: str,
+        context: QueryFlowContext,
+        is_pii_allowed: bool,
+        with_thoughts: bool,
+        use_cache: bool,
+        time_started: float,
+    ) -> Response[str]:
+        template_map = {
+            self.PLACEHOLDER_METADATA: context.db_metadata,
+            self.PLACEHOLDER_LAST_QA: context.last_qa,
+            self.PLACEHOLDER_QUESTION: question,
+            self.PLACEHOLDER_MASTER_VALUES: context.master_values,
+            self.PLACEHOLDER_TODAY: datetime.now().strftime("%02d %B %Y"),
+            self.PLACEHOLDER_IS_PII_ALLOWED: "Yes" if is_pii_allowed else "No",
+            self.PLACEHOLDER_SHOULD_SHOW_THOUGHTS: "Yes" if with_thoughts else "No",
+            self.PLACEHOLDER_TOOLS: self._tools_available,
+        }
+
+        # Prompt template
+        self._log.info(f"Preparing prompt template for DB ID {dbId}")
+        prompt_template = self._get_prompt_template(dbId)
+        context = self._pack_context(dbId, prompt_template, question, context)
+        template_map[self.PLACEHOLDER_METADATA] = context.db_metadata
+        template_map[self.PLACEHOLDER_MASTER_VALUES] = context.master_values
+        template_map[self.PLACEHOLDER_LAST_QA] = context.last_qa
+
+        answer_cache_key = self._answer_cache_key(
+            dbId,
+            question,
+            prompt_template,
+            context,
+            template_map[self.PLACEHOLDER_TODAY],
+            is_pii_allowed,
+            with_thoughts,
+        )
+        cached_answer = (
+            self._answer_cache.get(answer_cache_key)
+            if use_cache and answer_cache_key is not None
+            else None
+        )
+        if cached_answer is not None:
+            self._log.info(
+                f"Same question was recently answered for DB ID {dbId}, reusing the answer"
             )
-
-            time_to_answer = time_after - time_before
+            answer = cached_answer
+            time_to_answer = perf_counter() - time_started
+            time_to_stream = 0.0
+        else:
             time_before = perf_counter()
-
-            answer = ""
-            async for chunk in query_response.payload:
-                time_after = perf_counter()
-                print(chunk, end="", flush=True)
-                answer += chunk
-
-            time_after = perf_counter()
-            print(
-                f"\nIt took {time_after - time_before:.2f} seconds to read off the stream",
-                flush=True,
+            next_full_prompt = self._render_prompt(
+                dbId, prompt_template, template_map, context
             )
+            observe_stage("prompt_render", dbId, perf_counter() - time_before)
+            observe_prompt_tokens(dbId, estimate_tokens(next_full_prompt))
 
-            time_to_stream = time_after - time_before
-
-            full_answer = next_full_prompt + "\n\n" + answer + "\n\n"
-
-            tool_call_match = search(self.TOOL_CALL_SIGNATURE, answer)
-            while (
-                self._is_tool_call_enabled and self._external_tools and tool_call_match
-            ):
-                tool_name, _, tool_params = tool_call_match.groups()
-                tool_name = tool_name.strip()
-
-                tool_params = tool_params.strip()
-                tool_params = loads(tool_params)
-
-                print(
-                    f"Invoking tool: {tool_name} with params: {tool_params}\n\n",
-                    flush=True,
-                )
-                tool_response = await self._external_tool_repo.invoke_tool(
-                    tool_name, **tool_params
-                )
-
-                print(f"Tool response: {dumps(tool_response)}\n\n", flush=True)
-
-                next_full_prompt += (
-                    f"Tool answer: {dumps(tool_response)}\n\nProceed\n\n"
-                )
-
-                query_response = await self._llm.generate_reply(next_full_prompt)
-                if not query_response.is_success:
-                    return Response.fail(query_response.message, query_response.code)
-                if query_response.payload is None:
-                    return Response.fail("LLM did not return a valid answer", 500)
-                answer = query_response.payload
-                print(answer, flush=True)
-
-                full_answer += answer + "\n\n"
-
-                tool_call_match = search(self.TOOL_CALL_SIGNATURE, answer)
-
-            # notify listeners about the answer
-            query_flow_answer = QueryFlowAnswer(
-                session_id=session_id,
-                db_id=dbId,
-                question=question,
-                answer=answer,
-                response_time_seconds=time_to_answer + time_to_stream,
+            answer_response = await self._generate_query_answer(
+                dbId, session_id, question, next_full_prompt
             )
-
-            print(
-                "Notifying listeners about the answer to the question in the query flow",
-                flush=True,
+            if not answer_response.is_success:
+                return Response.fail(answer_response.message, answer_response.code)
+            if answer_response.payload is None:
+                return Response.fail("LLM did not return a valid answer", 500)
+            answer, time_to_answer, time_to_stream, is_tool_used = (
+                answer_response.payload
             )
-            for listener in self.listeners:
-                await listener.on_answer(query_flow_answer)
-
-            # Save updated metadata and last QA
-            if not cached_db_metadata_response.payload:
-                print(f"Caching DB metadata for DB ID {dbId}", flush=True)
-                await self._session_data_manager.update_session_data(
-                    f"{session_id}{self.SUFFIX_METADATA}", db_metadata
-                )
 
-            print(
-                f"Caching this question and answer for use in the next prompt during session {session_id}",
-                flush=True,
+            # Answers that relied on tool output may go stale, so only plain ones are kept
+            if answer_cache_key is not None and not is_tool_used:
+                self._answer_cache.put(answer_cache_key, answer)
+
+        # notify listeners about the answer
+        query_flow_answer = QueryFlowAnswer(
+            session_id=session_id,
+            db_id=dbId,
+            question=question,
+            answer=answer,
+            response_time_seconds=time_to_answer + time_to_stream,
+            is_cached=cached_answer is not None,
+        )
+
+        self._log.info(
+            "Notifying listeners about the answer to the question in the query flow"
+        )
+        await self._listener_dispatcher.dispatch_answer(query_flow_answer)
+
+        return Response.ok(answer)
+
+    async def _generate_query_answer(
+        self, dbId: str, session_id: str, question: str, next_full_prompt: str
+    ) -> Response[tuple[str, float, float, bool]]:
+        faux_request_id = uuid4().hex
+        self._log.log_prompt(faux_request_id, next_full_prompt)
+        self._log.info(
+            f"Sending {len(next_full_prompt)} characters to LLM",
+            request_id=faux_request_id,
+            estimated_tokens=estimate_tokens(next_full_prompt),
+        )
+
+        time_before = perf_counter()
+
+        query_response = await self._generate_streamed_reply(
+            faux_request_id, next_full_prompt
+        )
+
+        if not query_response.is_success:
+            self._log.warning(
+                f"LLM generate_streamed_reply failed: {query_response.message}"
             )
-            last_qa_to_cache = ""
-            if self.SQL_SIGNATURE not in answer and last_qa != "None":
-                last_qa_to_cache = f"{last_qa}\n\n"
-            last_qa_to_cache += f"Q: {question}\nA: {answer}\n\n"
-            await self._session_data_manager.update_session_data(
-                f"{session_id}{self.SUFFIX_LAST_QA}", last_qa_to_cache
+            await self._listener_dispatcher.dispatch_fail(
+                session_id, dbId, question, query_response
             )
+            return Response.fail(query_response.message, query_response.code)
+        if query_response.payload is None:
+            return Response.fail("LLM did not return a valid answer", 500)
+
+        time_after = perf_counter()
+        self._log.info(
+            f"LLM responded in {time_after - time_before:.2f} seconds with a stream"
+        )
+
+        time_to_answer = time_after - time_before
+        time_before = perf_counter()
+
+        answer_parts: list[str] = []
+        async for chunk in query_response.payload:
+            if not answer_parts:
+                observe_stage(
+                    "llm_first_token",
+                    dbId,
+                    time_to_answer + perf_counter() - time_before,
+                )
+            answer_parts.append(chunk)
+        answer = "".join(answer_parts)
+        self._log.debug(f"LLM answer:\n{answer}", request_id=faux_request_id)
+
+        time_after = perf_counter()
+        self._log.info(
+            f"It took {time_after - time_before:.2f} seconds to read off the stream"
+        )
+
+        time_to_stream = time_after - time_before
+        observe_stage("llm_stream", dbId, time_to_stream)
+
+        is_tool_used = False
+        if self._is_tool_call_enabled and self._external_tools:
+            outcome = ToolLoopOutcome(answer=answer)
+            async for _ in self._tool_call_loop.follow(
+                dbId,
+                self._external_tool_repo,
+                self._generate_tool_turn,
+                next_full_prompt,
+                outcome,
+            ):
+                pass
+            if outcome.failure is not None:
+                return Response.fail(outcome.failure.message, outcome.failure.code)
+            answer, is_tool_used = outcome.answer, outcome.is_tool_used
 
-            return Response.ok(answer.strip())
-        except Exception as e:
-            print(f"Exception during query flow: {e}", flush=True)
-            rsp = Response.error(e)
-            for listener in self.listeners:
-                await listener.on_fail(session_id, dbId, question, rsp)
-            return rsp
+        return Response.ok((answer, time_to_answer, time_to_stream, is_tool_used))
 
     async def ask(
         self, query_flow_request: QueryFlowRequest
     ) -> Response[AsyncIterator[str]]:
         try:
-            # Initialise an empty metadata that will be filled with relevant info by the similarity search process
-            db = DB(
-                id=query_flow_request.db_id,
-                name=query_flow_request.db_id,
-                description="",
-                tables=[],
-            )
-
-            print("Create a vector from the given question")
-            vector_response = await self._vectoriser.vectorise(
-                uuid4().hex, query_flow_request.question
-            )
-
-            if not vector_response.is_success:
-                print(f"Unable to vectorise question: {vector_response.message}")
-            elif vector_response.payload is None:
-                print("Generated vector is inexplicably empty")
-            else:
-                question_vector = vector_response.payload
-
-                print(
-                    "Fetch items (tables and fields) that are semantically similar to the question from the vector repo"
-                )
-                similarity_response = await self._vector_repo.search_by_vector(
-                    question_vector, num_results=100
-                )
-
-                if not similarity_response.is_success:
-                    print(f"Semantic search failed: {similarity_response.message}")
-                elif similarity_response.payload is None:
-                    print("List of matches is inexplicably empty")
-                else:
-                    similar_records = similarity_response.payload
-                    similar_records = [
-                        record
-                        for record in similar_records
-                        if record.metadata
-                        and record.metadata.source_id == query_flow_request.db_id
-                        and record.score > 0.5
-                    ]
-                    similar_records = sorted(
-                        similar_records,
-                        key=lambda r: r.metadata.source if r.metadata else "",
-                    )
-
-                    if similar_records:
-                        print(
-                            f"Able to narrow down selective tables and fields in DB ID {query_flow_request.db_id} that are relevant to the question. Using only them to build the prompt",
-                            flush=True,
-                        )
-                        for record in similar_records:
-                            source = record.metadata.source if record.metadata else ""
-                            source_parts = source.split("/")
-
-                            assert isinstance(record.document, str)
-
-                            if len(source_parts) == 2:  # db/table
-                                table_from_record = Table.model_validate_json(
-                                    record.document
-                                )
-
-                                assert db.tables is not None
-                                table = next(
-                                    (
-                                        t
-                                        for t in db.tables
-                                        if t.name == table_from_record.name
-                                    ),
-                                    None,
-                                )
-
-                                if not table:
-                                    print(
-                                        f"Table {table_from_record.name} is not yet in the list of tables. Adding it with info from the vector record to be able to include the relevant fields in the prompt",
-                                        flush=True,
-                                    )
-                                    table = table_from_record
-                                    if not table.fields:
-                                        table.fields = []
-                                else:
-                                    print(
-                                        f"Table {table_from_record.name} is already in the list of tables. Updating its description with the one from the vector record to be able to include the relevant fields in the prompt",
-                                        flush=True,
-                                    )
-                                    table.description = table_from_record.description
-
-                                db.tables.append(table)
-                            elif len(source_parts) == 3:  # db/table/field
-                                _, table_name, _ = source_parts
-                                field = Field.model_validate_json(record.document)
-
-                                assert db.tables is not None
-
-                                table = next(
-                                    (t for t in db.tables if t.id == table_name), None
-                                )
-
-                                if table is None:
-                                    print(
-                                        f"Got a relevant field for table {table_name} which is not yet in the list of tables. Adding the table with minimal info to be able to include the field in the prompt",
-                                        flush=True,
-                                    )
-                                    table = Table(
-                                        id=table_name,
-                                        name=table_name,
-                                        description="",
-                                        fields=[field],
-                                    )
-                                    db.tables.append(table)
-
-                                assert table.fields is not None
-
-                                table.fields.append(field)
-
-            if not db.tables:
-                print(
-                    f"Question did not match any narrowed-down tables or fields in DB {query_flow_request.db_id}, so using the entire database metadata for the prompt",
-                    flush=True,
-                )
-
-                db_response = await self._metadata_storage.get_db(
+            time_started = perf_counter()
+            context_response = await self._gather_ask_context(query_flow_request)
+            if not context_response.is_success:
+                await self._listener_dispatcher.dispatch_fail(
+                    query_flow_request.session_id,
                     query_flow_request.db_id,
-                    with_tables=True,
-                    with_fields=True,
-                    with_kpis=True,
-                    with_additional_info=True,
-                )
-                if not db_response.is_success:
-                    print(
-                        f"Could not get DB metadata: {db_response.message}", flush=True
-                    )
-                    for listener in self.listeners:
-                        create_task(
-                            listener.on_fail(
-                                query_flow_request.session_id,
-                                query_flow_request.db_id,
-                                query_flow_request.question,
-                                db_response,
-                            )
-                        )
-                    return Response.fail(db_response.message, db_response.code)
-                db = db_response.payload
-                if db is None:
-                    return Response.fail("Metadata is inexplicably blank", 500)
-
-            print(
-                f"Building metadata for dbId: {query_flow_request.db_id}",
-                flush=True,
-            )
-
-            db_metadata_for_llm = {
-                "name": db.name,
-                "desc": db.description,
-                "tables": [
-                    {
-                        "name": table.name,
-                        "desc": table.description,
-                        "fields": [
-                            f"{field.name} ({field.type}), {field.description}"
-                            for field in (table.fields or [])
-                        ],
-                    }
-                    for table in (db.tables or [])
-                ],
-            }
-            db_metadata = yaml_dump(db_metadata_for_llm, sort_keys=False)
-
-            # Master values, try cache
-            print(
-                f"Fetching cached master dimension values for DB ID {query_flow_request.db_id}",
-                flush=True,
-            )
-            master_values = "Not defined"
-            cached_master_values = await self._session_data_manager.get_session_data(
-                f"{query_flow_request.db_id}{self.SUFFIX_MASTER_VALUES}"
-            )
-            if not cached_master_values.is_success:
-                print(
-                    f"Could not get master dimension values due to: {cached_master_values.message}, continuing",
-                    flush=True,
-                )
-            elif not cached_master_values.payload:
-                print("No master dimension values cached, continuing", flush=True)
-            else:
-                try:
-                    cache = loads(cached_master_values.payload)
-                    master_values = pformat(cache, indent=2)
-                except Exception as e:
-                    print(
-                        f"Could not parse master dimension values due to: {e}, continuing",
-                        flush=True,
-                    )
-
-            # Last question and answer
-            print(
-                f"Fetching cached last question and answer for session {query_flow_request.session_id}",
-                flush=True,
-            )
-            cached_last_qa_response = await self._session_data_manager.get_session_data(
-                f"{query_flow_request.session_id}{QueryFlow.SUFFIX_LAST_QA}"
-            )
-            if not cached_last_qa_response.is_success:
-                print(
-                    f"Could not get cached last QA: {cached_last_qa_response.message}",
-                    flush=True,
-                )
-                for listener in self.listeners:
-                    create_task(
-                        listener.on_fail(
-                            query_flow_request.session_id,
-                            query_flow_request.db_id,
-                            query_flow_request.question,
-                            cached_last_qa_response,
-                        )
-                    )
-                return Response.fail(
-                    cached_last_qa_response.message, cached_last_qa_response.code
+                    query_flow_request.question,
+                    context_response,
                 )
-            last_qa = cached_last_qa_response.payload or "None"
+                return Response.fail(context_response.message, context_response.code)
+            if context_response.payload is None:
+                return Response.fail("Context is inexplicably blank", 500)
+            context = context_response.payload
 
-            # Tool calls available
-            print("Gathering tool call information", flush=True)
-            if not self._external_tools:
-                tools_available = "No external tools are available."
-            else:
-                tools_available = "The following external tools are available:\n"
-                for tool in self._external_tools:
-                    tools_available += f"- Tool name: {tool.name}\n"
-                    tools_available += f"  Description: {tool.description}\n"
-                    tools_available += "  Parameters:\n"
-                    for param in tool.params:
-                        tools_available += (
-                            f"    - Name: {param.name}\n"
-                            f"      Description: {param.description}\n"
-                            f"      Type: {param.type}\n"
-                        )
+            db_metadata = context.db_metadata
+            master_values = context.master_values
 
             template_map = {
                 self.PLACEHOLDER_METADATA: db_metadata,
-                self.PLACEHOLDER_LAST_QA: last_qa,
+                self.PLACEHOLDER_LAST_QA: context.last_qa,
                 self.PLACEHOLDER_QUESTION: query_flow_request.question,
                 self.PLACEHOLDER_MASTER_VALUES: master_values,
                 self.PLACEHOLDER_TODAY: datetime.now().strftime("%02d %B %Y"),
@@ -719,197 +920,667 @@ class QueryFlow(IQueryFlow):
                 self.PLACEHOLDER_SHOULD_SHOW_THOUGHTS: (
                     "Yes" if query_flow_request.with_thoughts else "No"
                 ),
-                self.PLACEHOLDER_TOOLS: tools_available,
+                self.PLACEHOLDER_TOOLS: self._tools_available,
             }
 
             # Prompt template
-            print(
-                f"Preparing prompt template for DB ID {query_flow_request.db_id}",
-                flush=True,
-            )
-            prompt_template: str = ""
-            prompt_source = self._prompts_by_db.get(
-                query_flow_request.db_id, self._prompt
-            )
-            if isinstance(prompt_source, str):
-                if prompt_source.startswith("file://"):
-                    print(
-                        f"Prompt template is inside the file {prompt_source}",
-                        flush=True,
+            self._log.info(
+                f"Preparing prompt template for DB ID {query_flow_request.db_id}"
+            )
+            prompt_template = self._get_prompt_template(query_flow_request.db_id)
+            context = self._pack_context(
+                query_flow_request.db_id,
+                prompt_template,
+                query_flow_request.question,
+                context,
+            )
+            template_map[self.PLACEHOLDER_METADATA] = context.db_metadata
+            template_map[self.PLACEHOLDER_MASTER_VALUES] = context.master_values
+            template_map[self.PLACEHOLDER_LAST_QA] = context.last_qa
+
+            answer_cache_key = self._answer_cache_key(
+                query_flow_request.db_id,
+                query_flow_request.question,
+                prompt_template,
+                context,
+                template_map[self.PLACEHOLDER_TODAY],
+                query_flow_request.is_pii_allowed,
+                query_flow_request.with_thoughts,
+            )
+            if query_flow_request.use_cache and answer_cache_key is not None:
+                cached_answer = self._answer_cache.get(answer_cache_key)
+                if cached_answer is not None:
+                    self._log.info(
+                        f"Same question was recently answered for DB ID {query_flow_request.db_id}, replaying the answer"
+                    )
+                    return Response.ok(
+                        self._replay_answer(
+                            query_flow_request, cached_answer, time_started
+                        )
                     )
-                    file_path = prompt_source[7:]
-                    with open(file_path, "r", encoding="utf-8") as prompt_template_file:
-                        prompt_template = prompt_template_file.read()
-                else:
-                    print("Prompt template is a raw string", flush=True)
-                    prompt_template = prompt_source
-            elif isinstance(prompt_source, (RawIOBase, BufferedIOBase)):
-                print(
-                    "Prompt template is an open binary stream, seeking to start",
-                    flush=True,
-                )
-                prompt_source.seek(0)
-                prompt_template = prompt_source.read().decode("utf-8")
-            elif isinstance(prompt_source, TextIOBase):
-                print(
-                    "Prompt template is an open text stream, seeking to start",
-                    flush=True,
-                )
-                prompt_source.seek(0)
-                prompt_template = prompt_source.read()
 
             # Fully formed prompt
-            next_full_prompt = prompt_template.format_map(template_map)
-            print(next_full_prompt, flush=True)
-
-            with open("./formed_prompt.txt", "w", encoding="utf-8") as f:
-                f.write(next_full_prompt)
+            time_before = perf_counter()
+            next_full_prompt = self._render_prompt(
+                query_flow_request.db_id, prompt_template, template_map, context
+            )
+            observe_stage(
+                "prompt_render", query_flow_request.db_id, perf_counter() - time_before
+            )
+            observe_prompt_tokens(
+                query_flow_request.db_id, estimate_tokens(next_full_prompt)
+            )
+            faux_request_id = uuid4().hex
+            self._log.log_prompt(faux_request_id, next_full_prompt)
 
             # Sending prompt to LLM
-            print(f"Sending {len(next_full_prompt)} characters to LLM", flush=True)
+            self._log.info(
+                f"Sending {len(next_full_prompt)} characters to LLM",
+                request_id=faux_request_id,
+                estimated_tokens=estimate_tokens(next_full_prompt),
+            )
 
             time_before = perf_counter()
 
-            faux_request_id = uuid4().hex
-            query_response = await self._llm.generate_streamed_reply(
+            query_response = await self._generate_streamed_reply(
                 faux_request_id, next_full_prompt
             )
 
             # LLM has responded / failed
             if not query_response.is_success:
-                print(
-                    f"LLM generate_streamed_reply failed: {query_response.message}",
-                    flush=True,
+                self._log.warning(
+                    f"LLM generate_streamed_reply failed: {query_response.message}"
+                )
+                await self._listener_dispatcher.dispatch_fail(
+                    query_flow_request.session_id,
+                    query_flow_request.db_id,
+                    query_flow_request.question,
+                    query_response,
                 )
-                for listener in self.listeners:
-                    create_task(
-                        listener.on_fail(
-                            query_flow_request.session_id,
-                            query_flow_request.db_id,
-                            query_flow_request.question,
-                            query_response,
-                        )
-                    )
                 return Response.fail(query_response.message, query_response.code)
             if query_response.payload is None:
                 return Response.fail("LLM did not return a valid answer", 500)
 
             time_after = perf_counter()
             time_to_answer = time_after - time_before
-            print(
-                f"LLM responded in {time_to_answer:.2f} seconds with a stream",
-                flush=True,
+            self._log.info(
+                f"LLM responded in {time_to_answer:.2f} seconds with a stream"
             )
 
             async def stream_answer(
                 llm_answer: AsyncIterator[str],
             ) -> AsyncIterator[str]:
-                answer = ""
+                outcome = ToolLoopOutcome(answer="")
+                is_first_chunk = True
                 time_before = perf_counter()
 
-                # Incrementally yield answers from the chunks obtained from the response
-                answer_chunk = ""
+                # Incrementally yield answers as soon as each SQL or JSON block is complete
+                fence_tokenizer = FenceTokenizer(
+                    [self.SQL_SIGNATURE, self.JSON_SIGNATURE]
+                )
                 time_to_sql = 0.0
                 time_to_json = 0.0
 
-                sql_location = -1
-                json_location = -1
-                async for chunk in llm_answer:
-                    print(chunk, end="", flush=True)
-                    answer += chunk
-                    answer_chunk += chunk
-                    if sql_location < 0 and self.SQL_SIGNATURE in answer_chunk:
-                        sql_location = answer_chunk.find(self.SQL_SIGNATURE)
-                    elif (
-                        sql_location >= 0 and "```" in answer_chunk[sql_location + 6 :]
-                    ):
-                        time_to_sql = perf_counter() - time_before
-                        print(
-                            f"\nIt took {time_to_sql:.2f} seconds to read the full SQL query from the stream",
-                            flush=True,
-                        )
-
-                        complete_chunk = answer_chunk[:]
-                        delimiter_index = complete_chunk.find("```", sql_location + 6)
-                        sql_location = -1  # Reset
-
-                        yield complete_chunk[: delimiter_index + 3]
-                        answer_chunk = complete_chunk[delimiter_index + 3 :]
-
-                    if json_location < 0 and self.JSON_SIGNATURE in answer_chunk:
-                        json_location = answer_chunk.find(self.JSON_SIGNATURE)
-                    elif (
-                        json_location >= 0
-                        and "```" in answer_chunk[json_location + 7 :]
-                    ):
-                        time_to_json = perf_counter() - time_before
-                        print(
-                            f"\nIt took {time_to_json:.2f} seconds to read the full JSON from the stream",
-                            flush=True,
+                async for chunk in self._with_tool_turns(
+                    query_flow_request.db_id, next_full_prompt, llm_answer, outcome
+                ):
+                    if is_first_chunk:
+                        is_first_chunk = False
+                        observe_stage(
+                            "llm_first_token",
+                            query_flow_request.db_id,
+                            time_to_answer + perf_counter() - time_before,
                         )
 
-                        complete_chunk = answer_chunk[:]
-                        delimiter_index = complete_chunk.find("```", json_location + 7)
-                        json_location = -1  # Reset
-
-                        yield complete_chunk[: delimiter_index + 3]
-                        answer_chunk = complete_chunk[delimiter_index + 3 :]
+                    for complete_chunk, fence in fence_tokenizer.feed(chunk):
+                        if fence == self.SQL_SIGNATURE:
+                            time_to_sql = perf_counter() - time_before
+                            observe_stage(
+                                "llm_sql_block",
+                                query_flow_request.db_id,
+                                time_to_answer + time_to_sql,
+                            )
+                            self._log.info(
+                                f"It took {time_to_sql:.2f} seconds to read the full SQL query from the stream"
+                            )
+                        else:
+                            time_to_json = perf_counter() - time_before
+                            self._log.info(
+                                f"It took {time_to_json:.2f} seconds to read the full JSON from the stream"
+                            )
 
-                yield answer_chunk
+                        yield complete_chunk
 
-                throughput_time = time_to_answer + time_to_sql
-                print(
-                    f"\nTotal time to SQL after firing the question: {throughput_time:.2f} seconds",
-                    flush=True,
+                yield fence_tokenizer.flush()
+                answer = outcome.answer
+                if outcome.failure is not None:
+                    self._log.warning(
+                        f"LLM failed during tool calls: {outcome.failure.message}"
+                    )
+                observe_stage(
+                    "llm_stream", query_flow_request.db_id, perf_counter() - time_before
                 )
+                self._log.debug(f"LLM answer:\n{answer}", request_id=faux_request_id)
 
-                # notify listeners about the answer
-                query_flow_answer = QueryFlowAnswer(
-                    session_id=query_flow_request.session_id,
-                    db_id=query_flow_request.db_id,
-                    question=query_flow_request.question,
-                    answer=answer,
-                    response_time_seconds=throughput_time,
+                throughput_time = time_to_answer + time_to_sql
+                self._log.info(
+                    f"Total time to SQL after firing the question: {throughput_time:.2f} seconds"
                 )
 
-                print(
-                    "Notifying listeners about the answer to the question in the query flow",
-                    flush=True,
-                )
-                for listener in self.listeners:
-                    create_task(listener.on_answer(query_flow_answer))
+                # Answers that relied on tool output may go stale, so only plain ones are kept
+                if answer_cache_key is not None and not outcome.is_tool_used:
+                    self._answer_cache.put(answer_cache_key, answer)
 
-                # Save updated metadata and last QA
-                print(
-                    f"Caching this question and answer for use in the next prompt during session {query_flow_request.session_id}",
-                    flush=True,
-                )
-                last_qa_to_cache = ""
-                if self.SQL_SIGNATURE not in answer and last_qa != "None":
-                    print(
-                        "This question was not answered with a SQL, so including the last Q&A for a more complete context",
-                        flush=True,
-                    )
-                    last_qa_to_cache = f"{last_qa}\n\n"
-                last_qa_to_cache += f"Q: {query_flow_request.question}\nA: {answer}\n\n"
-                create_task(
-                    self._session_data_manager.update_session_data(
-                        f"{query_flow_request.session_id}{self.SUFFIX_LAST_QA}",
-                        last_qa_to_cache,
-                    )
+                await self._on_ask_answered(
+                    query_flow_request, answer, throughput_time, False
                 )
 
             return Response.ok(stream_answer(query_response.payload))
         except Exception as e:
-            print(f"Exception during query flow: {e}", flush=True)
+            self._log.error(f"Exception during query flow: {e}")
             rsp = Response.error(e)
-            for listener in self.listeners:
-                create_task(
-                    listener.on_fail(
-                        query_flow_request.session_id,
-                        query_flow_request.db_id,
-                        query_flow_request.question,
-                        rsp,
-                    )
-                )
+            await self._listener_dispatcher.dispatch_fail(
+                query_flow_request.session_id,
+                query_flow_request.db_id,
+                query_flow_request.question,
+                rsp,
+            )
             return rsp
+
+    async def _with_tool_turns(
+        self,
+        db_id: str,
+        prompt: str,
+        llm_answer: AsyncIterator[str],
+        outcome: ToolLoopOutcome,
+    ) -> AsyncIterator[str]:
+        answer_parts: list[str] = []
+        async for chunk in llm_answer:
+            answer_parts.append(chunk)
+            yield chunk
+        outcome.answer = "".join(answer_parts)
+
+        if self._is_tool_call_enabled and self._external_tools:
+            async for chunk in self._tool_call_loop.follow(
+                db_id,
+                self._external_tool_repo,
+                self._generate_tool_turn,
+                prompt,
+                outcome,
+            ):
+                yield chunk
+
+    def _generate_tool_turn(
+        self, prompt: str
+    ) -> Awaitable[Response[AsyncIterator[str]]]:
+        request_id = uuid4().hex
+        self._log.log_prompt(request_id, prompt)
+        return self._generate_streamed_reply(request_id, prompt)
+
+    async def _generate_streamed_reply(
+        self, request_id: str, prompt: str
+    ) -> Response[AsyncIterator[str]]:
+        if not self._is_single_flight_enabled:
+            return await self._llm.generate_streamed_reply(request_id, prompt)
+
+        response = await self._single_flight.stream(
+            prompt, lambda: self._llm.generate_streamed_reply(request_id, prompt)
+        )
+        self._log.debug("Single-flight LLM calls", **self._single_flight.stats)
+        return response
+
+    async def _replay_answer(
+        self,
+        query_flow_request: QueryFlowRequest,
+        answer: str,
+        time_started: float,
+    ) -> AsyncIterator[str]:
+        # Same segments a live stream would yield, so consumers cannot tell the difference
+        fence_tokenizer = FenceTokenizer([self.SQL_SIGNATURE, self.JSON_SIGNATURE])
+        for complete_chunk, _ in fence_tokenizer.feed(answer):
+            yield complete_chunk
+        yield fence_tokenizer.flush()
+
+        await self._on_ask_answered(
+            query_flow_request,
+            answer,
+            perf_counter() - time_started,
+            True,
+        )
+
+    async def _on_ask_answered(
+        self,
+        query_flow_request: QueryFlowRequest,
+        answer: str,
+        response_time_seconds: float,
+        is_cached: bool,
+    ) -> None:
+        # notify listeners about the answer
+        query_flow_answer = QueryFlowAnswer(
+            session_id=query_flow_request.session_id,
+            db_id=query_flow_request.db_id,
+            question=query_flow_request.question,
+            answer=answer,
+            response_time_seconds=response_time_seconds,
+            is_cached=is_cached,
+        )
+
+        self._log.info(
+            "Notifying listeners about the answer to the question in the query flow"
+        )
+        await self._listener_dispatcher.dispatch_answer(query_flow_answer)
+
+        # Save updated last QA
+        self._log.info(
+            f"Caching this question and answer for use in the next prompt during session {query_flow_request.session_id}"
+        )
+        self._run_in_background(
+            self._append_turn(
+                query_flow_request.session_id, query_flow_request.question, answer
+            )
+        )
+
+    def _run_in_background(self, coroutine: Coroutine[Any, Any, object]) -> None:
+        # Held until done, so the task cannot be garbage collected mid-flight
+        task = create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _lookup(
+        self, name: str, timings: dict[str, float], awaitable: Awaitable[Response[T]]
+    ) -> Response[T]:
+        time_before = perf_counter()
+        try:
+            async with timeout(self._lookup_timeout_seconds):
+                return await awaitable
+        except TimeoutError:
+            message = f"Lookup '{name}' timed out after {self._lookup_timeout_seconds} seconds"
+            self._log.warning(message)
+            return Response.fail(message, 504)
+        except Exception as e:
+            self._log.warning(f"Lookup '{name}' failed: {e}")
+            return Response.error(e)
+        finally:
+            # Repeated lookups, like the widening vector searches, add up to the stage time
+            timings[name] = timings.get(name, 0.0) + perf_counter() - time_before
+
+    def _parse_master_values(self, cached_master_values: Response[str]) -> str:
+        master_values = "Not defined"
+        if not cached_master_values.is_success:
+            self._log.warning(
+                f"Could not get master dimension values due to: {cached_master_values.message}, continuing"
+            )
+        elif not cached_master_values.payload:
+            self._log.info("No master dimension values cached, continuing")
+        else:
+            try:
+                cache = loads(cached_master_values.payload)
+                master_values = pformat(cache, indent=2)
+            except Exception as e:
+                self._log.warning(
+                    f"Could not parse master dimension values due to: {e}, continuing"
+                )
+        return master_values
+
+    async def _gather_query_context(
+        self, db_id: str, session_id: str | None
+    ) -> Response[QueryFlowContext]:
+        self._log.info(
+            f"Fetching db metadata, master dimension values and last question and answer for session {session_id}, DB ID {db_id}"
+        )
+        timings: dict[str, float] = {}
+        time_before = perf_counter()
+
+        metadata_response, cached_master_values, cached_last_qa_response = await gather(
+            self._fetch_query_db_metadata(db_id, session_id, timings),
+            self._lookup(
+                "master_values",
+                timings,
+                self._session_data_manager.get_session_data(
+                    f"{db_id}{self.SUFFIX_MASTER_VALUES}"
+                ),
+            ),
+            self._lookup(
+                "last_qa",
+                timings,
+                self._fetch_history(session_id),
+            ),
+        )
+        timings["context"] = perf_counter() - time_before
+        self._log.info(f"Context lookups took (seconds): {timings}")
+        observe_timings(db_id, timings)
+
+        if not metadata_response.is_success:
+            return Response.fail(metadata_response.message, metadata_response.code)
+        if metadata_response.payload is None:
+            return Response.fail("Metadata is inexplicably None", 500)
+
+        if not cached_last_qa_response.is_success:
+            self._log.warning(
+                f"Could not get cached last QA: {cached_last_qa_response.message}"
+            )
+            return Response.fail(
+                cached_last_qa_response.message, cached_last_qa_response.code
+            )
+        turns = self._history.select(cached_last_qa_response.payload or [])
+
+        db_metadata, is_db_metadata_cached = metadata_response.payload
+        return Response.ok(
+            QueryFlowContext(
+                db_metadata=db_metadata,
+                is_db_metadata_cached=is_db_metadata_cached,
+                master_values=self._parse_master_values(cached_master_values),
+                last_qa=self._history.render_turns(turns),
+                turns=turns,
+                timings=timings,
+            )
+        )
+
+    async def _fetch_query_db_metadata(
+        self, db_id: str, session_id: str | None, timings: dict[str, float]
+    ) -> Response[tuple[str, bool]]:
+        if session_id is not None:
+            self._log.info(f"Fetching cached db metadata for session: {session_id}")
+            cached_db_metadata_response = await self._lookup(
+                "cached_metadata",
+                timings,
+                self._session_data_manager.get_session_data(
+                    f"{session_id}{self.SUFFIX_METADATA}"
+                ),
+            )
+            if not cached_db_metadata_response.is_success:
+                self._log.warning(
+                    f"Could not get cached metadata: {cached_db_metadata_response.message}"
+                )
+                return Response.fail(
+                    cached_db_metadata_response.message,
+                    cached_db_metadata_response.code,
+                )
+            if cached_db_metadata_response.payload is None:
+                return Response.fail("Metadata is inexplicably None", 500)
+
+            if cached_db_metadata_response.payload != "":
+                self._log.info("Pre-saved db metadata found, using it")
+                return Response.ok((cached_db_metadata_response.payload, True))
+
+        # DB metadata not in the session, need to build
+        self._log.info("No pre-saved context found, need to generate")
+        self._log.info(f"Building metadata for dbId: {db_id}")
+        db_response = await self._lookup(
+            "get_db",
+            timings,
+            self._metadata_storage.get_db(
+                db_id,
+                with_tables=True,
+                with_fields=True,
+                with_kpis=True,
+                with_additional_info=True,
+            ),
+        )
+        if not db_response.is_success:
+            self._log.warning(f"Could not get DB metadata: {db_response.message}")
+            return Response.fail(db_response.message, db_response.code)
+        db = db_response.payload
+        if db is None:
+            return Response.fail("Metadata is inexplicably blank", 500)
+
+        lines = [f"Database name: {db.name}"]
+        if db.description:
+            lines.append(f"Database description: {db.description}")
+        if db.tables is not None:
+            for table in db.tables:
+                lines.append(f"\tTable name: {table.name}")
+                lines.append(f"\tTable description: {table.description}")
+                if table.fields is not None:
+                    for field in table.fields:
+                        lines.append(
+                            f"\t\tField name: {field.name}, type: {field.type}"
+                        )
+                        if field.description:
+                            lines.append(f"\t\tField description: {field.description}")
+                        if field.aka:
+                            lines.append(
+                                f"\t\tOther names for field '{field.name}': {field.aka}"
+                            )
+        if db.kpis:
+            lines.append("KPIs:")
+            for kpi in db.kpis:
+                lines.append(f"\tKPI name: {kpi.name}")
+                lines.append(f"\tKPI other names: {kpi.aka}")
+                lines.append(f"\tKPI description: {kpi.description}")
+                lines.append(f"\tKPI formula: {kpi.formula}")
+
+        if db.additional_info:
+            lines.append("Also keep in mind the following additional points.")
+            lines.append(db.additional_info)
+
+        db_metadata = "\n".join(lines) + "\n"
+
+        return Response.ok((db_metadata, False))
+
+    async def _gather_ask_context(
+        self, query_flow_request: QueryFlowRequest
+    ) -> Response[QueryFlowContext]:
+        self._log.info(
+            f"Fetching relevant db metadata, master dimension values and last question and answer for session {query_flow_request.session_id}, DB ID {query_flow_request.db_id}"
+        )
+        timings: dict[str, float] = {}
+        time_before = perf_counter()
+
+        db_metadata_response, cached_master_values, cached_last_qa_response = (
+            await gather(
+                self._fetch_ask_db_metadata(query_flow_request, timings),
+                self._lookup(
+                    "master_values",
+                    timings,
+                    self._session_data_manager.get_session_data(
+                        f"{query_flow_request.db_id}{self.SUFFIX_MASTER_VALUES}"
+                    ),
+                ),
+                self._lookup(
+                    "last_qa",
+                    timings,
+                    self._fetch_history(query_flow_request.session_id),
+                ),
+            )
+        )
+        timings["context"] = perf_counter() - time_before
+        self._log.info(f"Context lookups took (seconds): {timings}")
+        observe_timings(query_flow_request.db_id, timings)
+
+        if not db_metadata_response.is_success:
+            return Response.fail(
+                db_metadata_response.message, db_metadata_response.code
+            )
+        if db_metadata_response.payload is None:
+            return Response.fail("Metadata is inexplicably blank", 500)
+
+        if not cached_last_qa_response.is_success:
+            self._log.warning(
+                f"Could not get cached last QA: {cached_last_qa_response.message}"
+            )
+            return Response.fail(
+                cached_last_qa_response.message, cached_last_qa_response.code
+            )
+        turns = self._history.select(cached_last_qa_response.payload or [])
+
+        return Response.ok(
+            QueryFlowContext(
+                db_metadata=db_metadata_response.payload[0],
+                narrowed_db=db_metadata_response.payload[1],
+                master_values=self._parse_master_values(cached_master_values),
+                last_qa=self._history.render_turns(turns),
+                turns=turns,
+                timings=timings,
+            )
+        )
+
+    async def _fetch_ask_db_metadata(
+        self, query_flow_request: QueryFlowRequest, timings: dict[str, float]
+    ) -> Response[tuple[str, DB | None]]:
+        # Initialise an empty metadata that will be filled with relevant info by the similarity search process
+        db = DB(
+            id=query_flow_request.db_id,
+            name=query_flow_request.db_id,
+            description="",
+            tables=[],
+        )
+
+        similar_records = await self._fetch_similar_records(query_flow_request, timings)
+        if similar_records:
+            self._narrow_db(db, similar_records)
+
+        if db.tables:
+            return Response.ok((self._render_db_for_ask(db), db))
+
+        self._log.info(
+            f"Question did not match any narrowed-down tables or fields in DB {query_flow_request.db_id}, so using the entire database metadata for the prompt"
+        )
+        full_schema_response = await self._fetch_full_schema_metadata(
+            query_flow_request.db_id, timings
+        )
+        if not full_schema_response.is_success:
+            return Response.fail(
+                full_schema_response.message, full_schema_response.code
+            )
+        if full_schema_response.payload is None:
+            return Response.fail("Metadata is inexplicably blank", 500)
+        return Response.ok((full_schema_response.payload, None))
+
+    async def _fetch_similar_records(
+        self, query_flow_request: QueryFlowRequest, timings: dict[str, float]
+    ) -> list[VectorisedRecord] | None:
+        cache_key = (
+            query_flow_request.db_id,
+            self._normalise_question(query_flow_request.question),
+        )
+        cached_retrieval = self._retrieval_cache.get(cache_key)
+        if cached_retrieval is not None:
+            self._log.info(
+                "Question was recently vectorised and searched, reusing the results"
+            )
+            _, similar_records = cached_retrieval
+            return similar_records
+
+        self._log.info("Create a vector from the given question")
+        vector_response = await self._lookup(
+            "vectorise",
+            timings,
+            self._vectoriser.vectorise(uuid4().hex, query_flow_request.question),
+        )
+
+        if not vector_response.is_success:
+            self._log.warning(
+                f"Unable to vectorise question: {vector_response.message}"
+            )
+            return None
+        elif vector_response.payload is None:
+            self._log.warning("Generated vector is inexplicably empty")
+            return None
+        question_vector = vector_response.payload
+
+        self._log.info(
+            "Fetch items (tables and fields) that are semantically similar to the question from the vector repo"
+        )
+        settings = self._retrieval_settings_by_db.get(
+            query_flow_request.db_id, self._retrieval_settings
+        )
+        top_k = settings.initial_top_k
+        while True:
+            similarity_response = await self._lookup(
+                "vector_search",
+                timings,
+                self._vector_repo.search_by_vector(question_vector, num_results=top_k),
+            )
+
+            if not similarity_response.is_success:
+                self._log.warning(
+                    f"Semantic search failed: {similarity_response.message}"
+                )
+                return None
+            elif similarity_response.payload is None:
+                self._log.warning("List of matches is inexplicably empty")
+                return None
+            hits = similarity_response.payload
+
+            similar_records = [
+                record
+                for record in hits
+                if record.metadata
+                and record.metadata.source_id == query_flow_request.db_id
+                and record.score > settings.score_threshold
+            ]
+
+            # Hits come ranked, so a short page or a weak last hit means asking for more cannot help
+            if (
+                len(similar_records) >= settings.min_matches
+                or len(hits) < top_k
+                or hits[-1].score <= settings.score_threshold
+                or top_k >= settings.max_top_k
+            ):
+                break
+
+            top_k = min(top_k * 2, settings.max_top_k)
+            self._log.info(
+                f"Only {len(similar_records)} matches in DB {query_flow_request.db_id}, searching again for {top_k} hits"
+            )
+
+        self._retrieval_cache.put(cache_key, (question_vector, similar_records))
+        return similar_records
+
+    async def _fetch_full_schema_metadata(
+        self, db_id: str, timings: dict[str, float]
+    ) -> Response[str]:
+        cached_db_metadata = self._schema_cache.get(db_id)
+        if cached_db_metadata is not None:
+            self._log.info(f"Using cached full schema metadata for DB ID {db_id}")
+            return Response.ok(cached_db_metadata)
+
+        db_response = await self._lookup(
+            "get_db",
+            timings,
+            self._metadata_storage.get_db(
+                db_id,
+                with_tables=True,
+                with_fields=True,
+                with_kpis=True,
+                with_additional_info=True,
+            ),
+        )
+        if not db_response.is_success:
+            self._log.warning(f"Could not get DB metadata: {db_response.message}")
+            return Response.fail(db_response.message, db_response.code)
+        if db_response.payload is None:
+            return Response.fail("Metadata is inexplicably blank", 500)
+
+        db_metadata = self._render_db_for_ask(db_response.payload)
+        self._schema_cache.put(db_id, db_metadata)
+        return Response.ok(db_metadata)
+
+    def _render_db_for_ask(self, db: DB) -> str:
+        self._log.info(f"Building metadata for dbId: {db.id}")
+        db_metadata_for_llm = {
+            "name": db.name,
+            "desc": db.description,
+            "tables": [
+                {
+                    "name": table.name,
+                    "desc": table.description,
+                    "fields": [
+                        f"{field.name} ({field.type}), {field.description}"
+                        for field in (table.fields or [])
+                    ],
+                }
+                for table in (db.tables or [])
+            ],
+        }
+        return yaml_dump(db_metadata_for_llm, sort_keys=False)
+
+    def _narrow_db(self, db: DB, similar_records: Sequence[VectorisedRecord]) -> None:
+        if not similar_records:
+            return
+
+        self._log.info(
+            f"Able to narrow down selective tables and fields in DB ID {db.id} that are relevant to the question. Using only them to build the prompt"
+        )
+        self._schema_assembler.assemble(db, similar_records)
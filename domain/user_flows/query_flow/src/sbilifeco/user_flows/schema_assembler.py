@@ -0,0 +1,83 @@
+from __future__ import annotations
+from collections.abc import Sequence
+from sbilifeco.boundaries.metadata_storage import DB, Table, Field
+from sbilifeco.models.vectorisation import VectorisedRecord
+from sbilifeco.user_flows.ttl_cache import TTLCache
+
+
+class SchemaAssembler:
+    """Builds the narrowed-down schema for a question from similarity search records.
+
+    Records are grouped by the table id in their source path (db/table or db/table/field)
+    in a single pass. Tables and fields are de-duplicated, and decoded documents are cached,
+    since the same schema records come back for many questions.
+    """
+
+    def __init__(self, max_documents: int = 4096, ttl_seconds: float = 3600.0) -> None:
+        self._tables = TTLCache[str, Table](max_documents, ttl_seconds)
+        self._fields = TTLCache[str, Field](max_documents, ttl_seconds)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        table_stats, field_stats = self._tables.stats, self._fields.stats
+        return {key: table_stats[key] + field_stats[key] for key in table_stats}
+
+    def assemble(self, db: DB, records: Sequence[VectorisedRecord]) -> None:
+        tables: dict[str, Table] = {table.id: table for table in db.tables or []}
+        field_keys: dict[str, set[str]] = {
+            table_id: {field.id or field.name for field in table.fields or []}
+            for table_id, table in tables.items()
+        }
+
+        for record in records:
+            if record.metadata is None or not isinstance(record.document, str):
+                continue
+
+            source_parts = record.metadata.source.split("/")
+            if len(source_parts) == 2:  # db/table
+                _, table_id = source_parts
+                table_from_record = self._decode_table(record.document)
+
+                table = tables.get(table_id)
+                if table is None:
+                    tables[table_id] = table_from_record.model_copy(
+                        update={"id": table_id, "fields": []}
+                    )
+                    field_keys[table_id] = set()
+                else:
+                    # The table may have been added with minimal info for one of its fields
+                    table.name = table_from_record.name
+                    table.description = table_from_record.description
+            elif len(source_parts) == 3:  # db/table/field
+                _, table_id, _ = source_parts
+                field = self._decode_field(record.document)
+
+                table = tables.get(table_id)
+                if table is None:
+                    table = Table(id=table_id, name=table_id, description="", fields=[])
+                    tables[table_id] = table
+                    field_keys[table_id] = set()
+
+                field_key = field.id or field.name
+                if field_key not in field_keys[table_id]:
+                    field_keys[table_id].add(field_key)
+                    if table.fields is None:
+                        table.fields = []
+                    # The decoded field is cached, each DB gets its own copy to change
+                    table.fields.append(field.model_copy())
+
+        db.tables = list(tables.values())
+
+    def _decode_table(self, document: str) -> Table:
+        table = self._tables.get(document)
+        if table is None:
+            table = Table.model_validate_json(document)
+            self._tables.put(document, table)
+        return table
+
+    def _decode_field(self, document: str) -> Field:
+        field = self._fields.get(document)
+        if field is None:
+            field = Field.model_validate_json(document)
+            self._fields.put(document, field)
+        return field
@@ -0,0 +1,148 @@
+from __future__ import annotations
+from asyncio import CancelledError, Event, Task, create_task, current_task, shield
+from collections.abc import AsyncIterator, Awaitable, Callable
+from hashlib import sha1
+from sbilifeco.models.base import Response
+
+StreamStarter = Callable[[], Awaitable[Response[AsyncIterator[str]]]]
+
+
+class SharedStream:
+    """Reads a stream once and lets any number of subscribers read it, each from the start.
+
+    When the last subscriber goes away before the end, the source is closed, so the
+    LLM stops generating an answer that no one will read.
+    """
+
+    def __init__(self, source: AsyncIterator[str]) -> None:
+        self._source = source
+        self._chunks: list[str] = []
+        self._error: BaseException | None = None
+        self._is_done = False
+        self._is_abandoned = False
+        self._subscribers = 0
+        self._new_chunk = Event()
+        self._pump_task: Task[None] = create_task(self._pump())
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        self._pump_task.add_done_callback(lambda _: callback())
+
+    def subscribe(self) -> AsyncIterator[str] | None:
+        """None when every earlier subscriber has gone and the source was closed."""
+        if self._is_abandoned:
+            return None
+        self._subscribers += 1
+        return self._read()
+
+    async def _read(self) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                while index < len(self._chunks):
+                    yield self._chunks[index]
+                    index += 1
+                if self._is_done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                await self._new_chunk.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0 and not self._is_done:
+                self._is_abandoned = True
+                self._pump_task.cancel()
+
+    async def _pump(self) -> None:
+        try:
+            async for chunk in self._source:
+                self._chunks.append(chunk)
+                self._wake_subscribers()
+        except CancelledError:
+            # Anyone still reading must not take the chunks so far for the whole answer
+            self._error = RuntimeError("LLM stream was cancelled before it ended")
+            aclose = getattr(self._source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._is_done = True
+            self._wake_subscribers()
+
+    def _wake_subscribers(self) -> None:
+        new_chunk, self._new_chunk = self._new_chunk, Event()
+        new_chunk.set()
+
+
+class SingleFlight:
+    """Coalesces identical LLM prompts that are in flight at the same time.
+
+    The first caller starts the generation, later callers with the same prompt
+    subscribe to its stream and get the chunks produced so far replayed. The
+    prompt is forgotten as soon as its stream ends, so nothing is cached.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, Task[Response[SharedStream]]] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+    async def stream(
+        self, prompt: str, start: StreamStarter
+    ) -> Response[AsyncIterator[str]]:
+        key = self._key(prompt)
+        while True:
+            flight = self._in_flight.get(key)
+            if flight is None:
+                self.started += 1
+                flight = create_task(self._start(key, start))
+                self._in_flight[key] = flight
+            else:
+                self.coalesced += 1
+
+            # Shielded, so one caller giving up does not cancel the generation for the others
+            response = await shield(flight)
+            if not response.is_success:
+                return Response.fail(response.message, response.code)
+            if response.payload is None:
+                return Response.fail("LLM did not return a valid answer", 500)
+
+            subscription = response.payload.subscribe()
+            if subscription is not None:
+                return Response.ok(subscription)
+            # Everyone else gave up on that generation and it was stopped, start another
+            self._forget(key, flight)
+
+    async def _start(self, key: str, start: StreamStarter) -> Response[SharedStream]:
+        flight = current_task()
+        try:
+            response = await start()
+        except Exception as e:
+            response = Response.error(e)
+
+        if not response.is_success or response.payload is None:
+            self._forget(key, flight)
+            if response.is_success:
+                return Response.fail("LLM did not return a valid answer", 500)
+            return Response.fail(response.message, response.code)
+
+        shared_stream = SharedStream(response.payload)
+        shared_stream.add_done_callback(lambda: self._forget(key, flight))
+        return Response.ok(shared_stream)
+
+    def _forget(self, key: str, flight: Task[Response[SharedStream]] | None) -> None:
+        # A newer flight for the same prompt may have taken the key already
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    def _key(self, prompt: str) -> str:
+        return sha1(prompt.encode("utf-8")).hexdigest()
@@ -0,0 +1,30 @@
+from __future__ import annotations
+from collections.abc import Mapping
+from prometheus_client import Histogram
+
+STAGE_SECONDS = Histogram(
+    "query_flow_stage_seconds",
+    "Time spent in each stage of the query flow",
+    ["stage", "db_id"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+
+PROMPT_TOKENS = Histogram(
+    "query_flow_prompt_tokens",
+    "Estimated size of the prompt sent to the LLM, in tokens",
+    ["db_id"],
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+
+
+def observe_stage(stage: str, db_id: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=stage, db_id=db_id).observe(seconds)
+
+
+def observe_timings(db_id: str, timings: Mapping[str, float]) -> None:
+    for stage, seconds in timings.items():
+        observe_stage(stage, db_id, seconds)
+
+
+def observe_prompt_tokens(db_id: str, tokens: int) -> None:
+    PROMPT_TOKENS.labels(db_id=db_id).observe(tokens)
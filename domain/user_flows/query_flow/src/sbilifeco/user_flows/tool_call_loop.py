@@ -0,0 +1,172 @@
+from __future__ import annotations
+from asyncio import gather, timeout
+from collections.abc import AsyncIterator, Awaitable, Callable
+from json import JSONDecodeError, dumps, loads
+from re import finditer
+from time import perf_counter
+from typing import Any
+from pydantic import BaseModel
+from sbilifeco.boundaries.tool_support import IExternalToolRepo
+from sbilifeco.models.base import Response
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.stage_metrics import observe_stage
+from sbilifeco.user_flows.ttl_cache import TTLCache
+
+StreamGenerator = Callable[[str], Awaitable[Response[AsyncIterator[str]]]]
+
+TOOL_CALL_SIGNATURE = r"- Tool name:(.*)\n(.*)- Tool input:.*(\{.*\}).*"
+
+
+class ToolCall(BaseModel):
+    name: str
+    params: dict[str, Any]
+
+    @property
+    def cache_key(self) -> tuple[str, str]:
+        return self.name, dumps(self.params, sort_keys=True, separators=(",", ":"))
+
+
+class ToolLoopSettings(BaseModel):
+    max_iterations: int = 5  # LLM turns that may follow tool calls
+    time_budget_seconds: float = 120.0  # No new turn is started after this long
+    tool_timeout_seconds: float = 30.0
+    result_cache_size: int = 256
+    result_cache_ttl_seconds: float = 300.0
+
+
+class ToolLoopOutcome(BaseModel):
+    answer: str
+    is_tool_used: bool = False
+    iterations: int = 0
+    failure: Response | None = None
+
+
+class ToolCallLoop:
+    """Runs the tool calls in an LLM answer and streams the turns that follow, until one calls no tools.
+
+    All calls in one answer are invoked together, since the LLM wrote them before seeing
+    any of the results. Results are cached by tool name and canonical arguments.
+    """
+
+    def __init__(self, log: FlowLogger) -> None:
+        self._log = log
+        self.settings = ToolLoopSettings()
+        self._results = TTLCache[tuple[str, str], str](
+            self.settings.result_cache_size, self.settings.result_cache_ttl_seconds
+        )
+
+    def set_settings(self, settings: ToolLoopSettings) -> ToolCallLoop:
+        self.settings = settings
+        self._results.set_max_size(settings.result_cache_size).set_ttl(
+            settings.result_cache_ttl_seconds
+        )
+        return self
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return self._results.stats
+
+    def invalidate(self) -> None:
+        self._results.invalidate()
+
+    def extract_tool_calls(self, answer: str) -> list[ToolCall]:
+        tool_calls: list[ToolCall] = []
+        for match in finditer(TOOL_CALL_SIGNATURE, answer):
+            tool_name, _, tool_params = match.groups()
+            try:
+                params = loads(tool_params.strip())
+            except JSONDecodeError as e:
+                self._log.warning(f"Skipping tool call with unreadable input: {e}")
+                continue
+            if not isinstance(params, dict):
+                continue
+
+            tool_call = ToolCall(name=tool_name.strip(), params=params)
+            if tool_call not in tool_calls:
+                tool_calls.append(tool_call)
+        return tool_calls
+
+    async def follow(
+        self,
+        db_id: str,
+        tool_repo: IExternalToolRepo,
+        generate: StreamGenerator,
+        prompt: str,
+        outcome: ToolLoopOutcome,
+    ) -> AsyncIterator[str]:
+        """Yields the chunks of each follow-up turn. The last turn's answer ends up in `outcome`."""
+        deadline = perf_counter() + self.settings.time_budget_seconds
+        tool_calls = self.extract_tool_calls(outcome.answer)
+
+        while tool_calls:
+            if outcome.iterations >= self.settings.max_iterations:
+                self._log.warning(
+                    f"Stopping tool calls after {outcome.iterations} iterations"
+                )
+                return
+            if perf_counter() >= deadline:
+                self._log.warning(
+                    f"Stopping tool calls after {self.settings.time_budget_seconds} seconds"
+                )
+                return
+            outcome.iterations += 1
+
+            tool_answers = await gather(
+                *[self._invoke(db_id, tool_repo, tool_call) for tool_call in tool_calls]
+            )
+            outcome.is_tool_used = True
+
+            prompt += f"{outcome.answer}\n\n"
+            for tool_call, tool_answer in zip(tool_calls, tool_answers):
+                prompt += f"Tool answer ({tool_call.name}): {tool_answer}\n\n"
+            prompt += "Proceed\n\n"
+
+            time_before = perf_counter()
+            reply_response = await generate(prompt)
+            if not reply_response.is_success or reply_response.payload is None:
+                outcome.failure = (
+                    reply_response
+                    if not reply_response.is_success
+                    else Response.fail("LLM did not return a valid answer", 500)
+                )
+                return
+
+            answer_parts: list[str] = []
+            async for chunk in reply_response.payload:
+                answer_parts.append(chunk)
+                yield chunk
+            outcome.answer = "".join(answer_parts)
+            observe_stage("llm_tool_turn", db_id, perf_counter() - time_before)
+
+            tool_calls = self.extract_tool_calls(outcome.answer)
+
+    async def _invoke(
+        self, db_id: str, tool_repo: IExternalToolRepo, tool_call: ToolCall
+    ) -> str:
+        cached_answer = self._results.get(tool_call.cache_key)
+        if cached_answer is not None:
+            self._log.info(f"Reusing recent result of tool {tool_call.name}")
+            return cached_answer
+
+        self._log.info(
+            f"Invoking tool: {tool_call.name} with params: {tool_call.params}"
+        )
+        time_before = perf_counter()
+        try:
+            async with timeout(self.settings.tool_timeout_seconds):
+                tool_response = await tool_repo.invoke_tool(
+                    tool_call.name, **tool_call.params
+                )
+        except Exception as e:
+            # Reported back to the LLM, which may try another way, but never cached
+            self._log.warning(f"Tool {tool_call.name} failed: {e!r}")
+            return dumps({"error": f"Tool call failed: {e!r}"})
+        finally:
+            observe_stage("tool_call", db_id, perf_counter() - time_before)
+
+        tool_answer = dumps(tool_response)
+        self._log.info(f"Tool response: {tool_answer}")
+        # Tool repos report failures as empty or error results rather than raising
+        if tool_response and "error" not in tool_response:
+            self._results.put(tool_call.cache_key, tool_answer)
+        return tool_answer
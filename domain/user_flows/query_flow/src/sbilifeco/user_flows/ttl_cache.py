@@ -0,0 +1,77 @@
+from __future__ import annotations
+from collections import OrderedDict
+from collections.abc import Callable
+from time import monotonic
+
+
+class TTLCache[K, V]:
+    """A size-bounded LRU cache whose entries also expire after a fixed time."""
+
+    def __init__(self, max_size: int = 128, ttl_seconds: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def set_max_size(self, max_size: int) -> TTLCache[K, V]:
+        self.max_size = max_size
+        self._evict()
+        return self
+
+    def set_ttl(self, ttl_seconds: float) -> TTLCache[K, V]:
+        self.ttl_seconds = ttl_seconds
+        return self
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: K, count: bool = True) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None or not self.max_size:
+            if count:
+                self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= monotonic():
+            del self._entries[key]
+            if count:
+                self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        if not self.max_size:
+            return
+
+        self._entries[key] = (monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def invalidate(self, key: K | None = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[K], bool]) -> int:
+        stale_keys = [key for key in self._entries if predicate(key)]
+        for key in stale_keys:
+            del self._entries[key]
+        return len(stale_keys)
+
+    def _evict(self) -> None:
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
@@ -0,0 +1,85 @@
+import sys
+
+sys.path.append("./src")
+
+from unittest import TestCase
+
+from sbilifeco.boundaries.metadata_storage import DB, Table, Field
+from sbilifeco.user_flows.context_packer import ContextPacker, estimate_tokens
+from sbilifeco.user_flows.conversation_history import (
+    ConversationHistory,
+    ConversationTurn,
+    HistorySettings,
+)
+
+
+class ContextPackerTest(TestCase):
+    def setUp(self) -> None:
+        self.packer = ContextPacker()
+
+    def test_pack_db_keeps_best_ranked(self) -> None:
+        # Arrange
+        db = DB(
+            id="hr",
+            name="hr",
+            tables=[
+                Table(
+                    id=f"table_{t}",
+                    name=f"table_{t}",
+                    description="x" * 40,
+                    fields=[
+                        Field(id=f"field_{f}", name=f"field_{f}", description="y" * 40)
+                        for f in range(5)
+                    ],
+                )
+                for t in range(5)
+            ],
+        )
+
+        # Act
+        packed, used = self.packer.pack_db(db, 150)
+
+        # Assert
+        # Tables and fields are kept in rank order, and the original is untouched
+        assert packed.tables is not None
+        self.assertLessEqual(used, 150)
+        self.assertEqual(packed.tables[0].id, "table_0")
+        self.assertEqual(len(packed.tables[0].fields or []), 5)
+        self.assertLess(len(packed.tables), 5)
+        self.assertEqual(len(db.tables or []), 5)
+
+    def test_pack_turns_keeps_recent_turns(self) -> None:
+        # Arrange
+        history = ConversationHistory().set_settings(
+            HistorySettings(turn_template="User asked: {question}\nWe said: {answer}\n")
+        )
+        turns = [
+            ConversationTurn(question=f"question {i}?", answer="answer " * 10)
+            for i in range(10)
+        ]
+        turn_tokens = estimate_tokens(history.format_turn(turns[0]))
+
+        # Act
+        packed, used = self.packer.pack_turns(
+            turns, history.format_turn, turn_tokens * 3
+        )
+
+        # Assert
+        # Turns are costed one by one in whatever template renders them
+        self.assertEqual(packed, turns[-3:])
+        self.assertEqual(used, turn_tokens * 3)
+        self.assertEqual(self.packer.pack_turns(turns, history.format_turn, 5), ([], 0))
+
+    def test_pack_lines(self) -> None:
+        # Arrange
+        text = "\n".join(f"line {i}: {'z' * 30}" for i in range(50))
+
+        # Act
+        fitting, _ = self.packer.pack_lines(text, 10_000)
+        packed, used = self.packer.pack_lines(text, 50)
+
+        # Assert
+        self.assertEqual(fitting, text)
+        self.assertLessEqual(used, 50)
+        self.assertTrue(packed.startswith("line 0: "))
+        self.assertTrue(packed.endswith(ContextPacker.TRUNCATION_NOTE))
@@ -0,0 +1,64 @@
+import sys
+
+sys.path.append("./src")
+
+from unittest import TestCase
+
+from sbilifeco.user_flows.context_packer import estimate_tokens
+from sbilifeco.user_flows.conversation_history import (
+    ConversationHistory,
+    HistorySettings,
+)
+
+
+class ConversationHistoryTest(TestCase):
+    def setUp(self) -> None:
+        self.history = ConversationHistory()
+
+    def test_render_since_last_sql(self) -> None:
+        # Arrange
+        items = [
+            self.history.encode("first?", "no idea", False),
+            self.history.encode("second?", "```sql\nselect 1;\n```", True),
+            self.history.encode("third?", "it is one", False),
+        ]
+
+        # Act
+        rendered = self.history.render(items)
+
+        # Assert
+        # Turns before the latest SQL answer are dropped, later ones kept in order
+        self.assertNotIn("first?", rendered)
+        self.assertLess(rendered.index("second?"), rendered.index("third?"))
+        self.assertTrue(rendered.startswith("Q: second?\nA: ```sql"))
+
+    def test_render_token_cap(self) -> None:
+        # Arrange
+        items = [
+            self.history.encode(f"question {i}?", "answer " * 20, False)
+            for i in range(10)
+        ]
+        self.history.set_settings(HistorySettings(max_tokens=100))
+
+        # Act
+        rendered = self.history.render(items)
+
+        # Assert
+        # Only the most recent turns that fit the cap are rendered
+        self.assertLessEqual(estimate_tokens(rendered), 100)
+        self.assertIn("question 9?", rendered)
+        self.assertNotIn("question 0?", rendered)
+
+    def test_render_template_and_empty(self) -> None:
+        # Arrange
+        self.history.set_settings(
+            HistorySettings(turn_template="User: {question}\nBot: {answer}\n")
+        )
+        items = ["not a turn", self.history.encode("hi?", "hello", False)]
+
+        # Act
+        rendered = self.history.render(items)
+
+        # Assert
+        self.assertEqual(rendered, "User: hi?\nBot: hello\n")
+        self.assertEqual(self.history.render([]), ConversationHistory.EMPTY)
@@ -0,0 +1,57 @@
+import sys
+
+sys.path.append("./src")
+
+from random import randint, sample
+from unittest import TestCase
+
+from sbilifeco.user_flows.fence_tokenizer import FenceTokenizer
+
+
+class FenceTokenizerTest(TestCase):
+    answer = (
+        "Let me think ```python\nprint(1)\n``` and then "
+        "```sql\nselect * from users;\n``` which returns "
+        '```json\n{"columns": []}\n``` and that is all'
+    )
+
+    def test_blocks_in_one_chunk(self) -> None:
+        # Arrange
+        tokenizer = FenceTokenizer(["```sql", "```json"])
+
+        # Act
+        completed = tokenizer.feed(self.answer)
+        remainder = tokenizer.flush()
+
+        # Assert
+        self.assertEqual(len(completed), 2)
+        (sql_chunk, sql_fence), (json_chunk, json_fence) = completed
+        self.assertEqual(sql_fence, "```sql")
+        self.assertTrue(sql_chunk.endswith("select * from users;\n```"))
+        self.assertIn("```python", sql_chunk)
+        self.assertEqual(json_fence, "```json")
+        self.assertTrue(json_chunk.startswith(" which returns ```json"))
+        self.assertEqual(remainder, " and that is all")
+
+    def test_fences_split_across_chunks(self) -> None:
+        # Arrange
+        expected_tokenizer = FenceTokenizer(["```sql", "```json"])
+        expected = [chunk for chunk, _ in expected_tokenizer.feed(self.answer)]
+        expected.append(expected_tokenizer.flush())
+
+        for _ in range(200):
+            tokenizer = FenceTokenizer(["```sql", "```json"])
+            cuts = sorted(sample(range(1, len(self.answer)), randint(1, 30)))
+            pieces = [
+                self.answer[start:end]
+                for start, end in zip([0] + cuts, cuts + [len(self.answer)])
+            ]
+
+            # Act
+            streamed = []
+            for piece in pieces:
+                streamed.extend(chunk for chunk, _ in tokenizer.feed(piece))
+            streamed.append(tokenizer.flush())
+
+            # Assert
+            self.assertEqual(streamed, expected, pieces)
@@ -0,0 +1,72 @@
+import sys
+
+sys.path.append("./src")
+
+from asyncio import sleep
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+from uuid import uuid4
+
+from sbilifeco.user_flows.flow_logger import FlowLogger
+
+
+class FlowLoggerTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.stream = StringIO()
+        self.logger = FlowLogger(stream=self.stream)
+        return await super().asyncSetUp()
+
+    async def asyncTearDown(self) -> None:
+        self.logger.stop()
+        return await super().asyncTearDown()
+
+    async def test_levels_and_fields(self) -> None:
+        # Arrange
+        self.logger.set_level("warning")
+
+        # Act
+        self.logger.info("not written")
+        self.logger.warning("written", request_id="abc", db_id=42)
+        self.logger.stop()
+
+        # Assert
+        output = self.stream.getvalue()
+        self.assertNotIn("not written", output)
+        self.assertIn("WARNING", output)
+        self.assertIn("written request_id=abc db_id=42", output)
+
+    async def test_prompt_sampling(self) -> None:
+        # Arrange
+        prompt = uuid4().hex
+
+        # Act
+        self.logger.log_prompt("never", prompt)
+        self.logger.set_prompt_sample_rate(1.0).log_prompt("always", prompt)
+        self.logger.stop()
+
+        # Assert
+        output = self.stream.getvalue()
+        self.assertEqual(output.count(prompt), 1)
+        self.assertIn("request_id=always", output)
+
+    async def test_prompt_dump(self) -> None:
+        with TemporaryDirectory() as dump_dir:
+            # Arrange
+            request_ids = [uuid4().hex for _ in range(3)]
+            self.logger.set_prompt_dump_dir(Path(dump_dir) / "prompts")
+
+            # Act
+            for request_id in request_ids:
+                self.logger.log_prompt(request_id, f"prompt for {request_id}")
+            for _ in range(50):
+                if len(list(Path(dump_dir, "prompts").glob("*.txt"))) == 3:
+                    break
+                await sleep(0.01)
+
+            # Assert
+            # One file per request, written by the executor
+            for request_id in request_ids:
+                dumped = Path(dump_dir, "prompts", f"{request_id}.txt").read_text()
+                self.assertEqual(dumped, f"prompt for {request_id}")
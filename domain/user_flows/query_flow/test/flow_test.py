@@ -1,10 +1,15 @@
 import sys
+from asyncio import gather, sleep
 from pprint import pformat
 from random import randint
 
 sys.path.append("./src")
 
+from datetime import datetime
 from json import dumps
+from os import unlink, utime
+from tempfile import NamedTemporaryFile
+from time import perf_counter, time_ns
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, patch
 from uuid import uuid4
@@ -13,6 +18,7 @@ from faker import Faker
 from sbilifeco.boundaries.query_flow import (
     IQueryFlowListener,
     QueryFlowAnswer,
+    QueryFlowBatchRequest,
     QueryFlowRequest,
 )
 from sbilifeco.boundaries.llm import ILLM
@@ -28,7 +34,11 @@ from sbilifeco.boundaries.vector_repo import BaseVectorRepo
 from sbilifeco.models.vectorisation import VectorisedRecord, RecordMetadata
 from sbilifeco.models.base import Response
 from sbilifeco.models.db_metadata import DB
-from sbilifeco.user_flows.query_flow import QueryFlow
+from sbilifeco.user_flows.query_flow import QueryFlow, RetrievalSettings
+from sbilifeco.user_flows.conversation_history import (
+    ConversationHistory,
+    HistorySettings,
+)
 
 
 class FlowTest(IsolatedAsyncioTestCase):
@@ -103,6 +113,16 @@ class FlowTest(IsolatedAsyncioTestCase):
             "get_db",
             AsyncMock(return_value=Response.ok(self.db_metadata)),
         ).start()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(return_value=Response.ok([])),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "append_session_data",
+            AsyncMock(return_value=Response.ok(None)),
+        ).start()
 
         self.external_tool_repo = AsyncMock(spec=IExternalToolRepo)
         self.external_tool = ExternalTool(
@@ -174,7 +194,7 @@ class FlowTest(IsolatedAsyncioTestCase):
                 f"{self.session_id}{QueryFlow.SUFFIX_METADATA}"
             )
             patched_delete_session_data.assert_any_call(
-                f"{self.session_id}{QueryFlow.SUFFIX_LAST_QA}"
+                f"{self.session_id}{QueryFlow.SUFFIX_HISTORY}"
             )
 
     async def __test_query(self, initial_session_data: str = "") -> None:
@@ -198,6 +218,18 @@ class FlowTest(IsolatedAsyncioTestCase):
             AsyncMock(return_value=Response.ok(None)),
         ).start()
 
+        fn_get_session_data_list = patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(return_value=Response.ok([])),
+        ).start()
+
+        fn_append_session_data = patch.object(
+            self.session_data_manager,
+            "append_session_data",
+            AsyncMock(return_value=Response.ok(None)),
+        ).start()
+
         fn_llm_query = patch.object(
             self.llm,
             "generate_streamed_reply",
@@ -237,9 +269,10 @@ class FlowTest(IsolatedAsyncioTestCase):
             # db metadata should NOT have been fetched from metadata storage
             self.fn_get_db.assert_not_called()
 
-        # session data manager should have been queried for the last question asked and its answer
-        fn_get_session_data.assert_any_call(
-            f"{self.session_id}{QueryFlow.SUFFIX_LAST_QA}"
+        # session data manager should have been queried for the recent turns of the conversation
+        fn_get_session_data_list.assert_called_once_with(
+            f"{self.session_id}{QueryFlow.SUFFIX_HISTORY}",
+            HistorySettings().max_turns,
         )
 
         # LLM should have been invoked
@@ -274,30 +307,25 @@ class FlowTest(IsolatedAsyncioTestCase):
         )
         self.assertNotIn("{" + QueryFlow.PLACEHOLDER_TODAY + "}", context_sent_to_llm)
 
-        # There should be at least one call made to update session data manager
-        self.assertGreaterEqual(
-            fn_update_session_data.call_count, 1, "No session data update calls made"
-        )
-
         # Post query operations
-        # Fetch the calls made to update session data
-        session_data_update_calls = fn_update_session_data.call_args_list
-
         if not initial_session_data:
             # No cached db metadata, so that will be updated in session data manager
-            update_db_metadata_call = session_data_update_calls.pop(0)
-            key, db_metadata = update_db_metadata_call.args
+            fn_update_session_data.assert_called_once()
+            key, db_metadata = fn_update_session_data.call_args.args
 
             self.assertEqual(key, f"{self.session_id}{QueryFlow.SUFFIX_METADATA}")
             self.assertIn(self.db_metadata.name, db_metadata)
             self.assertIn(self.db_metadata.description, db_metadata)
+        else:
+            fn_update_session_data.assert_not_called()
 
-        # There should be an update call for last question and answer
-        update_last_qa_call = session_data_update_calls.pop(0)
-        key, updated_qa = update_last_qa_call.args
-        self.assertEqual(key, f"{self.session_id}{QueryFlow.SUFFIX_LAST_QA}")
-        self.assertIn(self.question, updated_qa)
-        self.assertIn(self.answer, updated_qa)
+        # The question and answer should have been appended to the conversation
+        fn_append_session_data.assert_called_once()
+        key, turn, max_items = fn_append_session_data.call_args.args
+        self.assertEqual(key, f"{self.session_id}{QueryFlow.SUFFIX_HISTORY}")
+        self.assertIn(self.question, turn)
+        self.assertIn(self.answer, turn)
+        self.assertEqual(max_items, HistorySettings().max_turns)
 
     async def test_query_new_session(self) -> None:
         await self.__test_query()
@@ -322,7 +350,7 @@ class FlowTest(IsolatedAsyncioTestCase):
             f"{self.session_id}{QueryFlow.SUFFIX_METADATA}"
         )
         patched_delete_session_data.assert_any_call(
-            f"{self.session_id}{QueryFlow.SUFFIX_LAST_QA}"
+            f"{self.session_id}{QueryFlow.SUFFIX_HISTORY}"
         )
 
     async def test_master_values_retrieval(self) -> None:
@@ -424,10 +452,18 @@ class FlowTest(IsolatedAsyncioTestCase):
             "get_session_data",
             AsyncMock(return_value=Response.ok("")),
         ).start()
+
+        async def stream_reply(reply: str):
+            yield reply
+
         fn_reply = patch.object(
             self.llm,
-            "generate_reply",
-            AsyncMock(side_effect=[Response.ok(tool_call), Response.ok(self.answer)]),
+            "generate_streamed_reply",
+            AsyncMock(
+                side_effect=lambda request_id, prompt: Response.ok(
+                    stream_reply(self.answer if "Tool answer" in prompt else tool_call)
+                )
+            ),
         ).start()
 
         # Act
@@ -437,15 +473,36 @@ class FlowTest(IsolatedAsyncioTestCase):
 
         # Assert
         self.assertTrue(flow_response.is_success, flow_response.message)
+        self.assertEqual(flow_response.payload, self.answer)
 
         # Tool should have been invoked
         fn_invoke_tool.assert_called_once_with(
             self.external_tool.name,
             **{self.external_tool.params[0].name: tool_param_value},
         )
-        llm_context_with_tool_result = fn_reply.call_args_list[-1].args[0]
+        llm_context_with_tool_result = fn_reply.call_args_list[-1].args[1]
+        self.assertIn(tool_call, llm_context_with_tool_result)
         self.assertIn(dumps(tool_return_value), llm_context_with_tool_result)
 
+        # Act
+        # The same loop runs from ask(), whose stream carries every turn
+        ask_response = await self.query_flow.ask(
+            QueryFlowRequest(
+                db_id=self.db_metadata.id,
+                session_id=uuid4().hex,
+                question=self.faker.sentence(),
+            )
+        )
+        assert ask_response.payload is not None
+        streamed = "".join([chunk async for chunk in ask_response.payload])
+
+        # Assert
+        self.assertIn(self.external_tool.name, streamed)
+        self.assertTrue(streamed.endswith(self.answer))
+        # Second call served from the tool result cache
+        fn_invoke_tool.assert_called_once()
+        self.assertEqual(self.query_flow.tool_result_cache_stats["hits"], 1)
+
     async def test_prompt_selection__not_available(self) -> None:
         # Arrange
         session_id = uuid4().hex
@@ -503,134 +560,236 @@ class FlowTest(IsolatedAsyncioTestCase):
         input_query = fn_generate_reply.call_args.args[0]
         self.assertEqual(self.db_specific_prompt[:10], input_query[:10])
 
-    async def test_appended_context(self) -> None:
+    async def test_prompt_template_cache(self) -> None:
         # Arrange
-        question = self.faker.sentence() + "?"
-        sql_reply = "```sql\nselect * from users;\n```"
-        non_sql_reply_first = self.faker.sentence()
-        non_sql_reply_second = self.faker.sentence()
-
-        session_id = uuid4().hex
-        db_id = self.faker.word()
+        db_id = uuid4().hex
+        with NamedTemporaryFile("w", suffix=".txt", delete=False) as prompt_file:
+            prompt_file.write(self.prompt)
+        self.query_flow.set_prompt_by_db(db_id, f"file://{prompt_file.name}")
 
         patch.object(
             self.session_data_manager,
             "get_session_data",
-            AsyncMock(
-                side_effect=[
-                    Response.ok("metadata"),
-                    Response.ok(""),
-                    Response.ok(""),
-                    Response.ok("metadata"),
-                    Response.ok(""),
-                    Response.ok(non_sql_reply_first),
-                    Response.ok("metadata"),
-                    Response.ok(""),
-                    Response.ok(non_sql_reply_second),
-                ]
-            ),
+            AsyncMock(return_value=Response.ok("")),
         ).start()
-        patch.object(
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
+
+        fn_llm_query = patch.object(
             self.llm,
-            "generate_reply",
-            AsyncMock(
-                side_effect=[
-                    Response.ok(non_sql_reply_first),
-                    Response.ok(non_sql_reply_second),
-                    Response.ok(sql_reply),
-                ]
-            ),
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(stream_answer_chunks())),
         ).start()
+
+        try:
+            # Act
+            for _ in range(3):
+                await self.query_flow.query(
+                    dbId=db_id, session_id=self.session_id, question=self.question
+                )
+
+            # Assert
+            # Template is read once and served from the cache afterwards
+            stats = self.query_flow.prompt_template_stats
+            self.assertEqual(stats["reloads"], 1)
+            self.assertEqual(stats["hits"], 2)
+
+            # Arrange
+            changed_prompt = "Changed: " + self.prompt
+            with open(prompt_file.name, "w", encoding="utf-8") as f:
+                f.write(changed_prompt)
+            utime(prompt_file.name, ns=(time_ns(), time_ns() + 1_000_000_000))
+
+            # Act
+            await self.query_flow.query(
+                dbId=db_id, session_id=self.session_id, question=self.question
+            )
+
+            # Assert
+            # A changed file is picked up again
+            self.assertEqual(self.query_flow.prompt_template_stats["reloads"], 2)
+            context_sent_to_llm = fn_llm_query.call_args.args[1]
+            self.assertTrue(context_sent_to_llm.startswith("Changed: "))
+        finally:
+            unlink(prompt_file.name)
+
+    async def test_concurrent_context_lookups(self) -> None:
+        # Arrange
+        delay = 0.3
+        self.query_flow.set_lookup_timeout(delay * 2)
+
+        async def slow_session_data(key: str) -> Response[str]:
+            # Master values never arrive in time, the rest are just slow
+            if key.endswith(QueryFlow.SUFFIX_MASTER_VALUES):
+                await sleep(delay * 10)
+            await sleep(delay)
+            return Response.ok("")
+
         patch.object(
-            self.external_tool_repo,
-            "fetch_tools",
-            AsyncMock(return_value=[]),
-        )
-        fn_set_session_data = patch.object(
             self.session_data_manager,
-            "update_session_data",
-            AsyncMock(return_value=Response.ok(None)),
+            "get_session_data",
+            AsyncMock(side_effect=slow_session_data),
+        ).start()
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(return_value=Response.ok(stream_answer_chunks())),
         ).start()
 
         # Act
+        time_before = perf_counter()
         flow_response = await self.query_flow.query(
-            dbId=db_id, session_id=session_id, question=question
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
         )
+        time_taken = perf_counter() - time_before
 
         # Assert
-        assert flow_response.payload is not None
-        self.assertIn(non_sql_reply_first, flow_response.payload)
+        # Lookups overlap, and the timed-out master values are skipped
+        self.assertTrue(flow_response.is_success, flow_response.message)
+        self.assertLess(time_taken, delay * 3)
+        fn_llm_query.assert_called_once()
+        self.assertIn("Not defined", fn_llm_query.call_args.args[1])
 
-        fn_set_session_data.assert_called()
-        fn_args = fn_set_session_data.call_args.args
-        self.assertIn(question, fn_args[1])
-        self.assertIn(non_sql_reply_first, fn_args[1])
+    async def test_tool_catalogue_refresh(self) -> None:
+        # Arrange
+        interval = 0.05
+        await self.query_flow.async_shutdown()
+        self.query_flow.set_tool_refresh_interval(interval)
+        await self.query_flow.async_init()
 
-        self.listener.on_answer.assert_called()
-        listener_args = self.listener.on_answer.call_args.args
-        non_sql_answer: QueryFlowAnswer = listener_args[0]
-        self.assertEqual(non_sql_answer.session_id, session_id)
-        self.assertEqual(non_sql_answer.db_id, db_id)
-        self.assertEqual(non_sql_answer.question, question)
-        self.assertEqual(non_sql_answer.answer, non_sql_reply_first)
-        self.assertGreaterEqual(non_sql_answer.response_time_seconds, -1)
+        new_tool = ExternalTool(
+            name=self.faker.word() + uuid4().hex,
+            description=self.faker.sentence(),
+        )
+        self.fn_fetch_tools.return_value = [self.external_tool, new_tool]
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(return_value=Response.ok(stream_answer_chunks())),
+        ).start()
 
         # Act
-        flow_response = await self.query_flow.query(
-            dbId=db_id, session_id=session_id, question=question
+        await sleep(interval * 4)
+        await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
         )
 
         # Assert
-        assert flow_response.payload is not None
-        self.assertIn(non_sql_reply_second, flow_response.payload)
+        # The tool list was re-polled in the background and the new tool is offered to the LLM
+        self.assertGreater(self.fn_fetch_tools.call_count, 2)
+        context_sent_to_llm = fn_llm_query.call_args.args[1]
+        self.assertIn(self.external_tool.name, context_sent_to_llm)
+        self.assertIn(new_tool.name, context_sent_to_llm)
+
+    async def test_tool_catalogue_kept_on_failed_refresh(self) -> None:
+        # Arrange
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
 
-        fn_set_session_data.assert_called()
-        fn_args = fn_set_session_data.call_args.args
-        self.assertIn(question, fn_args[1])
-        self.assertIn(non_sql_reply_first, fn_args[1])
-        self.assertIn(non_sql_reply_second, fn_args[1])
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(stream_answer_chunks())),
+        ).start()
 
         # Act
-        flow_response = await self.query_flow.query(
-            dbId=db_id, session_id=session_id, question=question
+        self.fn_fetch_tools.return_value = []
+        await self.query_flow.refresh_tools()
+        await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
         )
 
         # Assert
-        assert flow_response.payload is not None
-        self.assertIn(sql_reply, flow_response.payload)
-
-        fn_set_session_data.assert_called()
-        fn_args = fn_set_session_data.call_args.args
-        self.assertIn(question, fn_args[1])
-        self.assertNotIn(non_sql_reply_first, fn_args[1])
-        self.assertNotIn(non_sql_reply_second, fn_args[1])
-        self.assertIn(sql_reply, fn_args[1])
+        # The repo lists no tools when it cannot be reached, so the last good list stays
+        self.assertEqual(self.fn_fetch_tools.call_count, 2)
+        context_sent_to_llm = fn_llm_query.call_args.args[1]
+        self.assertIn(self.external_tool.name, context_sent_to_llm)
+        self.assertNotIn(QueryFlow.NO_TOOLS_AVAILABLE, context_sent_to_llm)
 
-    async def test_ask(self) -> None:
+    async def test_full_schema_cache(self) -> None:
         # Arrange
         query_flow_request = QueryFlowRequest(
-            db_id=self.faker.word(),
-            question=self.faker.sentence(),
+            db_id=self.db_metadata.id, question=self.faker.sentence()
         )
 
-        fn_get_session_data = patch.object(
+        patch.object(
             self.session_data_manager,
             "get_session_data",
             AsyncMock(return_value=Response.ok("")),
         ).start()
+        patch.object(
+            self.vectoriser,
+            "vectorise",
+            return_value=Response.ok([0.1, 0.2, 0.3]),
+        ).start()
+        patch.object(
+            self.vector_repo, "search_by_vector", return_value=Response.ok([])
+        ).start()
 
-        fn_get_db = patch.object(
-            self.metadata_storage,
-            "get_db",
-            AsyncMock(return_value=Response.ok(self.db_metadata)),
+        async def llm_call(*args, **kwargs):
+            yield self.answer
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
         ).start()
 
+        # Act
+        for _ in range(3):
+            ask_response = await self.query_flow.ask(query_flow_request)
+            self.assertTrue(ask_response.is_success, ask_response.message)
+
+        # Assert
+        # Full schema is fetched once, then served from the cache
+        self.fn_get_db.assert_called_once()
+        self.assertEqual(self.query_flow.schema_cache_stats["hits"], 2)
+        self.assertIn(self.db_metadata.name, fn_llm.call_args.args[1])
+
+        # Act
+        self.query_flow.invalidate_schema(self.db_metadata.id)
+        await self.query_flow.ask(query_flow_request)
+
+        # Assert
+        # Invalidation forces a fresh fetch
+        self.assertEqual(self.fn_get_db.call_count, 2)
+
+    async def test_retrieval_cache(self) -> None:
+        # Arrange
+        db_id = self.faker.word()
+        question = self.faker.sentence()
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
         fn_vectorise = patch.object(
             self.vectoriser,
             "vectorise",
             return_value=Response.ok([0.1, 0.2, 0.3]),
         ).start()
-
         fn_search = patch.object(
             self.vector_repo,
             "search_by_vector",
@@ -639,92 +798,818 @@ class FlowTest(IsolatedAsyncioTestCase):
                     VectorisedRecord(
                         id=uuid4().hex,
                         document=Table(
-                            id="employee",
-                            name="employee",
-                            description=self.faker.sentence(),
-                            fields=[],
+                            id="employee", name="employee", fields=[]
                         ).model_dump_json(),
                         metadata=RecordMetadata(
-                            source_id=query_flow_request.db_id,
-                            source=f"{query_flow_request.db_id}/employee",
+                            source_id=db_id, source=f"{db_id}/employee"
                         ),
                         score=0.9,
-                    ),
-                    VectorisedRecord(
-                        id=uuid4().hex,
-                        document=Field(
-                            id="employee_name",
-                            name="employee_name",
-                            description=self.faker.sentence(),
-                        ).model_dump_json(),
-                        metadata=RecordMetadata(
-                            source_id=query_flow_request.db_id,
-                            source=f"{query_flow_request.db_id}/employee/employee_name",
-                        ),
-                        score=0.8,
-                    ),
-                    VectorisedRecord(
-                        id=uuid4().hex,
-                        document=Field(
-                            id="department",
-                            name="department",
-                            description=self.faker.sentence(),
-                        ).model_dump_json(),
-                        metadata=RecordMetadata(
-                            source_id=query_flow_request.db_id,
-                            source=f"{query_flow_request.db_id}/employee/department",
-                        ),
-                        score=0.7,
-                    ),
+                    )
                 ]
             ),
         ).start()
 
-        fn_get_external_tools = patch.object(
-            self.external_tool_repo,
-            "fetch_tools",
-            AsyncMock(return_value=[]),
-        ).start()
-
         async def llm_call(*args, **kwargs):
-            for chunk in [
-                self.faker.sentence(),
-                self.faker.sentence() + "```sql\n" + self.faker.sentence(),
-                self.faker.sentence() + "\n```" + "\n```json\n" + self.faker.sentence(),
-                self.faker.sentence() + "\n```" + self.faker.sentence(),
-                self.faker.sentence(),
-            ]:
-                yield chunk
+            yield self.answer
 
         fn_llm = patch.object(
             self.llm,
             "generate_streamed_reply",
-            AsyncMock(return_value=Response.ok(llm_call())),
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
         ).start()
 
         # Act
-        ask_response = await self.query_flow.ask(query_flow_request)
+        for asked in [question, f"  {question.upper()} ", question]:
+            ask_response = await self.query_flow.ask(
+                QueryFlowRequest(db_id=db_id, question=asked)
+            )
+            self.assertTrue(ask_response.is_success, ask_response.message)
 
         # Assert
-        # Verifying the response itself
-        self.assertTrue(ask_response.is_success, ask_response.message)
+        # Same question, normalised, is vectorised and searched only once
+        fn_vectorise.assert_called_once()
+        fn_search.assert_called_once()
+        self.assertIn("employee", fn_llm.call_args.args[1])
 
-        stream = ask_response.payload
-        assert stream is not None
+        # Act
+        self.query_flow.invalidate_retrieval(db_id)
+        await self.query_flow.ask(QueryFlowRequest(db_id=db_id, question=question))
 
-        sql_chunk = await anext(stream)
-        self.assertIn("```sql", sql_chunk)
+        # Assert
+        self.assertEqual(fn_vectorise.call_count, 2)
+        self.assertEqual(fn_search.call_count, 2)
 
-        json_chunk = await anext(stream)
-        self.assertIn("```json", json_chunk)
+    async def test_adaptive_top_k(self) -> None:
+        # Arrange
+        db_id = self.faker.word()
+        other_db_id = uuid4().hex
+        self.query_flow.set_retrieval_settings_by_db(
+            db_id,
+            RetrievalSettings(
+                initial_top_k=10, max_top_k=80, min_matches=3, score_threshold=0.6
+            ),
+        )
 
-        async for chunk in stream:
-            self.assertNotIn("```sql", chunk)
-            self.assertNotIn("```json", chunk)
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+        patch.object(
+            self.vectoriser,
+            "vectorise",
+            return_value=Response.ok([0.1, 0.2, 0.3]),
+        ).start()
+
+        def make_record(index: int, source_id: str) -> VectorisedRecord:
+            table_name = f"table_{index}"
+            return VectorisedRecord(
+                id=uuid4().hex,
+                document=Table(
+                    id=table_name, name=table_name, fields=[]
+                ).model_dump_json(),
+                metadata=RecordMetadata(
+                    source_id=source_id, source=f"{source_id}/{table_name}"
+                ),
+                score=0.99 - index * 0.001,
+            )
+
+        async def search(vector: list[float], num_results: int):
+            await sleep(0.02)
+            # Other databases crowd the top 25 hits
+            return Response.ok(
+                [
+                    make_record(index, other_db_id if index < 25 else db_id)
+                    for index in range(num_results)
+                ]
+            )
+
+        fn_search = patch.object(
+            self.vector_repo, "search_by_vector", side_effect=search
+        ).start()
+
+        async def llm_call(*args, **kwargs):
+            yield self.answer
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
+        ).start()
+        fn_observe_timings = patch(
+            "sbilifeco.user_flows.query_flow.observe_timings"
+        ).start()
+
+        # Act
+        ask_response = await self.query_flow.ask(
+            QueryFlowRequest(db_id=db_id, question=self.question)
+        )
+
+        # Assert
+        # The search widens until enough in-db matches are found, and no further
+        self.assertTrue(ask_response.is_success, ask_response.message)
+        self.assertEqual(
+            [call.kwargs["num_results"] for call in fn_search.call_args_list],
+            [10, 20, 40],
+        )
+        self.assertIn("table_25", fn_llm.call_args.args[1])
+        self.assertNotIn("table_24", fn_llm.call_args.args[1])
+        # All three rounds count towards the reported search time
+        timings = fn_observe_timings.call_args.args[1]
+        self.assertGreaterEqual(timings["vector_search"], 0.06)
+
+    async def test_query_batch(self) -> None:
+        # Arrange
+        questions = [f"question {i}?" for i in range(6)]
+        in_flight = 0
+        max_in_flight = 0
+
+        async def stream_answer(prompt: str):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await sleep(0.01)
+            in_flight -= 1
+            yield f"answer to {next(q for q in questions if q in prompt)}"
+
+        fn_get_session_data = patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+        patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(
+                side_effect=lambda request_id, prompt: Response.ok(
+                    stream_answer(prompt)
+                )
+            ),
+        ).start()
+        self.query_flow.set_batch_concurrency(4)
+
+        # Act
+        batch_response = await self.query_flow.query_batch(
+            QueryFlowBatchRequest(
+                db_id=self.db_metadata.id, questions=questions, max_concurrency=2
+            )
+        )
+        assert batch_response.payload is not None
+        results = [result async for result in batch_response.payload]
+
+        # Assert
+        # Context is fetched once for the whole batch, and LLM calls stay within the limit
+        self.assertTrue(batch_response.is_success, batch_response.message)
+        self.fn_get_db.assert_called_once()
+        fn_get_session_data.assert_called_once_with(
+            f"{self.db_metadata.id}{QueryFlow.SUFFIX_MASTER_VALUES}"
+        )
+        self.assertLessEqual(max_in_flight, 2)
+
+        self.assertEqual(sorted(result.index for result in results), list(range(6)))
+        for result in results:
+            self.assertTrue(result.response.is_success, result.response.message)
+            self.assertEqual(result.question, questions[result.index])
+            self.assertEqual(result.response.payload, f"answer to {result.question}")
+
+        # Batch questions are one-off, so they leave no conversation behind
+        self.session_data_manager.append_session_data.assert_not_called()
+
+    async def test_single_flight(self) -> None:
+        # Arrange
+        async def stream_answer_chunks():
+            await sleep(0.01)
+            yield self.answer
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(stream_answer_chunks())),
+        ).start()
+
+        # Act
+        # Same question in different sessions makes for byte-identical prompts
+        responses = await gather(
+            *[
+                self.query_flow.query(
+                    dbId=self.db_metadata.id,
+                    session_id=uuid4().hex,
+                    question=self.question,
+                    use_cache=False,
+                )
+                for _ in range(3)
+            ]
+        )
+
+        # Assert
+        fn_llm_query.assert_called_once()
+        self.assertEqual(
+            [response.payload for response in responses], [self.answer] * 3
+        )
+        self.assertEqual(self.query_flow.single_flight_stats["coalesced"], 2)
+
+        # Act
+        self.query_flow.set_is_single_flight_enabled(False)
+        await gather(
+            *[
+                self.query_flow.query(
+                    dbId=self.db_metadata.id,
+                    session_id=uuid4().hex,
+                    question=self.question,
+                    use_cache=False,
+                )
+                for _ in range(2)
+            ]
+        )
+
+        # Assert
+        self.assertEqual(fn_llm_query.call_count, 3)
+
+    async def test_prompt_token_budget(self) -> None:
+        # Arrange
+        history = ConversationHistory()
+        first_question = self.faker.sentence()
+        turns = [history.encode(first_question, self.faker.paragraph(), False)]
+        turns += [
+            history.encode(f"question {i}?", "answer " * 50, False) for i in range(30)
+        ]
+        metadata = "\n".join(f"\tTable name: table_{i}" for i in range(100))
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(
+                side_effect=lambda key: Response.ok(
+                    metadata if key.endswith(QueryFlow.SUFFIX_METADATA) else ""
+                )
+            ),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(return_value=Response.ok(turns)),
+        ).start()
+        self.query_flow.set_history_settings(
+            HistorySettings(max_turns=len(turns), max_tokens=0)
+        )
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(stream_answer_chunks())),
+        ).start()
+        self.query_flow.set_prompt_token_budget_by_db(self.db_metadata.id, 3000)
+
+        # Act
+        await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
+        )
+
+        # Assert
+        # Schema fits, and the oldest turns of the conversation make way for it
+        prompt = fn_llm_query.call_args.args[1]
+        self.assertLessEqual(len(prompt), 3000 * 4)
+        self.assertIn("table_99", prompt)
+        self.assertIn(self.question, prompt)
+        self.assertIn("question 29?", prompt)
+        self.assertNotIn(first_question, prompt)
+
+    async def test_answer_cache(self) -> None:
+        # Arrange
+        query_flow_request = QueryFlowRequest(
+            db_id=self.db_metadata.id, question=self.question
+        )
+        answer = f"Here you go ```sql\nselect 1;\n``` {self.answer}"
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+        patch.object(
+            self.vectoriser,
+            "vectorise",
+            return_value=Response.ok([0.1, 0.2, 0.3]),
+        ).start()
+        patch.object(
+            self.vector_repo, "search_by_vector", return_value=Response.ok([])
+        ).start()
+
+        async def llm_call(*args, **kwargs):
+            yield answer[:15]
+            yield answer[15:]
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
+        ).start()
+
+        async def ask(request: QueryFlowRequest) -> list[str]:
+            ask_response = await self.query_flow.ask(request)
+            self.assertTrue(ask_response.is_success, ask_response.message)
+            assert ask_response.payload is not None
+            chunks = [chunk async for chunk in ask_response.payload]
+            await self.query_flow.drain_listeners()
+            return chunks
+
+        # Act
+        live_chunks = await ask(query_flow_request)
+        cached_chunks = await ask(
+            query_flow_request.model_copy(
+                update={"question": f" {self.question.upper()}"}
+            )
+        )
+
+        # Assert
+        # Second ask is replayed from the cache in the same segments
+        fn_llm.assert_called_once()
+        self.assertEqual(cached_chunks, live_chunks)
+        self.assertEqual(self.query_flow.answer_cache_stats["hits"], 1)
+        answers: list[QueryFlowAnswer] = [
+            call.args[0] for call in self.listener.on_answer.call_args_list
+        ]
+        self.assertEqual([a.is_cached for a in answers], [False, True])
+        self.assertEqual(answers[1].answer, answer)
+
+        # Act
+        flow_response = await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
+        )
+        bypassed_chunks = await ask(
+            query_flow_request.model_copy(update={"use_cache": False})
+        )
+
+        # Assert
+        # query() keeps its own entry, and the bypass flag always goes to the LLM
+        self.assertEqual(fn_llm.call_count, 3)
+        self.assertEqual(flow_response.payload, answer.strip())
+        self.assertEqual(bypassed_chunks, live_chunks)
+
+        # Act
+        await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
+        )
+        self.query_flow.invalidate_answers(self.db_metadata.id)
+        await ask(query_flow_request)
+
+        # Assert
+        self.assertEqual(fn_llm.call_count, 4)
+        self.assertFalse(self.listener.on_answer.call_args.args[0].is_cached)
+
+    async def test_answer_cache_is_per_day(self) -> None:
+        # Arrange
+        query_flow_request = QueryFlowRequest(
+            db_id=self.db_metadata.id, question="How many policies were sold today?"
+        )
+        patch.object(
+            self.vectoriser,
+            "vectorise",
+            return_value=Response.ok([0.1, 0.2, 0.3]),
+        ).start()
+        patch.object(
+            self.vector_repo, "search_by_vector", return_value=Response.ok([])
+        ).start()
+
+        async def llm_call(*args, **kwargs):
+            yield self.answer
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
+        ).start()
+        fn_datetime = patch("sbilifeco.user_flows.query_flow.datetime").start()
+
+        async def ask_on(day: datetime) -> None:
+            fn_datetime.now.return_value = day
+            ask_response = await self.query_flow.ask(query_flow_request)
+            self.assertTrue(ask_response.is_success, ask_response.message)
+            assert ask_response.payload is not None
+            [chunk async for chunk in ask_response.payload]
+            await self.query_flow.drain_listeners()
+
+        # Act
+        await ask_on(datetime(2025, 3, 31, 9))
+        await ask_on(datetime(2025, 3, 31, 18))
+        await ask_on(datetime(2025, 4, 1, 9))
+
+        # Assert
+        # "today" means another day by then, so the answer is not reused
+        self.assertEqual(fn_llm.call_count, 2)
+        self.assertEqual(self.query_flow.answer_cache_stats["hits"], 1)
+
+    async def test_appended_context(self) -> None:
+        # Arrange
+        question = self.faker.sentence() + "?"
+        sql_reply = "```sql\nselect * from users;\n```"
+        non_sql_reply_first = self.faker.sentence()
+        non_sql_reply_second = self.faker.sentence()
+        replies = [non_sql_reply_first, non_sql_reply_second, sql_reply, sql_reply]
+
+        session_id = uuid4().hex
+        db_id = self.faker.word()
+        history: list[str] = []
+
+        async def append_session_data(
+            key: str, data: str, max_items: int = 0
+        ) -> Response[None]:
+            history.append(data)
+            return Response.ok(None)
+
+        async def get_session_data_list(
+            key: str, last_n: int = 0
+        ) -> Response[list[str]]:
+            return Response.ok(history[-last_n:] if last_n > 0 else list(history))
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(
+                side_effect=lambda key: Response.ok(
+                    "metadata" if key.endswith(QueryFlow.SUFFIX_METADATA) else ""
+                )
+            ),
+        ).start()
+        fn_append_session_data = patch.object(
+            self.session_data_manager,
+            "append_session_data",
+            AsyncMock(side_effect=append_session_data),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(side_effect=get_session_data_list),
+        ).start()
+
+        async def stream_reply(reply: str):
+            yield reply
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(
+                side_effect=[Response.ok(stream_reply(reply)) for reply in replies]
+            ),
+        ).start()
+
+        # Act
+        flow_response = await self.query_flow.query(
+            dbId=db_id, session_id=session_id, question=question
+        )
+
+        # Assert
+        # Each turn is appended on its own to a list trimmed to the history window
+        assert flow_response.payload is not None
+        self.assertIn(non_sql_reply_first, flow_response.payload)
+
+        fn_append_session_data.assert_called_once()
+        key, turn, max_items = fn_append_session_data.call_args.args
+        self.assertEqual(key, f"{session_id}{QueryFlow.SUFFIX_HISTORY}")
+        self.assertIn(question, turn)
+        self.assertIn(non_sql_reply_first, turn)
+        self.assertEqual(max_items, HistorySettings().max_turns)
+
+        await self.query_flow.drain_listeners()
+        self.listener.on_answer.assert_called()
+        listener_args = self.listener.on_answer.call_args.args
+        non_sql_answer: QueryFlowAnswer = listener_args[0]
+        self.assertEqual(non_sql_answer.session_id, session_id)
+        self.assertEqual(non_sql_answer.db_id, db_id)
+        self.assertEqual(non_sql_answer.question, question)
+        self.assertEqual(non_sql_answer.answer, non_sql_reply_first)
+        self.assertGreaterEqual(non_sql_answer.response_time_seconds, -1)
+
+        # Act
+        await self.query_flow.query(
+            dbId=db_id, session_id=session_id, question=question
+        )
+        await self.query_flow.query(
+            dbId=db_id, session_id=session_id, question=question
+        )
+
+        # Assert
+        # Turns without SQL carry over into the next prompt
+        prompt = fn_llm_query.call_args.args[1]
+        self.assertIn(non_sql_reply_first, prompt)
+        self.assertIn(non_sql_reply_second, prompt)
+
+        # Act
+        await self.query_flow.query(
+            dbId=db_id, session_id=session_id, question=question
+        )
+
+        # Assert
+        # A SQL answer starts the context afresh
+        prompt = fn_llm_query.call_args.args[1]
+        self.assertNotIn(non_sql_reply_first, prompt)
+        self.assertNotIn(non_sql_reply_second, prompt)
+        self.assertIn("select * from users;", prompt)
+        self.assertEqual(len(history), 4)
+
+    async def test_prefix_prompt(self) -> None:
+        # Arrange
+        self.query_flow.set_is_prefix_prompt_enabled(True)
+        session_id = uuid4().hex
+        db_id = self.faker.word()
+        questions = [self.faker.sentence() + "?" for _ in range(2)]
+        replies = [self.faker.sentence() for _ in range(2)]
+        history: list[str] = []
+
+        async def append_session_data(
+            key: str, data: str, max_items: int = 0
+        ) -> Response[None]:
+            history.append(data)
+            return Response.ok(None)
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(
+                side_effect=lambda key: Response.ok(
+                    "metadata" if key.endswith(QueryFlow.SUFFIX_METADATA) else ""
+                )
+            ),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "append_session_data",
+            AsyncMock(side_effect=append_session_data),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(side_effect=lambda key, last_n=0: Response.ok(list(history))),
+        ).start()
+
+        async def stream_reply(reply: str):
+            yield reply
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(
+                side_effect=[Response.ok(stream_reply(reply)) for reply in replies]
+            ),
+        ).start()
+
+        # Act
+        for question in questions:
+            await self.query_flow.query(
+                dbId=db_id, session_id=session_id, question=question
+            )
+
+        # Assert
+        # The follow-up only adds messages to the end of the first prompt
+        first_prompt, second_prompt = [
+            call.args[1] for call in fn_llm_query.call_args_list
+        ]
+        self.assertTrue(second_prompt.startswith(first_prompt))
+        self.assertIn(replies[0], second_prompt[len(first_prompt) :])
+        self.assertTrue(
+            second_prompt.endswith(f"### User\n{questions[1]}\n\n### Assistant\n")
+        )
+        self.assertEqual(self.query_flow.prompt_prefix_stats["reused"], 1)
+
+    async def test_prefix_prompt_token_budget(self) -> None:
+        # Arrange
+        self.query_flow.set_is_prefix_prompt_enabled(True)
+        history = ConversationHistory()
+        first_question = self.faker.sentence()
+        turns = [history.encode(first_question, self.faker.paragraph(), False)]
+        turns += [
+            history.encode(f"question {i}?", "answer " * 50, False) for i in range(30)
+        ]
+
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(
+                side_effect=lambda key: Response.ok(
+                    "metadata" if key.endswith(QueryFlow.SUFFIX_METADATA) else ""
+                )
+            ),
+        ).start()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data_list",
+            AsyncMock(return_value=Response.ok(turns)),
+        ).start()
+        self.query_flow.set_history_settings(
+            HistorySettings(max_turns=len(turns), max_tokens=0)
+        )
+
+        async def stream_answer_chunks(*args, **kwargs):
+            yield self.answer
+
+        fn_llm_query = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(stream_answer_chunks())),
+        ).start()
+        self.query_flow.set_prompt_token_budget_by_db(self.db_metadata.id, 1500)
+
+        # Act
+        await self.query_flow.query(
+            dbId=self.db_metadata.id, session_id=self.session_id, question=self.question
+        )
+
+        # Assert
+        # The conversation messages are the packed turns, not the whole session
+        prompt = fn_llm_query.call_args.args[1]
+        self.assertIn("question 29?", prompt)
+        self.assertNotIn(first_question, prompt)
+        self.assertLessEqual(prompt.count("### User\n"), 20)
+
+    async def test_prefix_prompt_narrowed_schema(self) -> None:
+        # Arrange
+        self.query_flow.set_is_prefix_prompt_enabled(True)
+        db_id = self.faker.word()
+        patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+        patch.object(
+            self.vectoriser, "vectorise", return_value=Response.ok([0.1, 0.2, 0.3])
+        ).start()
+
+        def search_hits(table_id: str) -> Response[list[VectorisedRecord]]:
+            return Response.ok(
+                [
+                    VectorisedRecord(
+                        id=uuid4().hex,
+                        document=Table(
+                            id=table_id,
+                            name=table_id,
+                            description=self.faker.sentence(),
+                            fields=[],
+                        ).model_dump_json(),
+                        metadata=RecordMetadata(
+                            source_id=db_id, source=f"{db_id}/{table_id}"
+                        ),
+                        score=0.9,
+                    )
+                ]
+            )
+
+        patch.object(
+            self.vector_repo,
+            "search_by_vector",
+            side_effect=[search_hits("employee"), search_hits("department")],
+        ).start()
+
+        async def llm_call(*args, **kwargs):
+            yield self.answer
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(side_effect=lambda *args: Response.ok(llm_call())),
+        ).start()
+
+        # Act
+        for question in ["Who are the employees?", "Which departments are there?"]:
+            await self.query_flow.ask(QueryFlowRequest(db_id=db_id, question=question))
+
+        # Assert
+        # Schemas narrowed to each question come after the prefix, which is reused
+        prompts = [call.args[1] for call in fn_llm.call_args_list]
+        self.assertEqual(len(prompts), 2)
+        for prompt, table_id in zip(prompts, ["employee", "department"]):
+            request_section = prompt[prompt.index("### Request\n") :]
+            self.assertIn(table_id, request_section)
+        self.assertEqual(self.query_flow.prompt_prefix_stats["reused"], 1)
+
+    async def test_ask(self) -> None:
+        # Arrange
+        query_flow_request = QueryFlowRequest(
+            db_id=self.faker.word(),
+            question=self.faker.sentence(),
+        )
+
+        fn_get_session_data = patch.object(
+            self.session_data_manager,
+            "get_session_data",
+            AsyncMock(return_value=Response.ok("")),
+        ).start()
+
+        fn_get_db = patch.object(
+            self.metadata_storage,
+            "get_db",
+            AsyncMock(return_value=Response.ok(self.db_metadata)),
+        ).start()
+
+        fn_vectorise = patch.object(
+            self.vectoriser,
+            "vectorise",
+            return_value=Response.ok([0.1, 0.2, 0.3]),
+        ).start()
+
+        fn_search = patch.object(
+            self.vector_repo,
+            "search_by_vector",
+            return_value=Response.ok(
+                [
+                    VectorisedRecord(
+                        id=uuid4().hex,
+                        document=Table(
+                            id="employee",
+                            name="employee",
+                            description=self.faker.sentence(),
+                            fields=[],
+                        ).model_dump_json(),
+                        metadata=RecordMetadata(
+                            source_id=query_flow_request.db_id,
+                            source=f"{query_flow_request.db_id}/employee",
+                        ),
+                        score=0.9,
+                    ),
+                    VectorisedRecord(
+                        id=uuid4().hex,
+                        document=Field(
+                            id="employee_name",
+                            name="employee_name",
+                            description=self.faker.sentence(),
+                        ).model_dump_json(),
+                        metadata=RecordMetadata(
+                            source_id=query_flow_request.db_id,
+                            source=f"{query_flow_request.db_id}/employee/employee_name",
+                        ),
+                        score=0.8,
+                    ),
+                    VectorisedRecord(
+                        id=uuid4().hex,
+                        document=Field(
+                            id="department",
+                            name="department",
+                            description=self.faker.sentence(),
+                        ).model_dump_json(),
+                        metadata=RecordMetadata(
+                            source_id=query_flow_request.db_id,
+                            source=f"{query_flow_request.db_id}/employee/department",
+                        ),
+                        score=0.7,
+                    ),
+                ]
+            ),
+        ).start()
+
+        fn_get_external_tools = patch.object(
+            self.external_tool_repo,
+            "fetch_tools",
+            AsyncMock(return_value=[]),
+        ).start()
+
+        async def llm_call(*args, **kwargs):
+            for chunk in [
+                self.faker.sentence(),
+                self.faker.sentence() + "```sql\n" + self.faker.sentence(),
+                self.faker.sentence() + "\n```" + "\n```json\n" + self.faker.sentence(),
+                self.faker.sentence() + "\n```" + self.faker.sentence(),
+                self.faker.sentence(),
+            ]:
+                yield chunk
+
+        fn_llm = patch.object(
+            self.llm,
+            "generate_streamed_reply",
+            AsyncMock(return_value=Response.ok(llm_call())),
+        ).start()
+
+        # Act
+        ask_response = await self.query_flow.ask(query_flow_request)
+
+        # Assert
+        # Verifying the response itself
+        self.assertTrue(ask_response.is_success, ask_response.message)
+
+        stream = ask_response.payload
+        assert stream is not None
+
+        sql_chunk = await anext(stream)
+        self.assertIn("```sql", sql_chunk)
+
+        json_chunk = await anext(stream)
+        self.assertIn("```json", json_chunk)
+
+        async for chunk in stream:
+            self.assertNotIn("```sql", chunk)
+            self.assertNotIn("```json", chunk)
 
         # Question should be vectorised
         fn_vectorise.assert_called_once()
         self.assertEqual(fn_vectorise.call_args.args[1], query_flow_request.question)
 
         # Vector repo should be search for semantic match for the question
-        fn_search.assert_called_once_with([0.1, 0.2, 0.3], num_results=100)
+        fn_search.assert_called_once_with(
+            [0.1, 0.2, 0.3], num_results=RetrievalSettings().initial_top_k
+        )
@@ -0,0 +1,126 @@
+import sys
+
+sys.path.append("./src")
+
+from asyncio import Event, sleep
+from io import StringIO
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from prometheus_client import REGISTRY
+from sbilifeco.boundaries.query_flow import IQueryFlowListener, QueryFlowAnswer
+from sbilifeco.models.base import Response
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.listener_dispatcher import ListenerDispatcher
+
+
+class ListenerDispatcherTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.listener = AsyncMock(spec=IQueryFlowListener)
+        self.listeners: list[IQueryFlowListener] = [self.listener]
+        self.dispatcher = ListenerDispatcher(
+            self.listeners, FlowLogger(stream=StringIO())
+        )
+        return await super().asyncSetUp()
+
+    async def asyncTearDown(self) -> None:
+        await self.dispatcher.stop(drain_timeout_seconds=0.1)
+        return await super().asyncTearDown()
+
+    def make_answer(self) -> QueryFlowAnswer:
+        return QueryFlowAnswer(
+            session_id=uuid4().hex,
+            db_id=uuid4().hex,
+            question=uuid4().hex,
+            answer=uuid4().hex,
+        )
+
+    async def test_delivery_and_drain(self) -> None:
+        # Arrange
+        answers = [self.make_answer() for _ in range(5)]
+        failure = Response.fail("boom", 500)
+
+        # Act
+        for answer in answers:
+            await self.dispatcher.dispatch_answer(answer)
+        await self.dispatcher.dispatch_fail("s", "d", "q", failure)
+        await self.dispatcher.stop()
+
+        # Assert
+        # Everything queued before shutdown is delivered
+        delivered = [call.args[0] for call in self.listener.on_answer.call_args_list]
+        self.assertCountEqual(delivered, answers)
+        self.listener.on_fail.assert_called_once_with("s", "d", "q", failure)
+        self.assertEqual(self.dispatcher.stats["delivered"], 6)
+        dispatch_count = REGISTRY.get_sample_value(
+            "query_flow_stage_seconds_count",
+            {"stage": "listener_dispatch", "db_id": answers[0].db_id},
+        )
+        self.assertEqual(dispatch_count, 1)
+
+    async def test_slow_and_broken_listeners(self) -> None:
+        # Arrange
+        async def slow(*args) -> None:
+            await sleep(1)
+
+        slow_listener = AsyncMock(spec=IQueryFlowListener)
+        slow_listener.on_answer.side_effect = slow
+        broken_listener = AsyncMock(spec=IQueryFlowListener)
+        broken_listener.on_answer.side_effect = RuntimeError("sink is down")
+        self.listeners[:0] = [slow_listener, broken_listener]
+        self.dispatcher.set_listener_timeout(0.05)
+
+        # Act
+        await self.dispatcher.dispatch_answer(self.make_answer())
+        await self.dispatcher.drain()
+
+        # Assert
+        # A slow or failing sink does not stop the others from being notified
+        self.listener.on_answer.assert_called_once()
+        stats = self.dispatcher.stats
+        self.assertEqual(stats["timed_out"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["delivered"], 1)
+
+    async def test_overflow_policies(self) -> None:
+        for policy, expected_index in [
+            (ListenerDispatcher.POLICY_DROP_NEWEST, 0),
+            (ListenerDispatcher.POLICY_DROP_OLDEST, 1),
+        ]:
+            with self.subTest(policy=policy):
+                # Arrange
+                self.listener.reset_mock()
+                release = Event()
+                blocking_listener = AsyncMock(spec=IQueryFlowListener)
+
+                async def blocked(*args) -> None:
+                    await release.wait()
+
+                blocking_listener.on_answer.side_effect = blocked
+                self.listeners[:] = [blocking_listener, self.listener]
+                self.dispatcher.set_num_workers(1).set_max_queue_size(
+                    1
+                ).set_overflow_policy(policy)
+                answers = [self.make_answer() for _ in range(3)]
+
+                # Act
+                # The first event occupies the worker, the other two compete for one slot
+                await self.dispatcher.dispatch_answer(answers[0])
+                await sleep(0)
+                await self.dispatcher.dispatch_answer(answers[1])
+                await self.dispatcher.dispatch_answer(answers[2])
+                release.set()
+                await self.dispatcher.stop()
+
+                # Assert
+                delivered = [
+                    call.args[0] for call in self.listener.on_answer.call_args_list
+                ]
+                self.assertEqual(delivered, [answers[0], answers[1 + expected_index]])
+
+        self.assertEqual(self.dispatcher.stats["dropped"], 2)
+
+    async def test_unknown_policy(self) -> None:
+        with self.assertRaises(ValueError):
+            self.dispatcher.set_overflow_policy("discard_everything")
@@ -0,0 +1,79 @@
+import sys
+
+sys.path.append("./src")
+
+from unittest import TestCase
+
+from sbilifeco.user_flows.conversation_history import ConversationTurn
+from sbilifeco.user_flows.prompt_layout import PromptLayout
+from sbilifeco.user_flows.prompt_template_cache import CompiledPrompt
+
+
+class PromptLayoutTest(TestCase):
+    def setUp(self) -> None:
+        self.layout = PromptLayout()
+        self.template = CompiledPrompt(
+            "Today is {today}.\nSchema:\n{schema}\nHistory:\n{history}\nQuestion: {question}\n"
+        )
+
+    def build(self, today: str, question: str, turns: list[ConversationTurn]):
+        return self.layout.build(
+            "db",
+            self.template,
+            {
+                "today": today,
+                "schema": "users(id, name)",
+                "history": "None",
+                "question": question,
+            },
+            {"today": "Today"},
+            "history",
+            "question",
+            turns,
+        )
+
+    def test_dynamic_parts_follow_the_prefix(self) -> None:
+        # Arrange
+        turns = [ConversationTurn(question="How many users?", answer="Ten")]
+
+        # Act
+        prompt = self.build("18 October 2026", "And today?", turns)
+
+        # Assert
+        self.assertEqual(
+            prompt.prefix,
+            "Today is [Today].\nSchema:\nusers(id, name)\n"
+            f"History:\n{PromptLayout.HISTORY_REFERENCE}\n"
+            f"Question: {PromptLayout.QUESTION_REFERENCE}\n\n",
+        )
+        self.assertEqual(
+            [(message.role, message.content) for message in prompt.messages],
+            [
+                ("Request", "Today: 18 October 2026"),
+                ("User", "How many users?"),
+                ("Assistant", "Ten"),
+                ("User", "And today?"),
+            ],
+        )
+        self.assertTrue(
+            prompt.render().endswith("### User\nAnd today?\n\n### Assistant\n")
+        )
+
+    def test_next_turn_extends_the_previous_prompt(self) -> None:
+        # Arrange
+        first = self.build("18 October 2026", "How many users?", [])
+
+        # Act
+        second = self.build(
+            "18 October 2026",
+            "And today?",
+            [ConversationTurn(question="How many users?", answer="Ten")],
+        )
+        next_day = self.build("19 October 2026", "How many users?", [])
+
+        # Assert
+        # Only the date changed, so the prefix is still the same
+        self.assertTrue(second.render().startswith(first.render()))
+        self.assertEqual(first.prefix_hash, second.prefix_hash)
+        self.assertEqual(first.prefix_hash, next_day.prefix_hash)
+        self.assertEqual(self.layout.stats, {"prefixes": 1, "reused": 2, "changed": 1})
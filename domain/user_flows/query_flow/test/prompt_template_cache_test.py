@@ -0,0 +1,41 @@
+import sys
+
+sys.path.append("./src")
+
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.prompt_template_cache import PromptTemplateCache
+
+
+class PromptTemplateCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.stream = StringIO()
+        self.logger = FlowLogger(stream=self.stream).set_level("debug")
+        self.logger.start()
+        self.cache = PromptTemplateCache(self.logger)
+
+    def tearDown(self) -> None:
+        self.logger.stop()
+
+    def test_loading_is_logged_at_debug(self) -> None:
+        # Arrange
+        stdout = StringIO()
+
+        # Act
+        with redirect_stdout(stdout):
+            first = self.cache.get("generic", "Answer {question}")
+            second = self.cache.get("generic", "Answer {question}")
+        self.logger.stop()
+
+        # Assert
+        # Loads go through the flow logger rather than straight to stdout
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.stats["hits"], 1)
+        self.assertEqual(stdout.getvalue(), "")
+        output = self.stream.getvalue()
+        self.assertIn("DEBUG", output)
+        self.assertIn("Loading and compiling prompt template for key 'generic'", output)
+        self.assertIn("Prompt template is a raw string", output)
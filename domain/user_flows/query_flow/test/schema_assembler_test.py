@@ -0,0 +1,94 @@
+import sys
+
+sys.path.append("./src")
+
+from unittest import TestCase
+from uuid import uuid4
+
+from sbilifeco.boundaries.metadata_storage import DB, Table, Field
+from sbilifeco.models.vectorisation import VectorisedRecord, RecordMetadata
+from sbilifeco.user_flows.schema_assembler import SchemaAssembler
+
+
+class SchemaAssemblerTest(TestCase):
+    def setUp(self) -> None:
+        self.db_id = uuid4().hex
+        self.assembler = SchemaAssembler()
+
+    def make_record(self, source: str, document: Table | Field) -> VectorisedRecord:
+        return VectorisedRecord(
+            id=uuid4().hex,
+            document=document.model_dump_json(),
+            metadata=RecordMetadata(
+                source_id=self.db_id, source=f"{self.db_id}/{source}"
+            ),
+            score=0.9,
+        )
+
+    def test_assemble(self) -> None:
+        # Arrange
+        employee = Table(id="emp", name="employee", description="Staff", fields=[])
+        name = Field(id="name", name="employee_name")
+        dept = Field(id="dept", name="department")
+        records = [
+            # A field may rank above its own table
+            self.make_record("emp/name", name),
+            self.make_record("emp", employee),
+            self.make_record("emp/dept", dept),
+            self.make_record("emp/name", name),
+            self.make_record("emp", employee),
+            self.make_record("branch/code", Field(id="code", name="branch_code")),
+        ]
+        db = DB(id=self.db_id, name=self.db_id, tables=[])
+
+        # Act
+        self.assembler.assemble(db, records)
+
+        # Assert
+        # One entry per table, one per field, and the table record fills in the details
+        assert db.tables is not None
+        self.assertEqual([table.id for table in db.tables], ["emp", "branch"])
+        emp, branch = db.tables
+        self.assertEqual(emp.name, "employee")
+        self.assertEqual(emp.description, "Staff")
+        self.assertEqual([field.id for field in emp.fields or []], ["name", "dept"])
+        self.assertEqual(branch.name, "branch")
+        self.assertEqual([field.id for field in branch.fields or []], ["code"])
+
+    def test_decoded_documents_are_cached(self) -> None:
+        # Arrange
+        employee = Table(id="emp", name="employee", fields=[])
+        records = [
+            self.make_record("emp", employee),
+            self.make_record("emp/name", Field(id="name", name="employee_name")),
+        ]
+
+        # Act
+        first_db = DB(id=self.db_id, name=self.db_id, tables=[])
+        self.assembler.assemble(first_db, records)
+        second_db = DB(id=self.db_id, name=self.db_id, tables=[])
+        self.assembler.assemble(second_db, records)
+
+        # Assert
+        # The second question decodes nothing, and does not see the first one's tables
+        self.assertEqual(self.assembler.stats["hits"], 2)
+        assert first_db.tables is not None and second_db.tables is not None
+        self.assertIsNot(first_db.tables[0], second_db.tables[0])
+        self.assertEqual(len(second_db.tables[0].fields or []), 1)
+
+    def test_cached_fields_are_not_shared(self) -> None:
+        # Arrange
+        records = [self.make_record("emp/name", Field(id="name", name="employee_name"))]
+        first_db = DB(id=self.db_id, name=self.db_id, tables=[])
+        self.assembler.assemble(first_db, records)
+        assert first_db.tables is not None and first_db.tables[0].fields is not None
+        first_db.tables[0].fields[0].description = "Changed for the first question"
+
+        # Act
+        second_db = DB(id=self.db_id, name=self.db_id, tables=[])
+        self.assembler.assemble(second_db, records)
+
+        # Assert
+        assert second_db.tables is not None and second_db.tables[0].fields is not None
+        self.assertEqual(self.assembler.stats["hits"], 1)
+        self.assertEqual(second_db.tables[0].fields[0].description, "")
@@ -0,0 +1,137 @@
+import sys
+
+sys.path.append("./src")
+
+from asyncio import Event, gather, sleep
+from collections.abc import AsyncIterator
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from sbilifeco.models.base import Response
+from sbilifeco.user_flows.single_flight import SharedStream, SingleFlight
+
+
+class SingleFlightTest(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.single_flight = SingleFlight()
+        self.release = Event()
+
+    async def stream_chunks(self, chunks: list[str]):
+        for index, chunk in enumerate(chunks):
+            if index == 1:
+                await self.release.wait()
+            yield chunk
+
+    async def read(self, prompt: str, start: AsyncMock) -> str:
+        response = await self.single_flight.stream(prompt, start)
+        assert response.payload is not None
+        return "".join([chunk async for chunk in response.payload])
+
+    async def read_first(self, prompt: str, start: AsyncMock) -> str:
+        response = await self.single_flight.stream(prompt, start)
+        assert response.payload is not None
+        reader = response.payload
+        chunk = await anext(reader)
+        await reader.aclose()  # type: ignore[attr-defined]
+        return chunk
+
+    async def test_identical_prompts_share_one_stream(self) -> None:
+        # Arrange
+        chunks = ["select ", "* from ", "users"]
+        start = AsyncMock(return_value=Response.ok(self.stream_chunks(chunks)))
+
+        # Act
+        first = self.read("prompt", start)
+        second = self.read("prompt", start)
+
+        async def late_reader() -> str:
+            # Joins after the first chunk was produced, so that one is replayed
+            await sleep(0.01)
+            return await self.read("prompt", start)
+
+        async def release() -> None:
+            await sleep(0.02)
+            self.release.set()
+
+        answers = await gather(first, second, late_reader(), release())
+
+        # Assert
+        start.assert_called_once()
+        self.assertEqual(answers[:3], ["".join(chunks)] * 3)
+        self.assertEqual(self.single_flight.stats["coalesced"], 2)
+
+        await sleep(0)
+        self.assertEqual(self.single_flight.stats["in_flight"], 0)
+
+    async def test_different_prompts_and_failures_are_not_shared(self) -> None:
+        # Arrange
+        self.release.set()
+        start = AsyncMock(
+            side_effect=[
+                Response.fail("LLM is down", 503),
+                Response.ok(self.stream_chunks(["a", "b"])),
+                Response.ok(self.stream_chunks(["c", "d"])),
+            ]
+        )
+
+        # Act
+        failed = await self.single_flight.stream("prompt", start)
+        answers = await gather(self.read("prompt", start), self.read("other", start))
+
+        # Assert
+        # A failed start is forgotten, so the next caller tries again
+        self.assertFalse(failed.is_success)
+        self.assertEqual(failed.code, 503)
+        self.assertEqual(sorted(answers), ["ab", "cd"])
+        self.assertEqual(start.call_count, 3)
+        self.assertEqual(self.single_flight.stats["coalesced"], 0)
+
+    async def test_stream_stops_when_every_reader_leaves(self) -> None:
+        # Arrange
+        produced: list[str] = []
+        is_closed = Event()
+
+        async def endless_chunks():
+            try:
+                while True:
+                    produced.append("chunk")
+                    yield "chunk"
+                    await sleep(0.01)
+            finally:
+                is_closed.set()
+
+        start = AsyncMock(side_effect=lambda: Response.ok(endless_chunks()))
+
+        # Act
+        response = await self.single_flight.stream("prompt", start)
+        assert response.payload is not None
+        reader: AsyncIterator[str] = response.payload
+        await anext(reader)
+        await reader.aclose()  # type: ignore[attr-defined]
+        await sleep(0.05)
+        answer = await self.read_first("prompt", start)
+        await sleep(0.01)
+
+        # Assert
+        # The source was closed rather than read to the end, and the next caller starts afresh
+        self.assertTrue(is_closed.is_set())
+        self.assertLess(len(produced), 4)
+        self.assertEqual(answer, "chunk")
+        self.assertEqual(start.call_count, 2)
+        self.assertEqual(self.single_flight.stats["in_flight"], 0)
+
+    async def test_cancelled_stream_is_not_a_complete_answer(self) -> None:
+        # Arrange
+        stream = SharedStream(self.stream_chunks(["select ", "* from ", "users"]))
+        reader = stream.subscribe()
+        assert reader is not None
+        chunks = [await anext(reader)]
+
+        # Act
+        stream._pump_task.cancel()
+        with self.assertRaises(RuntimeError):
+            async for chunk in reader:
+                chunks.append(chunk)
+
+        # Assert
+        self.assertEqual(chunks, ["select "])
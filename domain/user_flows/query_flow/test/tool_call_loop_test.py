@@ -0,0 +1,139 @@
+import sys
+
+sys.path.append("./src")
+
+from asyncio import sleep
+from json import dumps
+from time import perf_counter
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from sbilifeco.boundaries.tool_support import IExternalToolRepo
+from sbilifeco.models.base import Response
+from sbilifeco.user_flows.flow_logger import FlowLogger
+from sbilifeco.user_flows.tool_call_loop import (
+    ToolCall,
+    ToolCallLoop,
+    ToolLoopOutcome,
+    ToolLoopSettings,
+)
+
+
+def tool_call(name: str, params: dict) -> str:
+    return f"- Tool name: {name}\n- Tool input: {dumps(params)}\n"
+
+
+class ToolCallLoopTest(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.loop = ToolCallLoop(FlowLogger())
+        self.tool_repo = AsyncMock(spec=IExternalToolRepo)
+
+    async def stream(self, text: str):
+        yield text
+
+    async def follow(self, answer: str, replies: list[str]) -> ToolLoopOutcome:
+        self.generate = AsyncMock(
+            side_effect=[Response.ok(self.stream(reply)) for reply in replies]
+        )
+        outcome = ToolLoopOutcome(answer=answer)
+        self.chunks = [
+            chunk
+            async for chunk in self.loop.follow(
+                "db", self.tool_repo, self.generate, "prompt\n\n", outcome
+            )
+        ]
+        return outcome
+
+    def test_extract_tool_calls(self) -> None:
+        # Arrange
+        answer = (
+            "Two queries are needed.\n"
+            + tool_call("run_sql", {"query": "select 1", "limit": 5})
+            + "And then\n"
+            + tool_call("run_sql", {"limit": 5, "query": "select 1"})
+            + tool_call("run_sql", {"query": "select 2"})
+            + "- Tool name: broken\n- Tool input: {not json}\n"
+        )
+
+        # Act
+        tool_calls = self.loop.extract_tool_calls(answer)
+
+        # Assert
+        # Duplicates are folded and unreadable calls skipped
+        self.assertEqual(
+            tool_calls,
+            [
+                ToolCall(name="run_sql", params={"query": "select 1", "limit": 5}),
+                ToolCall(name="run_sql", params={"query": "select 2"}),
+            ],
+        )
+
+    async def test_calls_run_concurrently_and_are_cached(self) -> None:
+        # Arrange
+        async def invoke_tool(tool_name: str, **kwargs) -> dict:
+            await sleep(0.05)
+            return {"rows": [kwargs["query"]]}
+
+        self.tool_repo.invoke_tool.side_effect = invoke_tool
+        answer = tool_call("run_sql", {"query": "select 1"}) + tool_call(
+            "run_sql", {"query": "select 2"}
+        )
+
+        # Act
+        time_before = perf_counter()
+        outcome = await self.follow(answer, ["The answer is 3"])
+        time_taken = perf_counter() - time_before
+
+        # Assert
+        self.assertLess(time_taken, 0.09)
+        self.assertEqual(outcome.answer, "The answer is 3")
+        self.assertTrue(outcome.is_tool_used)
+        self.assertEqual(self.chunks, ["The answer is 3"])
+
+        follow_up_prompt = self.generate.call_args.args[0]
+        self.assertIn(answer, follow_up_prompt)
+        self.assertIn('{"rows": ["select 1"]}', follow_up_prompt)
+        self.assertIn('{"rows": ["select 2"]}', follow_up_prompt)
+
+        # Act
+        await self.follow(answer, ["The answer is still 3"])
+
+        # Assert
+        self.assertEqual(self.tool_repo.invoke_tool.call_count, 2)
+        self.assertEqual(self.loop.stats["hits"], 2)
+
+    async def test_iteration_budget_and_failures(self) -> None:
+        # Arrange
+        self.loop.set_settings(ToolLoopSettings(max_iterations=2))
+        self.tool_repo.invoke_tool.side_effect = RuntimeError("database is down")
+        answers = [tool_call("run_sql", {"query": f"select {i}"}) for i in range(4)]
+
+        # Act
+        outcome = await self.follow(answers[0], answers[1:])
+
+        # Assert
+        # Failed calls are reported to the LLM, and the loop stops at its budget
+        self.assertEqual(outcome.iterations, 2)
+        self.assertEqual(outcome.answer, answers[2])
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertIn("database is down", self.generate.call_args.args[0])
+        self.assertEqual(self.loop.stats["size"], 0)
+
+    async def test_empty_and_error_results_are_not_cached(self) -> None:
+        # Arrange
+        self.tool_repo.invoke_tool.side_effect = [
+            {},
+            {"error": "database is down"},
+            {"rows": [1]},
+        ]
+        answer = tool_call("run_sql", {"query": "select 1"})
+
+        # Act
+        for _ in range(4):
+            await self.follow(answer, ["The answer is 1"])
+
+        # Assert
+        # The repo is asked again until it gives a real result, which is then reused
+        self.assertEqual(self.tool_repo.invoke_tool.call_count, 3)
+        self.assertEqual(self.loop.stats["size"], 1)
+        self.assertEqual(self.loop.stats["hits"], 1)
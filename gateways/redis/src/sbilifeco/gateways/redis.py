@@ -56,6 +56,31 @@ class Redis(ISessionDataManager, IPopulationCounter):
         except Exception as e:
             return Response.error(e)
 
+    async def append_session_data(
+        self, session_id: str, data: str, max_items: int = 0
+    ) -> Response[None]:
+        try:
+            pipeline = self.conn.pipeline()
+            pipeline.rpush(session_id, data)
+            if max_items > 0:
+                pipeline.ltrim(session_id, -max_items, -1)
+            pipeline.execute()
+            return Response.ok(None)
+        except Exception as e:
+            return Response.error(e)
+
+    async def get_session_data_list(
+        self, session_id: str, last_n: int = 0
+    ) -> Response[list[str]]:
+        try:
+            values = cast(
+                list[bytes],
+                self.conn.lrange(session_id, -last_n if last_n > 0 else 0, -1),
+            )
+            return Response.ok([value.decode("utf-8") for value in values])
+        except Exception as e:
+            return Response.error(e)
+
     async def delete_session_data(self, session_id: str) -> Response[None]:
         try:
             self.conn.delete(session_id)
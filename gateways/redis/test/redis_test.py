@@ -106,6 +106,27 @@ class RedisTest(IsolatedAsyncioTestCase):
         self.assertEqual(fetch_response1.payload, "")
         self.assertEqual(fetch_response2.payload, "")
 
+    async def test_append_with_trim(self) -> None:
+        # Arrange
+        key = "conversation"
+        values = [self.faker.sentence() for _ in range(5)]
+
+        # Act
+        for value in values:
+            append_response = await self.service.append_session_data(key, value, 3)
+            self.assertTrue(append_response.is_success, append_response.message)
+
+        # Assert
+        fetch_response = await self.service.get_session_data_list(key)
+        self.assertTrue(fetch_response.is_success, fetch_response.message)
+        self.assertEqual(fetch_response.payload, values[-3:])
+
+        fetch_response = await self.service.get_session_data_list(key, 2)
+        self.assertEqual(fetch_response.payload, values[-2:])
+
+        fetch_response = await self.service.get_session_data_list("no_such_key")
+        self.assertEqual(fetch_response.payload, [])
+
     async def test_count_by_named_division(self) -> None:
         # Arrange
         key = self.faker.word()